@@ -0,0 +1,251 @@
+# analytics.py
+# Per-class attendance analytics: student x session matrix, rates, streaks, at-risk list and weekly rates.
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+AT_RISK_RATE = 0.75
+AT_RISK_ABSENCES = 3
+
+
+def attendance_matrix(student_ids: Sequence[str], session_ids: Sequence[str],
+                      mark_students: Sequence[str], mark_sessions: Sequence[str]) -> np.ndarray:
+    """Boolean students x sessions matrix; marks for unknown students or sessions are dropped."""
+    matrix = np.zeros((len(student_ids), len(session_ids)), dtype=bool)
+    if len(mark_students):
+        rows = pd.Index(student_ids).get_indexer(mark_students)
+        cols = pd.Index(session_ids).get_indexer(mark_sessions)
+        known = (rows >= 0) & (cols >= 0)
+        matrix[rows[known], cols[known]] = True
+    return matrix
+
+
+def runs(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(longest, trailing) run of True per row, for all rows at once."""
+    n_rows, n_cols = matrix.shape
+    if n_cols == 0:
+        zeros = np.zeros(n_rows, dtype=int)
+        return zeros, zeros
+    position = np.arange(1, n_cols + 1)
+    # 1-based column of the latest False at or before each column (0 if none yet)
+    last_break = np.maximum.accumulate(np.where(matrix, 0, position), axis=1)
+    lengths = np.where(matrix, position - last_break, 0)
+    return lengths.max(axis=1), lengths[:, -1]
+
+
+def compute_class_analytics(
+    class_id: str,
+    student_ids: List[str],
+    student_names: Dict[str, str],
+    sessions: List[Tuple[str, datetime]],
+    mark_students: List[str],
+    mark_sessions: List[str],
+    at_risk_rate: float = AT_RISK_RATE,
+    at_risk_absences: int = AT_RISK_ABSENCES,
+) -> dict:
+    """
+    All metrics from one boolean matrix (rows: students, columns: sessions in
+    chronological order); every per-student / per-session figure is a
+    vectorized reduction over it.
+    """
+    started = time.perf_counter()
+    sessions = sorted(sessions, key=lambda s: s[1])
+    session_ids = [s[0] for s in sessions]
+    session_starts = pd.to_datetime([s[1] for s in sessions], utc=True)
+    m = attendance_matrix(student_ids, session_ids, mark_students, mark_sessions)
+    n_students, n_sessions = m.shape
+
+    attended = m.sum(axis=1)
+    present = m.sum(axis=0)
+    student_rate = attended / n_sessions if n_sessions else np.zeros(n_students)
+    session_rate = present / n_students if n_students else np.zeros(n_sessions)
+    longest, current = runs(m)
+    _, absence_streak = runs(~m)
+    has_attended = attended > 0
+    last_col = np.where(has_attended, n_sessions - 1 - np.argmax(m[:, ::-1], axis=1), -1) if n_sessions \
+        else np.full(n_students, -1)
+
+    last_attended = pd.Series(pd.NaT, index=range(n_students), dtype="datetime64[ns, UTC]")
+    if n_sessions:
+        last_attended[has_attended] = session_starts[last_col[has_attended]]
+
+    students = pd.DataFrame({
+        "student_id": student_ids,
+        "name": [student_names.get(s) for s in student_ids],
+        "attended": attended,
+        "missed": n_sessions - attended,
+        "rate": np.round(student_rate, 4),
+        "current_streak": current,
+        "longest_streak": longest,
+        "absence_streak": absence_streak,
+        "last_attended_at": last_attended,
+    })
+
+    risk_low_rate = (students["rate"] < at_risk_rate) & (n_sessions > 0)
+    risk_absent = students["absence_streak"] >= at_risk_absences
+    at_risk = students[risk_low_rate | risk_absent].assign(
+        low_rate=risk_low_rate[risk_low_rate | risk_absent],
+        consecutive_absences=risk_absent[risk_low_rate | risk_absent],
+    ).sort_values(["rate", "absence_streak"], ascending=[True, False])
+
+    per_session = pd.DataFrame({
+        "session_id": session_ids,
+        "started_at": session_starts,
+        "present": present,
+        "rate": np.round(session_rate, 4),
+    })
+    weeks = per_session.assign(
+        week_start=(per_session["started_at"] - pd.to_timedelta(per_session["started_at"].dt.weekday, unit="D"))
+        .dt.normalize()
+    ).groupby("week_start", sort=True).agg(sessions=("session_id", "size"), present=("present", "sum"))
+    weeks["rate"] = np.round(weeks["present"] / (weeks["sessions"] * n_students), 4) if n_students else 0.0
+    weeks = weeks.reset_index()
+
+    def records(df: pd.DataFrame) -> List[dict]:
+        out = df.astype(object).where(df.notna(), None).to_dict("records")
+        for row in out:
+            for k, v in row.items():
+                if isinstance(v, pd.Timestamp):
+                    row[k] = v.to_pydatetime()
+                elif isinstance(v, np.generic):
+                    row[k] = v.item()
+        return out
+
+    return {
+        "class_id": class_id,
+        "students": n_students,
+        "sessions": n_sessions,
+        "total_marks": int(attended.sum()),
+        "overall_rate": round(float(m.mean()), 4) if m.size else 0.0,
+        "thresholds": {"at_risk_rate": at_risk_rate, "at_risk_absences": at_risk_absences},
+        "student_metrics": records(students),
+        "at_risk": records(at_risk[["student_id", "name", "rate", "absence_streak", "low_rate",
+                                    "consecutive_absences", "last_attended_at"]]),
+        "session_rates": records(per_session),
+        "weekly_rates": records(weeks),
+        "matrix": {
+            "student_ids": list(student_ids),
+            "session_ids": session_ids,
+            "rows": ["".join("1" if v else "0" for v in row) for row in m.tolist()],
+        },
+        "computed_at": datetime.now(timezone.utc),
+        "compute_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+def _utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+async def class_fingerprint(db, cls: dict) -> tuple:
+    """
+    Changes whenever a mark, a session or an enrollment is added (indexed
+    reads only). Marks take their timestamp before the IPFS / chain work and
+    are inserted by several workers, so one often lands behind a newer
+    timestamp and leaves the newest mark unchanged; the mark count (counted
+    on the class_id index) still moves.
+    """
+    mark_count = await db.attendance.count_documents({"class_id": cls["id"]})
+    last_mark = await db.attendance.find({"class_id": cls["id"]}, {"_id": 0, "id": 1}) \
+        .sort([("timestamp", -1), ("id", -1)]).limit(1).to_list(1)
+    last_session = await db.qr_codes.find({"class_id": cls["id"]}, {"_id": 0, "id": 1}) \
+        .sort("created_at", -1).limit(1).to_list(1)
+    return (
+        mark_count,
+        last_mark[0]["id"] if last_mark else None,
+        last_session[0]["id"] if last_session else None,
+        len(cls.get("students_enrolled", [])),
+    )
+
+
+async def load_and_compute(db, cls: dict, batch_size: int = 5000, **thresholds) -> dict:
+    """
+    Pull the class's marks and live sessions with projected cursors and run
+    the computation in a worker thread. qr_codes documents are removed by
+    their TTL index once they expire, so past sessions are recovered from
+    the marks themselves (first mark = session start); only expired
+    sessions nobody attended are missing.
+    """
+    class_id = cls["id"]
+    marks = await db.attendance.find(
+        {"class_id": class_id},
+        {"_id": 0, "student_id": 1, "student_name": 1, "qr_code_id": 1, "timestamp": 1},
+    ).batch_size(batch_size).to_list(None)
+    live = await db.qr_codes.find({"class_id": class_id}, {"_id": 0, "id": 1, "created_at": 1}).to_list(None)
+
+    sessions: Dict[str, datetime] = {q["id"]: _utc(q["created_at"]) for q in live if q.get("created_at")}
+    names: Dict[str, str] = {}
+    for mark in marks:
+        ts = _utc(mark["timestamp"])
+        sid = mark["qr_code_id"]
+        if sid not in sessions or ts < sessions[sid]:
+            sessions[sid] = ts
+        if mark.get("student_name"):
+            names[mark["student_id"]] = mark["student_name"]
+
+    student_ids = list(dict.fromkeys(list(cls.get("students_enrolled", [])) + [m["student_id"] for m in marks]))
+    missing = [s for s in student_ids if s not in names]
+    if missing:
+        async for user in db.users.find({"id": {"$in": missing}}, {"_id": 0, "id": 1, "name": 1}):
+            names[user["id"]] = user.get("name")
+
+    return await asyncio.to_thread(
+        compute_class_analytics,
+        class_id,
+        student_ids,
+        names,
+        list(sessions.items()),
+        [m["student_id"] for m in marks],
+        [m["qr_code_id"] for m in marks],
+        **thresholds,
+    )
+
+
+class AnalyticsCache:
+    """
+    Last computed analytics per class, bounded LRU. An entry is served only
+    while the class fingerprint is unchanged, so marks written by any worker
+    invalidate it; invalidate() drops it at once in the marking worker.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[tuple, dict]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, class_id: str, fingerprint: tuple) -> Optional[dict]:
+        entry = self._entries.get(class_id)
+        if entry is None or entry[0] != fingerprint:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(class_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, class_id: str, fingerprint: tuple, result: dict):
+        self._entries[class_id] = (fingerprint, result)
+        self._entries.move_to_end(class_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, class_id: str):
+        if self._entries.pop(class_id, None) is not None:
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "invalidations": self.invalidations,
+        }
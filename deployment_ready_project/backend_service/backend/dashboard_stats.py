@@ -0,0 +1,183 @@
+# dashboard_stats.py
+# Materialized per-student / per-teacher dashboard counters, kept current with atomic updates.
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Fields of an attendance record copied into the "recent" lists; all of them
+# are fixed once the record is written, so the copies never go stale.
+RECENT_FIELDS = ("id", "student_id", "student_name", "class_id", "class_name", "qr_code_id", "timestamp")
+
+
+class DashboardStats:
+    """
+    One document per student in `student_stats` and per teacher in
+    `teacher_stats`, keyed by user id, so a dashboard is one _id lookup:
+
+        student: total_attendance, class_ids, classes_attended, recent
+        teacher: total_classes, total_attendance, student_ids, recent
+
+    Writers only use $inc / $addToSet / $push-with-$slice upserts, which are
+    atomic and safe to run concurrently from any worker. Counts of distinct
+    things are sets, sized on read with a $size projection instead of being
+    shipped to the application.
+
+    A failed counter update is logged, never raised: the attendance or
+    enrollment itself has already been written, and rebuild() recomputes
+    everything from the source collections.
+    """
+
+    def __init__(self, db, recent: int = 5):
+        self.db = db
+        self.recent = recent
+
+    @property
+    def students(self):
+        return self.db.student_stats
+
+    @property
+    def teachers(self):
+        return self.db.teacher_stats
+
+    @staticmethod
+    def _now():
+        return datetime.now(timezone.utc)
+
+    def _push_recent(self, summary: dict) -> dict:
+        return {"recent": {"$each": [summary], "$sort": {"timestamp": -1}, "$slice": self.recent}}
+
+    async def _update(self, collection, key: str, update: dict):
+        update.setdefault("$set", {})["updated_at"] = self._now()
+        try:
+            await collection.update_one({"_id": key}, update, upsert=True)
+        except Exception:
+            logger.exception("Could not update %s for %s; run the dashboard stats rebuild", collection.name, key)
+
+    async def class_created(self, teacher_id: str, class_id: str):
+        await self._update(self.teachers, teacher_id, {"$inc": {"total_classes": 1}})
+
+    async def student_enrolled(self, student_id: str, class_id: str, teacher_id: Optional[str]):
+        await self._update(self.students, student_id, {"$addToSet": {"class_ids": class_id}})
+        if teacher_id:
+            await self._update(self.teachers, teacher_id, {"$addToSet": {"student_ids": student_id}})
+
+    async def attendance_marked(self, record: dict, teacher_id: Optional[str]):
+        summary = {f: record.get(f) for f in RECENT_FIELDS}
+        await self._update(self.students, record["student_id"], {
+            "$inc": {"total_attendance": 1},
+            "$addToSet": {"classes_attended": record["class_id"]},
+            "$push": self._push_recent(summary),
+        })
+        if teacher_id:
+            await self._update(self.teachers, teacher_id, {
+                "$inc": {"total_attendance": 1},
+                "$push": self._push_recent(summary),
+            })
+
+    async def student(self, student_id: str) -> dict:
+        doc = await self.students.find_one({"_id": student_id}, {
+            "_id": 0,
+            "total_attendance": 1,
+            "recent": 1,
+            "enrolled_classes": {"$size": {"$ifNull": ["$class_ids", []]}},
+            "classes_attended": {"$size": {"$ifNull": ["$classes_attended", []]}},
+        }) or {}
+        return {
+            "total_attendance": doc.get("total_attendance", 0),
+            "enrolled_classes": doc.get("enrolled_classes", 0),
+            "classes_attended": doc.get("classes_attended", 0),
+            "recent": doc.get("recent", []),
+        }
+
+    async def teacher(self, teacher_id: str) -> dict:
+        doc = await self.teachers.find_one({"_id": teacher_id}, {
+            "_id": 0,
+            "total_classes": 1,
+            "total_attendance": 1,
+            "recent": 1,
+            "total_students": {"$size": {"$ifNull": ["$student_ids", []]}},
+        }) or {}
+        return {
+            "total_classes": doc.get("total_classes", 0),
+            "total_students": doc.get("total_students", 0),
+            "total_attendance": doc.get("total_attendance", 0),
+            "recent": doc.get("recent", []),
+        }
+
+    async def rebuild(self) -> dict:
+        """
+        Recompute both collections from classes and attendance into staging
+        collections and swap them in with a rename, so readers never see a
+        half-built state. Updates made while it runs land in the collections
+        being replaced; run it when marking is quiet.
+        """
+        now = self._now()
+        recent_summary = {f: f"${f}" for f in RECENT_FIELDS}
+        staging_students = f"{self.students.name}_rebuild"
+        staging_teachers = f"{self.teachers.name}_rebuild"
+
+        # students: enrollments, then attendance merged in
+        await self.db.classes.aggregate([
+            {"$unwind": "$students_enrolled"},
+            {"$group": {"_id": "$students_enrolled", "class_ids": {"$addToSet": "$id"}}},
+            {"$set": {"total_attendance": 0, "classes_attended": [], "recent": [], "updated_at": now}},
+            {"$out": staging_students},
+        ], allowDiskUse=True).to_list(None)
+        await self.db.attendance.aggregate([
+            {"$sort": {"timestamp": -1}},
+            {"$group": {
+                "_id": "$student_id",
+                "total_attendance": {"$sum": 1},
+                "classes_attended": {"$addToSet": "$class_id"},
+                "recent": {"$push": recent_summary},
+            }},
+            {"$set": {"recent": {"$slice": ["$recent", self.recent]}, "updated_at": now}},
+            {"$merge": {"into": staging_students, "whenMatched": "merge", "whenNotMatched": "insert"}},
+        ], allowDiskUse=True).to_list(None)
+
+        # teachers: classes and their enrolled students, then attendance by class owner
+        await self.db.classes.aggregate([
+            {"$group": {
+                "_id": "$teacher_id",
+                "total_classes": {"$sum": 1},
+                "enrolled": {"$push": {"$ifNull": ["$students_enrolled", []]}},
+            }},
+            {"$set": {
+                "student_ids": {"$reduce": {"input": "$enrolled", "initialValue": [],
+                                            "in": {"$setUnion": ["$$value", "$$this"]}}},
+                "total_attendance": 0,
+                "recent": [],
+                "updated_at": now,
+            }},
+            {"$unset": "enrolled"},
+            {"$out": staging_teachers},
+        ], allowDiskUse=True).to_list(None)
+        await self.db.attendance.aggregate([
+            {"$sort": {"timestamp": -1}},
+            {"$lookup": {"from": "classes", "localField": "class_id", "foreignField": "id",
+                         "pipeline": [{"$project": {"_id": 0, "teacher_id": 1}}], "as": "cls"}},
+            {"$set": {"teacher_id": {"$arrayElemAt": ["$cls.teacher_id", 0]}}},
+            {"$match": {"teacher_id": {"$ne": None}}},
+            {"$group": {
+                "_id": "$teacher_id",
+                "total_attendance": {"$sum": 1},
+                "recent": {"$push": recent_summary},
+            }},
+            {"$set": {"recent": {"$slice": ["$recent", self.recent]}, "updated_at": now}},
+            {"$merge": {"into": staging_teachers, "whenMatched": "merge", "whenNotMatched": "insert"}},
+        ], allowDiskUse=True).to_list(None)
+
+        students = await self.db[staging_students].count_documents({})
+        teachers = await self.db[staging_teachers].count_documents({})
+        if students:
+            await self.db[staging_students].rename(self.students.name, dropTarget=True)
+        else:
+            await self.students.delete_many({})
+        if teachers:
+            await self.db[staging_teachers].rename(self.teachers.name, dropTarget=True)
+        else:
+            await self.teachers.delete_many({})
+        logger.info("Rebuilt dashboard stats for %d student(s) and %d teacher(s)", students, teachers)
+        return {"students": students, "teachers": teachers, "rebuilt_at": now}
@@ -0,0 +1,52 @@
+# db_joins.py
+# Aggregation-based joins, used instead of one find_one per row.
+from typing import Iterable, List, Optional
+
+
+def student_lookup(fields: Iterable[str] = ("walletAddress",), as_field: str = "student") -> List[dict]:
+    """
+    Stages that attach the row's `users` document (matched on student_id -> id,
+    which has a unique index) as `as_field`, projected down to `fields`.
+    Rows whose student no longer exists simply get no `as_field`.
+
+    Plain localField / foreignField form, trimmed afterwards: combining them
+    with a `pipeline` needs MongoDB 5.0.
+    """
+    matched = f"${as_field}"
+    return [
+        {"$lookup": {
+            "from": "users",
+            "localField": "student_id",
+            "foreignField": "id",
+            "as": as_field,
+        }},
+        {"$addFields": {as_field: {"$cond": [
+            {"$gt": [{"$size": matched}, 0]},
+            {"$let": {
+                "vars": {"user": {"$arrayElemAt": [matched, 0]}},
+                "in": {f: f"$$user.{f}" for f in fields},
+            }},
+            "$$REMOVE",
+        ]}}},
+    ]
+
+
+async def find_with_students(
+    collection,
+    match: dict,
+    sort: Optional[dict] = None,
+    limit: Optional[int] = None,
+    fields: Iterable[str] = ("walletAddress",),
+    as_field: str = "student",
+    projection: Optional[dict] = None,
+) -> List[dict]:
+    """$match -> $sort -> $limit [-> $project] -> $lookup in a single round trip (plus getMores for big results)."""
+    pipeline: List[dict] = [{"$match": match}]
+    if sort:
+        pipeline.append({"$sort": sort})
+    if limit:
+        pipeline.append({"$limit": limit})
+    if projection:
+        pipeline.append({"$project": projection})
+    pipeline.extend(student_lookup(fields, as_field))
+    return await collection.aggregate(pipeline).to_list(None)
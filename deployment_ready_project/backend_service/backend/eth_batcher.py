@@ -0,0 +1,276 @@
+# eth_batcher.py
+# Collects pending on-chain attendance marks per session and commits them in batches.
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class ChainBatcher:
+    """
+    Batches `markAttendance` calls per QR session (`qr_code_id` on-chain sessionCode).
+
+    The attendance collection itself is the queue: records waiting for the chain
+    carry `chain_status: "pending"`. A session is flushed as soon as `max_batch`
+    marks are waiting for it, or `window` seconds after its first pending mark.
+    Records are claimed by setting `chain_status: "batching"` with a batch id and
+    lease, so a crashed flush is picked up again by the periodic sweep.
+
+    `commit(session_code, class_id, student_ids)` performs the contract call and
+    returns the runner result ({"txHash", "rejected": [student ids], ...}) or
+    None on failure.
+    """
+
+    def __init__(
+        self,
+        collection,
+        commit: Callable[[str, str, List[str]], Awaitable[Optional[dict]]],
+        max_batch: int = 25,
+        window: float = 3.0,
+        max_attempts: int = 8,
+        lease_seconds: float = 300.0,
+    ):
+        self.collection = collection
+        self.commit = commit
+        self.max_batch = max_batch
+        self.window = window
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self._counts: Dict[str, int] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._flushing: Dict[str, asyncio.Task] = {}
+        self._reflush: Set[str] = set()
+        self._waiters: Dict[str, asyncio.Future] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.marks = 0
+
+    @staticmethod
+    def _now():
+        return datetime.now(timezone.utc)
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("chain_status", 1), ("qr_code_id", 1), ("timestamp", 1)])
+        await self.collection.create_index("chain_batch_id", sparse=True)
+
+    def notify(self, session_code: str):
+        """A record for `session_code` became pending; flush on count or after the window."""
+        count = self._counts.get(session_code, 0) + 1
+        self._counts[session_code] = count
+        if count >= self.max_batch:
+            self._schedule_flush(session_code)
+        elif session_code not in self._timers:
+            loop = asyncio.get_running_loop()
+            self._timers[session_code] = loop.call_later(self.window, self._schedule_flush, session_code)
+
+    async def wait(self, attendance_id: str, timeout: float) -> Optional[str]:
+        """
+        Wait for the tx hash of one record's batch (None on failure or timeout).
+
+        A flush claims every pending mark of its session, so with several
+        worker processes the record may be committed by another one, which
+        cannot resolve this waiter: every `window` seconds the record's
+        stored chain_status is checked as well.
+        """
+        fut = self._waiters.get(attendance_id)
+        if fut is None:
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters[attendance_id] = fut
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return None
+                try:
+                    return await asyncio.wait_for(asyncio.shield(fut), min(remaining, max(self.window, 0.5)))
+                except asyncio.TimeoutError:
+                    pass
+                record = await self.collection.find_one(
+                    {"id": attendance_id}, {"_id": 0, "chain_status": 1, "blockchain_tx": 1})
+                if record is None or record.get("chain_status") == "failed":
+                    return None
+                if record.get("chain_status") == "done":
+                    return record.get("blockchain_tx")
+        finally:
+            self._waiters.pop(attendance_id, None)
+
+    def _resolve(self, attendance_ids: List[str], tx_hash: Optional[str]):
+        for att_id in attendance_ids:
+            fut = self._waiters.pop(att_id, None)
+            if fut is not None and not fut.done():
+                fut.set_result(tx_hash)
+
+    def _schedule_flush(self, session_code: str):
+        timer = self._timers.pop(session_code, None)
+        if timer is not None:
+            timer.cancel()
+        self._counts.pop(session_code, None)
+        running = self._flushing.get(session_code)
+        if running is not None and not running.done():
+            # Marks that arrive during a flush are picked up by one more flush after it
+            self._reflush.add(session_code)
+            return
+        self._flushing[session_code] = asyncio.create_task(self._run_flush(session_code))
+
+    async def _run_flush(self, session_code: str):
+        try:
+            await self.flush(session_code)
+        except Exception:
+            # Claimed records keep their lease and are reclaimed by the sweep
+            logger.exception("Flushing chain batch for session %s failed", session_code)
+        finally:
+            self._flushing.pop(session_code, None)
+            if session_code in self._reflush:
+                self._reflush.discard(session_code)
+                self._schedule_flush(session_code)
+
+    async def _claim(self, session_code: str) -> List[dict]:
+        now = self._now()
+        candidates = await self.collection.find(
+            {"qr_code_id": session_code, "$or": [
+                {"chain_status": "pending"},
+                {"chain_status": "batching", "chain_lease_until": {"$lte": now}},
+            ]},
+            {"_id": 0, "id": 1},
+        ).sort("timestamp", 1).limit(self.max_batch).to_list(self.max_batch)
+        if not candidates:
+            return []
+
+        batch_id = str(uuid.uuid4())
+        await self.collection.update_many(
+            {"id": {"$in": [c["id"] for c in candidates]}, "$or": [
+                {"chain_status": "pending"},
+                {"chain_status": "batching", "chain_lease_until": {"$lte": now}},
+            ]},
+            {"$set": {
+                "chain_status": "batching",
+                "chain_batch_id": batch_id,
+                "chain_lease_until": now + timedelta(seconds=self.lease_seconds),
+            }, "$inc": {"chain_attempts": 1}},
+        )
+        # Re-read by batch id: another worker may have claimed some of them first
+        return await self.collection.find(
+            {"chain_batch_id": batch_id, "chain_status": "batching"},
+            {"_id": 0, "id": 1, "student_id": 1, "class_id": 1, "chain_attempts": 1},
+        ).to_list(None)
+
+    async def flush(self, session_code: str):
+        """Commit every pending mark of one session, `max_batch` at a time."""
+        while True:
+            claimed = await self._claim(session_code)
+            if not claimed:
+                return
+
+            class_id = claimed[0]["class_id"]
+            student_ids = [r["student_id"] for r in claimed]
+            att_ids = [r["id"] for r in claimed]
+
+            try:
+                result = await self.commit(session_code, class_id, student_ids)
+            except Exception:
+                logger.exception("Batch commit for session %s raised", session_code)
+                result = None
+
+            if result and result.get("txHash"):
+                # The contract skips students bound to another address instead of
+                # reverting; those are failed, as markAttendance would have been.
+                # Students it skips as already marked count as done.
+                rejected_students = set(result.get("rejected") or ())
+                rejected = [r["id"] for r in claimed if r["student_id"] in rejected_students]
+                done = [i for i in att_ids if i not in rejected]
+                self.batches += 1
+                self.marks += len(done)
+                if done:
+                    await self.collection.update_many(
+                        {"id": {"$in": done}},
+                        {"$set": {
+                            "chain_status": "done",
+                            "blockchain_tx": result["txHash"],
+                            "chain_batch_size": len(att_ids),
+                            "chain_lease_until": None,
+                        }},
+                    )
+                if rejected:
+                    await self.collection.update_many(
+                        {"id": {"$in": rejected}},
+                        {"$set": {
+                            "chain_status": "failed",
+                            "chain_error": "rejected by contract: student bound to another address",
+                            "chain_batch_tx": result["txHash"],
+                            "chain_lease_until": None,
+                        }},
+                    )
+                    logger.warning("Contract rejected %d of %d mark(s) for session %s in tx %s",
+                                   len(rejected), len(att_ids), session_code, result["txHash"])
+                logger.info("Committed %d mark(s) for session %s in tx %s",
+                            len(done), session_code, result["txHash"])
+                self._resolve(done, result["txHash"])
+                self._resolve(rejected, None)
+                continue
+
+            # Failed: give the records back (or give up on them) and stop this flush;
+            # the sweep retries after the next window.
+            exhausted = [r["id"] for r in claimed if r.get("chain_attempts", 0) >= self.max_attempts]
+            retry = [i for i in att_ids if i not in exhausted]
+            if exhausted:
+                await self.collection.update_many(
+                    {"id": {"$in": exhausted}},
+                    {"$set": {"chain_status": "failed", "chain_lease_until": None}},
+                )
+            if retry:
+                await self.collection.update_many(
+                    {"id": {"$in": retry}},
+                    {"$set": {"chain_status": "pending", "chain_lease_until": None}},
+                )
+            logger.warning("Batch commit for session %s failed (%d to retry, %d given up)",
+                           session_code, len(retry), len(exhausted))
+            self._resolve(att_ids, None)
+            return
+
+    async def _sweep(self):
+        """Flush sessions whose marks were left behind (restart, failed flush, expired lease)."""
+        while True:
+            await asyncio.sleep(max(self.window, 1.0) * 5)
+            try:
+                now = self._now()
+                sessions = await self.collection.distinct("qr_code_id", {"$or": [
+                    {"chain_status": "pending"},
+                    {"chain_status": "batching", "chain_lease_until": {"$lte": now}},
+                ]})
+                for session_code in sessions:
+                    if session_code not in self._timers:
+                        self._schedule_flush(session_code)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Chain batch sweep failed")
+
+    async def start(self):
+        if self._sweeper is None:
+            await self.ensure_indexes()
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    async def stop(self):
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        tasks = [t for t in self._flushing.values() if not t.done()]
+        if self._sweeper is not None:
+            tasks.append(self._sweeper)
+            self._sweeper.cancel()
+            self._sweeper = None
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "marks": self.marks,
+            "avg_batch_size": round(self.marks / self.batches, 2) if self.batches else 0,
+            "sessions_waiting": len(self._timers),
+            "waiters": len(self._waiters),
+        }
@@ -0,0 +1,189 @@
+# eth_client.py
+# Persistent client for server/eth_runner.js running in --daemon mode.
+import asyncio
+import itertools
+import json
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Replies carry full contract records; the asyncio default (64 KiB) is too tight
+STREAM_LIMIT = 4 * 1024 * 1024
+
+
+class EthRunnerError(Exception):
+    """The runner process failed before it produced a reply."""
+
+
+class EthRunnerUnavailable(EthRunnerError):
+    """A runner process could not be started at all (no node, no subprocess support)."""
+
+
+class EthRunnerProcess:
+    """
+    One long-lived `node eth_runner.js --daemon` process.
+
+    Requests are written to stdin as JSON lines and replies are matched back to
+    their caller by request id. If the process dies, every in-flight call fails
+    with EthRunnerError and the next call starts a fresh process (with backoff).
+    """
+
+    def __init__(self, runner_path: str, name: str = "eth-runner",
+                 min_backoff: float = 0.5, max_backoff: float = 10.0):
+        self.runner_path = runner_path
+        self.name = name
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.restarts = 0
+        self._proc: Optional[asyncio.subprocess.Process] = None
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        self._start_lock = asyncio.Lock()
+        self._tasks: List[asyncio.Task] = []
+        self._failures = 0
+
+    @property
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.returncode is None
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending)
+
+    async def start(self):
+        if self.alive:
+            return
+        async with self._start_lock:
+            if self.alive:
+                return
+            if self._failures:
+                delay = min(self.max_backoff, self.min_backoff * (2 ** (self._failures - 1)))
+                logger.info("Restarting %s in %.1fs", self.name, delay)
+                await asyncio.sleep(delay)
+            if self._proc is not None:
+                self.restarts += 1
+
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    "node", self.runner_path, "--daemon",
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    limit=STREAM_LIMIT,
+                )
+            except (NotImplementedError, FileNotFoundError) as e:
+                # e.g. SelectorEventLoop on Windows, or node missing from PATH
+                raise EthRunnerUnavailable(str(e)) from e
+            except OSError as e:
+                self._failures += 1
+                raise EthRunnerError(f"could not start {self.name}: {e}") from e
+
+            # Each process gets its own pending table so a late EOF from a dead
+            # process can never fail requests sent to its replacement.
+            pending: Dict[str, asyncio.Future] = {}
+            self._proc = proc
+            self._pending = pending
+            self._tasks = [
+                asyncio.create_task(self._read_replies(proc, pending)),
+                asyncio.create_task(self._read_stderr(proc)),
+            ]
+            logger.info("Started %s (pid %s)", self.name, proc.pid)
+
+    async def _read_replies(self, proc, pending: Dict[str, asyncio.Future]):
+        try:
+            while True:
+                line = await proc.stdout.readline()
+                if not line:
+                    break
+                try:
+                    msg = json.loads(line)
+                except ValueError:
+                    logger.warning("%s wrote non-JSON line: %r", self.name, line[:200])
+                    continue
+                fut = pending.pop(str(msg.get("id")), None)
+                if fut is not None and not fut.done():
+                    fut.set_result(msg)
+                # a healthy reply resets the restart backoff
+                self._failures = 0
+        except Exception:
+            logger.exception("%s reader failed", self.name)
+        finally:
+            returncode = await proc.wait()
+            if pending:
+                logger.error("%s exited with code %s; failing %d in-flight call(s)",
+                             self.name, returncode, len(pending))
+            else:
+                logger.warning("%s exited with code %s", self.name, returncode)
+            self._failures += 1
+            err = EthRunnerError(f"{self.name} exited with code {returncode}")
+            for fut in pending.values():
+                if not fut.done():
+                    fut.set_exception(err)
+            pending.clear()
+
+    async def _read_stderr(self, proc):
+        while True:
+            line = await proc.stderr.readline()
+            if not line:
+                return
+            logger.info("%s: %s", self.name, line.decode(errors="replace").rstrip())
+
+    async def call(self, action: str, payload: dict, timeout: float) -> dict:
+        """Send one request and return the raw reply ({"id", "ok", "result"|"error"})."""
+        await self.start()
+        proc = self._proc
+        pending = self._pending
+        req_id = str(next(self._ids))
+        fut = asyncio.get_running_loop().create_future()
+        pending[req_id] = fut
+        try:
+            line = json.dumps({"id": req_id, "action": action, "payload": payload}) + "\n"
+            proc.stdin.write(line.encode())
+            await proc.stdin.drain()
+            return await asyncio.wait_for(fut, timeout)
+        except (BrokenPipeError, ConnectionResetError) as e:
+            raise EthRunnerError(f"{self.name} pipe closed: {e}") from e
+        finally:
+            pending.pop(req_id, None)
+
+    async def close(self):
+        proc = self._proc
+        if proc is not None and proc.returncode is None:
+            proc.stdin.close()
+            try:
+                await asyncio.wait_for(proc.wait(), 5)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+
+class EthRunnerPool:
+    """A small pool of EthRunnerProcess; each call goes to the least busy process."""
+
+    def __init__(self, runner_path: str, size: int = 1):
+        self.runner_path = runner_path
+        self.processes = [
+            EthRunnerProcess(runner_path, name=f"eth-runner-{i}") for i in range(max(1, size))
+        ]
+
+    async def start(self):
+        await asyncio.gather(*(p.start() for p in self.processes))
+
+    async def call(self, action: str, payload: dict, timeout: float) -> dict:
+        proc = min(self.processes, key=lambda p: p.in_flight)
+        return await proc.call(action, payload, timeout)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.processes),
+            "alive": sum(p.alive for p in self.processes),
+            "in_flight": sum(p.in_flight for p in self.processes),
+            "restarts": sum(p.restarts for p in self.processes),
+        }
+
+    async def close(self):
+        await asyncio.gather(*(p.close() for p in self.processes), return_exceptions=True)
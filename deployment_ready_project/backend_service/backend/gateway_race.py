@@ -0,0 +1,150 @@
+# gateway_race.py
+# Latency/health scoring of IPFS gateways and hedged (raced) reads across them.
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class GatewayScore:
+    def __init__(self, name: str, initial_latency: float):
+        self.name = name
+        self.latency = initial_latency  # EWMA of successful response time, seconds
+        self.failure_rate = 0.0         # EWMA of failures (0 = healthy, 1 = always failing)
+        self.requests = 0
+        self.failures = 0
+        self.cancelled = 0
+        self.wins = 0
+
+
+class GatewayScoreboard:
+    """
+    Running per-gateway score: lower is better.
+
+        score = latency_ewma * (1 + failure_penalty * failure_ewma)
+
+    The score decides the order in which gateways are tried, and each gateway's
+    latency EWMA decides how long to wait on it before hedging to the next one.
+    """
+
+    def __init__(self, initial: Dict[str, float], alpha: float = 0.2, failure_penalty: float = 4.0,
+                 hedge_factor: float = 1.5, min_hedge: float = 0.05, max_hedge: float = 2.0):
+        self.alpha = alpha
+        self.failure_penalty = failure_penalty
+        self.hedge_factor = hedge_factor
+        self.min_hedge = min_hedge
+        self.max_hedge = max_hedge
+        self.scores = {name: GatewayScore(name, latency) for name, latency in initial.items()}
+
+    def _get(self, name: str) -> GatewayScore:
+        if name not in self.scores:
+            self.scores[name] = GatewayScore(name, max(self.scores[n].latency for n in self.scores) if self.scores else 1.0)
+        return self.scores[name]
+
+    def score(self, name: str) -> float:
+        s = self._get(name)
+        return s.latency * (1 + self.failure_penalty * s.failure_rate)
+
+    def order(self, gateways: List[Tuple[str, Any]]) -> List[Tuple[str, Any]]:
+        return sorted(gateways, key=lambda g: self.score(g[0]))
+
+    def hedge_delay(self, name: str) -> float:
+        return min(self.max_hedge, max(self.min_hedge, self.score(name) * self.hedge_factor))
+
+    def record_success(self, name: str, elapsed: float):
+        s = self._get(name)
+        s.requests += 1
+        s.latency += self.alpha * (elapsed - s.latency)
+        s.failure_rate += self.alpha * (0.0 - s.failure_rate)
+
+    def record_failure(self, name: str, elapsed: float):
+        s = self._get(name)
+        s.requests += 1
+        s.failures += 1
+        s.failure_rate += self.alpha * (1.0 - s.failure_rate)
+        # a slow failure also says something about latency
+        if elapsed > s.latency:
+            s.latency += self.alpha * (elapsed - s.latency)
+
+    def record_cancelled(self, name: str, elapsed: float):
+        # Lost the race: we only know the answer would have taken longer than `elapsed`
+        s = self._get(name)
+        s.cancelled += 1
+        if elapsed > s.latency:
+            s.latency += self.alpha * (elapsed - s.latency)
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                "score": round(self.score(name), 4),
+                "latency_ewma": round(s.latency, 4),
+                "failure_rate": round(s.failure_rate, 4),
+                "hedge_delay": round(self.hedge_delay(name), 4),
+                "requests": s.requests,
+                "failures": s.failures,
+                "cancelled": s.cancelled,
+                "wins": s.wins,
+            }
+            for name, s in self.scores.items()
+        }
+
+
+async def race_gateways(
+    gateways: List[Tuple[str, Any]],
+    fetch: Callable[[str, Any], Awaitable[Optional[Any]]],
+    scoreboard: GatewayScoreboard,
+) -> Optional[Any]:
+    """
+    Query gateways best-score first and hedge: if the current leader has not
+    answered within its hedge delay, start the next one too. The first non-None
+    result wins and every request still in flight is cancelled. A gateway that
+    fails outright triggers the next one immediately.
+
+    `fetch(name, target)` returns a result or None; scoring is done here.
+    """
+    loop = asyncio.get_running_loop()
+    queue = scoreboard.order(gateways)
+    pending: Dict[asyncio.Task, Tuple[str, float]] = {}
+    next_launch = 0.0
+
+    async def attempt(name: str, target: Any):
+        started = time.perf_counter()
+        try:
+            result = await fetch(name, target)
+        except asyncio.CancelledError:
+            scoreboard.record_cancelled(name, time.perf_counter() - started)
+            raise
+        except Exception as e:
+            logger.debug("Gateway %s failed: %s", name, e)
+            result = None
+        elapsed = time.perf_counter() - started
+        if result is None:
+            scoreboard.record_failure(name, elapsed)
+        else:
+            scoreboard.record_success(name, elapsed)
+        return result
+
+    try:
+        while queue or pending:
+            if queue and (not pending or loop.time() >= next_launch):
+                name, target = queue.pop(0)
+                pending[asyncio.create_task(attempt(name, target))] = (name, loop.time())
+                next_launch = loop.time() + scoreboard.hedge_delay(name)
+                continue
+
+            timeout = max(0.0, next_launch - loop.time()) if queue else None
+            done, _ = await asyncio.wait(pending.keys(), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name, _ = pending.pop(task)
+                result = task.result()
+                if result is not None:
+                    scoreboard.scores[name].wins += 1
+                    return result
+        return None
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
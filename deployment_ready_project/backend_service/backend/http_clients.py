@@ -0,0 +1,130 @@
+# http_clients.py
+# Application-scoped, pooled httpx clients for the external HTTP backends (Pinata, IPFS).
+import logging
+import os
+import time
+from typing import Callable, Dict, Optional
+
+import httpx
+
+try:  # HTTP/2 needs the optional `h2` package (pip install "httpx[http2]")
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+class HTTPBackend:
+    """Connection settings for one external backend.
+
+    Every setting can be overridden with HTTP_<NAME>_<SETTING> environment
+    variables, e.g. HTTP_PINATA_READ_TIMEOUT=20 or HTTP_LOCAL_IPFS_HTTP2=false.
+    """
+
+    def __init__(self, name: str, connect_timeout: float = 5.0, read_timeout: float = 30.0,
+                 max_connections: int = 50, max_keepalive: int = 20,
+                 keepalive_expiry: float = 30.0, http2: bool = False):
+        prefix = f"HTTP_{name.upper()}_"
+        self.name = name
+        self.connect_timeout = _env_float(prefix + "CONNECT_TIMEOUT", connect_timeout)
+        self.read_timeout = _env_float(prefix + "READ_TIMEOUT", read_timeout)
+        self.max_connections = _env_int(prefix + "MAX_CONNECTIONS", max_connections)
+        self.max_keepalive = _env_int(prefix + "MAX_KEEPALIVE", max_keepalive)
+        self.keepalive_expiry = _env_float(prefix + "KEEPALIVE_EXPIRY", keepalive_expiry)
+        self.http2 = os.environ.get(prefix + "HTTP2", str(http2)).lower() == "true"
+
+    def build_client(self, event_hooks: Optional[dict] = None) -> httpx.AsyncClient:
+        http2 = self.http2
+        if http2 and not HTTP2_AVAILABLE:
+            logger.warning("HTTP/2 requested for %s but the h2 package is not installed; using HTTP/1.1", self.name)
+            http2 = False
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout, pool=self.connect_timeout),
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            http2=http2,
+            event_hooks=event_hooks,
+        )
+
+
+class HTTPClients:
+    """
+    One long-lived AsyncClient per backend, created on first use and closed at shutdown.
+    With `observe`, every request calls observe(backend, method, status, seconds)
+    once its response headers arrive (requests that fail before that are not seen).
+    """
+
+    def __init__(self, *backends: HTTPBackend, observe: Optional[Callable[[str, str, int, float], None]] = None):
+        self.backends: Dict[str, HTTPBackend] = {b.name: b for b in backends}
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self.observe = observe
+
+    def _event_hooks(self, name: str) -> Optional[dict]:
+        if self.observe is None:
+            return None
+        observe = self.observe
+
+        async def on_request(request: httpx.Request):
+            request.extensions["started_at"] = time.perf_counter()
+
+        async def on_response(response: httpx.Response):
+            started = response.request.extensions.get("started_at")
+            if started is not None:
+                observe(name, response.request.method, response.status_code, time.perf_counter() - started)
+
+        return {"request": [on_request], "response": [on_response]}
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._clients[name] = self.backends[name].build_client(self._event_hooks(name))
+        return client
+
+    async def aclose(self):
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+    @staticmethod
+    def _pool_stats(client: Optional[httpx.AsyncClient]) -> dict:
+        # httpcore keeps no public counters; read them off the connection pool
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        if pool is None:
+            return {"connections": 0, "idle": 0, "active_requests": 0, "waiting_requests": 0}
+        connections = list(getattr(pool, "connections", []))
+        requests = list(getattr(pool, "_requests", []))
+        waiting = sum(1 for r in requests if r.is_queued())
+        return {
+            "connections": len(connections),
+            "idle": sum(1 for c in connections if c.is_idle()),
+            "active_requests": len(requests) - waiting,
+            "waiting_requests": waiting,
+        }
+
+    def stats(self) -> dict:
+        result = {}
+        for name, backend in self.backends.items():
+            client = self._clients.get(name)
+            result[name] = {
+                "open": client is not None and not client.is_closed,
+                "http2": backend.http2 and HTTP2_AVAILABLE,
+                "max_connections": backend.max_connections,
+                "max_keepalive": backend.max_keepalive,
+                "connect_timeout": backend.connect_timeout,
+                "read_timeout": backend.read_timeout,
+                **self._pool_stats(client),
+            }
+        return result
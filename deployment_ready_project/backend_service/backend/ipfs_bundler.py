@@ -0,0 +1,178 @@
+# ipfs_bundler.py
+# Bundles the IPFS payloads of one QR session into a single directory object once the session has expired.
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SessionBundler:
+    """
+    Instead of one IPFS object per mark, each attendance record waits with
+    `ipfs_status: "bundle_pending"`, its payload in `ipfs_payload` and
+    `ipfs_bundle_after` set to the session expiry (plus a grace period). Once
+    that time has passed, every waiting record of the session (`qr_code_id`)
+    is claimed (`"bundling"` with a bundle id and lease), the payloads are
+    uploaded as one directory with an `<attendance id>.json` entry each, and
+    every record gets the directory CID and its path inside it.
+
+    `upload(session_code, [(name, bytes), ...])` returns the directory CID or
+    None; `on_bundled(bundle_cid, [(attendance_id, path, bytes), ...])` lets the
+    caller update whatever else references the records.
+    """
+
+    def __init__(
+        self,
+        collection,
+        upload: Callable[[str, List[Tuple[str, bytes]]], Awaitable[Optional[str]]],
+        serialize: Callable[[dict], bytes],
+        on_bundled: Optional[Callable[[str, List[Tuple[str, str, bytes]]], Awaitable[None]]] = None,
+        interval: float = 30.0,
+        max_attempts: int = 10,
+        lease_seconds: float = 300.0,
+    ):
+        self.collection = collection
+        self.upload = upload
+        self.serialize = serialize
+        self.on_bundled = on_bundled
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self._task: Optional[asyncio.Task] = None
+        self.bundles = 0
+        self.entries = 0
+        self.failures = 0
+
+    @staticmethod
+    def _now():
+        return datetime.now(timezone.utc)
+
+    @staticmethod
+    def entry_name(attendance_id: str) -> str:
+        return f"{attendance_id}.json"
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("ipfs_status", 1), ("ipfs_bundle_after", 1), ("qr_code_id", 1)])
+        await self.collection.create_index("ipfs_bundle_id", sparse=True)
+
+    def _claimable(self, now) -> dict:
+        return {"$or": [
+            {"ipfs_status": "bundle_pending", "ipfs_bundle_after": {"$lte": now}},
+            {"ipfs_status": "bundling", "ipfs_lease_until": {"$lte": now}},
+        ]}
+
+    async def _claim(self, session_code: str) -> Tuple[str, List[dict]]:
+        now = self._now()
+        bundle_id = str(uuid.uuid4())
+        await self.collection.update_many(
+            {"qr_code_id": session_code, **self._claimable(now)},
+            {"$set": {
+                "ipfs_status": "bundling",
+                "ipfs_bundle_id": bundle_id,
+                "ipfs_lease_until": now + timedelta(seconds=self.lease_seconds),
+            }, "$inc": {"ipfs_attempts": 1}},
+        )
+        claimed = await self.collection.find(
+            {"ipfs_bundle_id": bundle_id, "ipfs_status": "bundling"},
+            {"_id": 0, "id": 1, "ipfs_payload": 1, "ipfs_attempts": 1},
+        ).to_list(None)
+        return bundle_id, claimed
+
+    async def bundle_session(self, session_code: str) -> Optional[str]:
+        """Bundle every due record of one session; returns the directory CID."""
+        bundle_id, claimed = await self._claim(session_code)
+        if not claimed:
+            return None
+
+        entries = [
+            (r["id"], self.entry_name(r["id"]), self.serialize(r["ipfs_payload"]))
+            for r in claimed
+        ]
+        try:
+            bundle_cid = await self.upload(session_code, [(name, data) for _, name, data in entries])
+        except Exception:
+            logger.exception("Uploading IPFS bundle for session %s raised", session_code)
+            bundle_cid = None
+
+        if not bundle_cid:
+            self.failures += 1
+            exhausted = [r["id"] for r in claimed if r.get("ipfs_attempts", 0) >= self.max_attempts]
+            retry = [r["id"] for r in claimed if r["id"] not in exhausted]
+            if exhausted:
+                await self.collection.update_many(
+                    {"id": {"$in": exhausted}, "ipfs_bundle_id": bundle_id},
+                    {"$set": {"ipfs_status": "failed", "ipfs_lease_until": None}},
+                )
+            if retry:
+                await self.collection.update_many(
+                    {"id": {"$in": retry}, "ipfs_bundle_id": bundle_id},
+                    {"$set": {"ipfs_status": "bundle_pending", "ipfs_lease_until": None}},
+                )
+            logger.warning("IPFS bundle for session %s failed (%d to retry, %d given up)",
+                           session_code, len(retry), len(exhausted))
+            return None
+
+        await self.collection.update_many(
+            {"ipfs_bundle_id": bundle_id, "ipfs_status": "bundling"},
+            [{"$set": {
+                "ipfs_status": "done",
+                "ipfs_bundle_cid": bundle_cid,
+                "ipfs_path": {"$concat": ["$id", ".json"]},
+                "ipfs_cid": {"$concat": [bundle_cid, "/", "$id", ".json"]},
+                "ipfs_lease_until": None,
+            }}, {"$unset": "ipfs_payload"}],
+        )
+        self.bundles += 1
+        self.entries += len(entries)
+        logger.info("Bundled %d attendance record(s) of session %s -> %s", len(entries), session_code, bundle_cid)
+
+        if self.on_bundled is not None:
+            await self.on_bundled(bundle_cid, entries)
+        return bundle_cid
+
+    async def run_once(self) -> int:
+        """Bundle every session that is due; returns how many bundles were made."""
+        sessions = await self.collection.distinct("qr_code_id", self._claimable(self._now()))
+        made = 0
+        for session_code in sessions:
+            try:
+                if await self.bundle_session(session_code):
+                    made += 1
+            except Exception:
+                # claimed records keep their lease and are picked up again later
+                logger.exception("Bundling session %s failed", session_code)
+        return made
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("IPFS bundle sweep failed")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if self._task is None:
+            await self.ensure_indexes()
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def stats(self) -> dict:
+        waiting = await self.collection.count_documents({"ipfs_status": {"$in": ["bundle_pending", "bundling"]}})
+        return {
+            "bundles": self.bundles,
+            "entries": self.entries,
+            "avg_entries_per_bundle": round(self.entries / self.bundles, 2) if self.bundles else 0,
+            "failures": self.failures,
+            "waiting_records": waiting,
+        }
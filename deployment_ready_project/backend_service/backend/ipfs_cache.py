@@ -0,0 +1,196 @@
+# ipfs_cache.py
+# Two-tier (memory LRU + optional disk) cache of IPFS content keyed by CID.
+import asyncio
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import quote, unquote
+
+logger = logging.getLogger(__name__)
+
+# CIDs are base58btc (Qm...) or multibase base32/base36 strings, optionally
+# followed by a path inside a directory object ("cid/entry.json"); anything
+# else is simply not cached.
+_CID_RE = re.compile(r"^[A-Za-z0-9]{8,128}(/[A-Za-z0-9._-]+)*$")
+
+
+class CIDCache:
+    """
+    Content behind a CID never changes, so entries never go stale; they are only
+    evicted for space.
+
+    Tier 1 is an in-process LRU bounded by total bytes. Tier 2 (enabled when
+    `disk_dir` is set) stores one file per CID, sharded into subdirectories by
+    two characters of the CID like go-ipfs' flatfs ("next-to-last/2"), because
+    the leading characters of a CID are the same for every object. The disk tier
+    is evicted least-recently-used by total size. Disk hits are promoted into
+    memory. "cid/path" keys are as immutable as plain CIDs and are cached the
+    same way (stored next to their root CID, with the path percent-encoded).
+
+    That only holds for bytes known to match their CID. Content that could
+    not be checked (put with `ttl`) is kept in memory only, for `ttl` seconds.
+    """
+
+    def __init__(self, max_memory_bytes: int = 32 * 1024 * 1024,
+                 disk_dir: Optional[str] = None, max_disk_bytes: int = 1024 * 1024 * 1024):
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._expires: Dict[str, float] = {}  # memory entries put with a ttl
+        self._disk: "OrderedDict[str, int]" = OrderedDict()  # cid -> size, in LRU order
+        self._disk_bytes = 0
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions_memory = 0
+        self.evictions_disk = 0
+
+    @staticmethod
+    def cacheable(cid: str) -> bool:
+        return bool(cid) and bool(_CID_RE.match(cid))
+
+    def _disk_path(self, cid: str) -> Path:
+        root = cid.split("/", 1)[0]
+        return self.disk_dir / root[-3:-1] / quote(cid, safe="")
+
+    async def load(self):
+        """Index what is already on disk (oldest access first) so eviction accounting survives restarts."""
+        if self.disk_dir is None:
+            return
+
+        def scan():
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            entries = []
+            for shard in self.disk_dir.iterdir():
+                if not shard.is_dir():
+                    continue
+                for f in shard.iterdir():
+                    if f.name.endswith(".tmp"):
+                        f.unlink(missing_ok=True)
+                        continue
+                    st = f.stat()
+                    entries.append((st.st_atime, unquote(f.name), st.st_size))
+            return sorted(entries)
+
+        entries = await asyncio.to_thread(scan)
+        for _, cid, size in entries:
+            self._disk[cid] = size
+            self._disk_bytes += size
+        logger.info("IPFS disk cache at %s: %d object(s), %d bytes", self.disk_dir, len(self._disk), self._disk_bytes)
+        await self._evict_disk()
+
+    def _put_memory(self, cid: str, data: bytes):
+        if len(data) > self.max_memory_bytes:
+            return
+        self._drop_memory(cid)
+        self._memory[cid] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_memory_bytes:
+            evicted_cid, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self._expires.pop(evicted_cid, None)
+            self.evictions_memory += 1
+
+    def _drop_memory(self, cid: str):
+        old = self._memory.pop(cid, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._expires.pop(cid, None)
+
+    async def get(self, cid: str) -> Optional[bytes]:
+        if not self.cacheable(cid):
+            return None
+
+        data = self._memory.get(cid)
+        if data is not None and self._expires.get(cid, float("inf")) <= time.monotonic():
+            self._drop_memory(cid)
+            data = None
+        if data is not None:
+            self._memory.move_to_end(cid)
+            self.hits_memory += 1
+            return data
+
+        if self.disk_dir is not None and cid in self._disk:
+            try:
+                data = await asyncio.to_thread(self._disk_path(cid).read_bytes)
+            except OSError:
+                self._forget_disk(cid)
+            else:
+                self._disk.move_to_end(cid)
+                self.hits_disk += 1
+                self._put_memory(cid, data)
+                return data
+
+        self.misses += 1
+        return None
+
+    async def put(self, cid: str, data: bytes, ttl: Optional[float] = None):
+        if not self.cacheable(cid) or not data:
+            return
+        if ttl is not None:
+            if cid not in self._memory or cid in self._expires:
+                self._put_memory(cid, data)
+                if cid in self._memory:
+                    self._expires[cid] = time.monotonic() + ttl
+            return
+        self._put_memory(cid, data)
+
+        if self.disk_dir is None or cid in self._disk or len(data) > self.max_disk_bytes:
+            return
+
+        path = self._disk_path(cid)
+
+        def write():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(path.name + ".tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+
+        try:
+            await asyncio.to_thread(write)
+        except OSError as e:
+            logger.warning("Could not write %s to IPFS disk cache: %s", cid, e)
+            return
+        self._disk[cid] = len(data)
+        self._disk_bytes += len(data)
+        await self._evict_disk()
+
+    def _forget_disk(self, cid: str):
+        size = self._disk.pop(cid, None)
+        if size is not None:
+            self._disk_bytes -= size
+
+    async def _evict_disk(self):
+        victims = []
+        while self._disk_bytes > self.max_disk_bytes and self._disk:
+            cid, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self.evictions_disk += 1
+            victims.append(self._disk_path(cid))
+        if victims:
+            await asyncio.to_thread(lambda: [p.unlink(missing_ok=True) for p in victims])
+
+    def stats(self) -> dict:
+        lookups = self.hits_memory + self.hits_disk + self.misses
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_rate": round((self.hits_memory + self.hits_disk) / lookups, 4) if lookups else 0.0,
+            "evictions_memory": self.evictions_memory,
+            "evictions_disk": self.evictions_disk,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "memory_unverified_entries": len(self._expires),
+            "max_memory_bytes": self.max_memory_bytes,
+            "disk_enabled": self.disk_dir is not None,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self._disk_bytes,
+            "max_disk_bytes": self.max_disk_bytes,
+        }
@@ -0,0 +1,198 @@
+# ipfs_pinner.py
+# Deferred, bulk pinning of objects whose CID was computed locally (see local_cid.py).
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class DeferredPinner:
+    """
+    Objects are recorded in a Mongo collection with their bytes and locally
+    computed CID (`status: "pending"`). A background loop claims them in
+    batches, hands each batch to `pin_batch([(cid, data), ...])`, which returns
+    {cid: remote_cid or None}, and reconciles the result:
+
+        remote == local   -> "pinned"   (bytes dropped from Mongo)
+        remote != local   -> "mismatch" (kept for inspection, logged as an error)
+        no answer         -> retried until `max_attempts`, then "failed"
+
+    `on_reconciled(pinned, mismatched)` lets the caller update documents that
+    reference the CIDs.
+    """
+
+    def __init__(
+        self,
+        collection,
+        pin_batch: Callable[[List[Tuple[str, bytes]]], Awaitable[Dict[str, Optional[str]]]],
+        on_reconciled: Optional[Callable[[List[str], List[str]], Awaitable[None]]] = None,
+        batch_size: int = 100,
+        interval: float = 10.0,
+        max_attempts: int = 10,
+        lease_seconds: float = 300.0,
+    ):
+        self.collection = collection
+        self.pin_batch = pin_batch
+        self.on_reconciled = on_reconciled
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._added = 0
+        self.pinned = 0
+        self.mismatched = 0
+        self.failed = 0
+        self.batches = 0
+
+    @staticmethod
+    def _now():
+        return datetime.now(timezone.utc)
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("cid", unique=True)
+        await self.collection.create_index([("status", 1), ("lease_until", 1)])
+        await self.collection.create_index("batch_id", sparse=True)
+
+    async def add(self, cid: str, data: bytes):
+        """Record an object for pinning (idempotent per CID)."""
+        now = self._now()
+        await self.collection.update_one(
+            {"cid": cid},
+            {"$setOnInsert": {
+                "cid": cid,
+                "content": data,
+                "size": len(data),
+                "status": "pending",
+                "attempts": 0,
+                "remote_cid": None,
+                "lease_until": None,
+                "created_at": now,
+            }},
+            upsert=True,
+        )
+        # don't wait for the next tick once a full batch has accumulated
+        self._added += 1
+        if self._added >= self.batch_size:
+            self._wakeup.set()
+
+    async def _claim(self) -> List[dict]:
+        now = self._now()
+        claimable = {"$or": [
+            {"status": "pending"},
+            {"status": "pinning", "lease_until": {"$lte": now}},
+        ]}
+        candidates = await self.collection.find(claimable, {"_id": 0, "cid": 1}) \
+            .limit(self.batch_size).to_list(self.batch_size)
+        if not candidates:
+            return []
+        batch_id = str(uuid.uuid4())
+        await self.collection.update_many(
+            {"cid": {"$in": [c["cid"] for c in candidates]}, **claimable},
+            {"$set": {"status": "pinning", "batch_id": batch_id,
+                      "lease_until": now + timedelta(seconds=self.lease_seconds)},
+             "$inc": {"attempts": 1}},
+        )
+        return await self.collection.find(
+            {"batch_id": batch_id, "status": "pinning"},
+            {"_id": 0, "cid": 1, "content": 1, "attempts": 1},
+        ).to_list(None)
+
+    async def run_once(self) -> int:
+        """Pin and reconcile one batch; returns how many objects were processed."""
+        claimed = await self._claim()
+        if not claimed:
+            return 0
+
+        try:
+            results = await self.pin_batch([(d["cid"], bytes(d["content"])) for d in claimed])
+        except Exception as e:
+            logger.exception("Bulk pin of %d object(s) failed: %s", len(claimed), e)
+            results = {}
+
+        now = self._now()
+        pinned, mismatched, retry, failed = [], [], [], []
+        for d in claimed:
+            cid = d["cid"]
+            remote = results.get(cid)
+            if remote is None:
+                (failed if d["attempts"] >= self.max_attempts else retry).append(cid)
+            elif remote == cid:
+                pinned.append(cid)
+            else:
+                logger.error("Pinned CID mismatch: computed %s, remote returned %s", cid, remote)
+                mismatched.append(cid)
+                await self.collection.update_one(
+                    {"cid": cid},
+                    {"$set": {"status": "mismatch", "remote_cid": remote, "lease_until": None}},
+                )
+
+        if pinned:
+            await self.collection.update_many(
+                {"cid": {"$in": pinned}},
+                {"$set": {"status": "pinned", "remote_cid": None, "pinned_at": now, "lease_until": None},
+                 "$unset": {"content": ""}},
+            )
+        if retry:
+            await self.collection.update_many(
+                {"cid": {"$in": retry}}, {"$set": {"status": "pending", "lease_until": None}}
+            )
+        if failed:
+            await self.collection.update_many(
+                {"cid": {"$in": failed}}, {"$set": {"status": "failed", "lease_until": None}}
+            )
+
+        self.batches += 1
+        self.pinned += len(pinned)
+        self.mismatched += len(mismatched)
+        self.failed += len(failed)
+        logger.info("Pinned batch of %d: %d ok, %d mismatch, %d retry, %d failed",
+                    len(claimed), len(pinned), len(mismatched), len(retry), len(failed))
+
+        if self.on_reconciled is not None and (pinned or mismatched):
+            await self.on_reconciled(pinned, mismatched)
+        # a batch where nothing got through means the backend is down; wait for the next tick
+        return len(claimed) if (pinned or mismatched) else 0
+
+    async def _loop(self):
+        while True:
+            try:
+                while await self.run_once() >= self.batch_size:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Deferred pinning loop failed")
+            self._wakeup.clear()
+            self._added = 0
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self):
+        if self._task is None:
+            await self.ensure_indexes()
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def stats(self) -> dict:
+        counts = {}
+        async for row in self.collection.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+            counts[row["_id"]] = row["count"]
+        return {
+            "objects": counts,
+            "batches": self.batches,
+            "pinned": self.pinned,
+            "mismatched": self.mismatched,
+            "failed": self.failed,
+        }
@@ -0,0 +1,241 @@
+# ledger.py
+# Sequenced appends to the db.blockchain ledger: batched block numbering and previous_hash linkage.
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+GENESIS_HASH = "0"
+
+
+class LedgerSequencer:
+    """
+    Single writer per process: append() queues a block and one writer task
+    drains the queue in batches. Each batch reserves its block numbers and
+    swaps the chain tip with one atomic update of a counter document
+
+        {_id: <name>, seq: <last block number>, tip: <hash of that block>}
+
+    read back as it was *before* the update. The batch is numbered
+    seq+1 .. seq+k and linked to the old tip, so the numbering stays gap-free
+    and the previous_hash links stay unforked even with several workers
+    appending: their batches just interleave. Block hashes cover the block
+    data only, so they are known before the reservation.
+
+    The same update journals the batch on the counter document (`journal`:
+    its first number, the old tip and the blocks), and the entry is pulled
+    once the blocks are inserted. A batch whose insert failed for good, or
+    whose worker died after reserving, is still in the journal and is
+    written by repair(), which every worker runs on start; so a reservation
+    never leaves a gap or a link to a block that does not exist.
+
+    The current tip is also kept in memory; the latest-block query is only
+    run once, to seed the counter from a ledger written before it existed.
+    """
+
+    def __init__(self, collection, counters, name: str = "blockchain",
+                 max_batch: int = 256, insert_attempts: int = 5):
+        self.collection = collection
+        self.counters = counters
+        self.name = name
+        self.max_batch = max_batch
+        self.insert_attempts = insert_attempts
+        self._queue: "asyncio.Queue[Tuple[dict, asyncio.Future]]" = asyncio.Queue()
+        self._writer: Optional[asyncio.Task] = None
+        self.tip_number = 0
+        self.tip_hash = GENESIS_HASH
+        self.appended = 0
+        self.batches = 0
+        self.failed = 0
+        self.repaired = 0
+        self._commit_seconds = 0.0
+
+    async def ensure_indexes(self):
+        try:
+            await self.collection.create_index("block_number", unique=True)
+        except Exception as e:
+            # only possible if earlier unsequenced appends produced duplicates
+            logger.error("Could not create unique index on blockchain.block_number: %s", e)
+
+    async def _seed_counter(self):
+        if await self.counters.find_one({"_id": self.name}) is not None:
+            return
+        last = await self.collection.find({}, {"_id": 0, "block_number": 1, "hash": 1}) \
+            .sort("block_number", -1).limit(1).to_list(1)
+        seq = last[0]["block_number"] if last else 0
+        tip = last[0]["hash"] if last else GENESIS_HASH
+        try:
+            await self.counters.insert_one({"_id": self.name, "seq": seq, "tip": tip})
+            logger.info("Seeded ledger counter at block %s", seq)
+        except DuplicateKeyError:
+            pass  # another worker seeded it first
+
+    async def start(self):
+        if self._writer is None:
+            await self.ensure_indexes()
+            await self._seed_counter()
+            await self.repair()
+            counter = await self.counters.find_one({"_id": self.name})
+            self.tip_number, self.tip_hash = counter["seq"], counter["tip"]
+            self._writer = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._writer is not None:
+            # let queued appends finish before shutting down
+            try:
+                await asyncio.wait_for(self._queue.join(), 10)
+            except asyncio.TimeoutError:
+                logger.warning("Ledger writer stopped with %d append(s) still queued", self._queue.qsize())
+            self._writer.cancel()
+            await asyncio.gather(self._writer, return_exceptions=True)
+            self._writer = None
+
+    async def append(self, block: dict) -> dict:
+        """Queue `block` (with its `hash` set); returns it with block_number / previous_hash filled in."""
+        if self._writer is None:
+            await self.start()
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((block, fut))
+        return await fut
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            try:
+                await self._commit([block for block, _ in batch])
+            except asyncio.CancelledError:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.cancel()
+                raise
+            except Exception as e:
+                self.failed += len(batch)
+                logger.exception("Ledger append of %d block(s) failed", len(batch))
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                # the reservation may have gone through; fill it in before the next batch links to it
+                try:
+                    await self.repair()
+                except Exception:
+                    logger.exception("Ledger repair failed; it is retried on the next start")
+            else:
+                for block, fut in batch:
+                    if not fut.done():
+                        fut.set_result(block)
+            for _ in batch:
+                self._queue.task_done()
+
+    @staticmethod
+    def _link(blocks: List[dict], start: int, prev_hash: str) -> Tuple[int, str]:
+        """Number `blocks` from `start` and chain them to `prev_hash`; returns the last (number, hash)."""
+        number = start - 1
+        for block in blocks:
+            number += 1
+            block["block_number"] = number
+            block["previous_hash"] = prev_hash
+            prev_hash = block["hash"]
+        return number, prev_hash
+
+    async def _commit(self, blocks: List[dict]):
+        started = time.perf_counter()
+        batch_id = str(uuid.uuid4())
+        seq = {"$ifNull": ["$seq", 0]}
+        # pipeline update: every expression sees the document as it was before,
+        # so the journal entry gets the same start / tip the batch is linked to
+        before = await self.counters.find_one_and_update(
+            {"_id": self.name},
+            [{"$set": {
+                "journal": {"$concatArrays": [{"$ifNull": ["$journal", []]}, [{
+                    "batch": batch_id,
+                    "start": {"$add": [seq, 1]},
+                    "prev": {"$ifNull": ["$tip", GENESIS_HASH]},
+                    "reserved_at": datetime.now(timezone.utc),
+                    "blocks": {"$literal": blocks},
+                }]]},
+                "seq": {"$add": [seq, len(blocks)]},
+                "tip": {"$literal": blocks[-1]["hash"]},
+            }}],
+            projection={"seq": 1, "tip": 1},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE,
+        )
+        number, prev_hash = self._link(
+            blocks,
+            (before["seq"] if before else 0) + 1,
+            before["tip"] if before else GENESIS_HASH,
+        )
+
+        await self._insert(blocks)
+        await self.counters.update_one({"_id": self.name}, {"$pull": {"journal": {"batch": batch_id}}})
+        self.tip_number, self.tip_hash = number, prev_hash
+        self.appended += len(blocks)
+        self.batches += 1
+        self._commit_seconds += time.perf_counter() - started
+
+    async def _insert(self, blocks: List[dict]):
+        # The numbers are reserved now; a failed insert would leave a gap in the
+        # chain, so retry (already inserted blocks hit the unique index).
+        delay = 0.05
+        for attempt in range(1, self.insert_attempts + 1):
+            try:
+                await self.collection.insert_many(blocks, ordered=True)
+                return
+            except Exception as e:
+                remaining = []
+                for block in blocks:
+                    if await self.collection.find_one({"block_number": block["block_number"]}, {"_id": 1}) is None:
+                        block.pop("_id", None)
+                        remaining.append(block)
+                if not remaining:
+                    return
+                if attempt == self.insert_attempts:
+                    raise
+                logger.warning("Ledger insert failed (attempt %d, %d block(s) left): %s", attempt, len(remaining), e)
+                blocks = remaining
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 1.0)
+
+    async def repair(self) -> int:
+        """Insert the blocks of every journalled batch that is not (fully) in the ledger; returns how many."""
+        counter = await self.counters.find_one({"_id": self.name}, {"journal": 1})
+        repaired = 0
+        for entry in (counter or {}).get("journal") or []:
+            blocks = entry["blocks"]
+            self._link(blocks, entry["start"], entry["prev"])
+            missing = [b for b in blocks
+                       if await self.collection.find_one({"block_number": b["block_number"]}, {"_id": 1}) is None]
+            if missing:
+                # its worker may still be inserting it; the unique index keeps this idempotent
+                await self._insert(missing)
+                repaired += len(missing)
+                logger.warning("Ledger repair: wrote %d block(s) of batch %s reserved at %s",
+                               len(missing), entry["batch"], entry.get("reserved_at"))
+            await self.counters.update_one({"_id": self.name}, {"$pull": {"journal": {"batch": entry["batch"]}}})
+        self.repaired += repaired
+        return repaired
+
+    def stats(self) -> dict:
+        return {
+            "tip_block_number": self.tip_number,
+            "tip_hash": self.tip_hash,
+            "appended": self.appended,
+            "batches": self.batches,
+            "avg_batch_size": round(self.appended / self.batches, 2) if self.batches else 0,
+            "avg_commit_ms": round(self._commit_seconds / self.batches * 1000, 2) if self.batches else 0,
+            "failed": self.failed,
+            "repaired": self.repaired,
+            "queued": self._queue.qsize(),
+        }
@@ -0,0 +1,325 @@
+# ledger_verify.py
+# Streaming integrity check of the db.blockchain ledger: block hashes, previous_hash links and gap-free numbering.
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from ledger import GENESIS_HASH
+
+logger = logging.getLogger(__name__)
+
+PROJECTION = {"_id": 0, "block_number": 1, "hash": 1, "previous_hash": 1, "data": 1}
+
+# Fields written into a block's data after its hash was computed (the CID of
+# the attendance record is only known once IPFS has answered).
+POST_HASH_FIELDS = ("ipfs_cid",)
+
+
+def block_digest(data: dict) -> str:
+    """Same as server.calculate_hash(json.dumps(data, sort_keys=True))."""
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def hash_matches(block: dict) -> bool:
+    data = block.get("data") or {}
+    if block_digest(data) == block.get("hash"):
+        return True
+    if any(f in data for f in POST_HASH_FIELDS):
+        stripped = {k: v for k, v in data.items() if k not in POST_HASH_FIELDS}
+        return block_digest(stripped) == block.get("hash")
+    return False
+
+
+class RangeCheck:
+    """
+    Checks blocks fed in block_number order from `start`. With `prev_hash`
+    None the first block's previous_hash is taken as given (a parallel worker
+    does not know it); the caller stitches ranges with `first_prev_hash`.
+    """
+
+    def __init__(self, start: int, prev_hash: Optional[str] = None, max_problems: int = 100):
+        self.start = start
+        self.expected = start
+        self.prev_hash = prev_hash
+        self.max_problems = max_problems
+        self.first_prev_hash = None
+        self.last_number = start - 1
+        self.last_hash = prev_hash
+        self.clean_through = start - 1
+        self.clean_hash = prev_hash
+        self.checked = 0
+        self.problems: List[dict] = []
+        self.problem_count = 0
+
+    def _problem(self, number, kind: str, detail: str):
+        self.problem_count += 1
+        if len(self.problems) < self.max_problems:
+            self.problems.append({"block_number": number, "kind": kind, "detail": detail})
+
+    def feed(self, block: dict):
+        number = block.get("block_number")
+        before = self.problem_count
+        if number != self.expected:
+            self._problem(number, "sequence", f"expected block {self.expected}, found {number}")
+        if self.checked == 0:
+            self.first_prev_hash = block.get("previous_hash")
+        if self.prev_hash is not None and block.get("previous_hash") != self.prev_hash:
+            self._problem(number, "link", f"previous_hash {str(block.get('previous_hash'))[:16]} "
+                                          f"does not match {self.prev_hash[:16]}")
+        if not hash_matches(block):
+            self._problem(number, "hash", "stored hash does not match the block data")
+        if self.problem_count == before == 0:
+            self.clean_through, self.clean_hash = number, block.get("hash")
+
+        self.checked += 1
+        self.prev_hash = block.get("hash")
+        self.last_number, self.last_hash = number, self.prev_hash
+        if isinstance(number, int):
+            self.expected = number + 1
+
+    def finish(self, end: int):
+        if self.last_number < end:
+            self._problem(self.last_number + 1, "missing", f"blocks {self.last_number + 1}..{end} not found")
+
+    def result(self, end: int) -> dict:
+        return {
+            "from": self.start,
+            "to": end,
+            "checked": self.checked,
+            "first_prev_hash": self.first_prev_hash,
+            "last_hash": self.last_hash,
+            "clean_through": self.clean_through,
+            "clean_hash": self.clean_hash,
+            "problem_count": self.problem_count,
+            "problems": self.problems,
+        }
+
+
+def verify_range_sync(mongo_url: str, db_name: str, collection: str,
+                      start: int, end: int, batch_size: int) -> dict:
+    """Process-pool entry point: check blocks start..end with a private client."""
+    from pymongo import MongoClient
+
+    client = MongoClient(mongo_url)
+    try:
+        check = RangeCheck(start)
+        cursor = client[db_name][collection].find(
+            {"block_number": {"$gte": start, "$lte": end}}, PROJECTION
+        ).sort("block_number", 1).batch_size(batch_size)
+        for block in cursor:
+            check.feed(block)
+        check.finish(end)
+        return check.result(end)
+    finally:
+        client.close()
+
+
+def stitch(ranges: List[dict], start: int, prev_hash: str, max_problems: int = 100) -> dict:
+    """Join the results of consecutive ranges, checking the link across each boundary."""
+    problems, problem_count, checked = [], 0, 0
+    clean_through, clean_hash, clean = start - 1, prev_hash, True
+    link = prev_hash
+    for r in ranges:
+        checked += r["checked"]
+        problem_count += r["problem_count"]
+        problems.extend(r["problems"])
+        link_ok = not r["checked"] or r["first_prev_hash"] == link
+        if not link_ok:
+            problem_count += 1
+            problems.append({"block_number": r["from"], "kind": "link",
+                             "detail": f"previous_hash {str(r['first_prev_hash'])[:16]} does not match "
+                                       f"{str(link)[:16]}"})
+        if clean and link_ok and r["clean_through"] >= r["from"]:
+            clean_through, clean_hash = r["clean_through"], r["clean_hash"]
+        clean = clean and link_ok and r["problem_count"] == 0
+        link = r["last_hash"]
+    problems.sort(key=lambda p: (p["block_number"] is None, p["block_number"] or 0))
+    return {
+        "checked": checked,
+        "clean_through": clean_through,
+        "clean_hash": clean_hash,
+        "problem_count": problem_count,
+        "problems": problems[:max_problems],
+    }
+
+
+class LedgerVerifier:
+    """
+    Walks db.blockchain in block_number order with a cursor (never the whole
+    collection in memory), recomputing each block hash and checking its
+    previous_hash link and number. The highest block verified clean is kept
+    as a checkpoint
+
+        {_id: <name>, verified_through: <block number>, tip_hash: <its hash>}
+
+    so later runs start after it; the checkpoint block is re-read first, so a
+    rewritten history below it is still noticed. `full=True` ignores the
+    checkpoint; with `workers > 1` the range is split across processes, each
+    with its own Mongo client, and the ranges are stitched at their edges.
+
+    Blocks newer than `settle_seconds` are left for the next run: their
+    numbers may be reserved by a sequencer whose insert is still in flight.
+    """
+
+    def __init__(self, collection, checkpoints, name: str = "blockchain",
+                 batch_size: int = 1000, settle_seconds: float = 10.0,
+                 mongo_url: Optional[str] = None, db_name: Optional[str] = None,
+                 interval: float = 0.0, max_problems: int = 100):
+        self.collection = collection
+        self.checkpoints = checkpoints
+        self.name = name
+        self.batch_size = batch_size
+        self.settle_seconds = settle_seconds
+        self.mongo_url = mongo_url
+        self.db_name = db_name
+        self.interval = interval
+        self.max_problems = max_problems
+        self._run: Optional[asyncio.Task] = None
+        self._loop_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _now():
+        return datetime.now(timezone.utc)
+
+    async def _settled_end(self) -> int:
+        cutoff = self._now() - timedelta(seconds=self.settle_seconds)
+        last = await self.collection.find(
+            {"timestamp": {"$lte": cutoff}}, {"_id": 0, "block_number": 1}
+        ).sort("block_number", -1).limit(1).to_list(1)
+        return last[0]["block_number"] if last else 0
+
+    async def _verify_serial(self, start: int, end: int, prev_hash: str) -> dict:
+        check = RangeCheck(start, prev_hash, self.max_problems)
+        cursor = self.collection.find(
+            {"block_number": {"$gte": start, "$lte": end}}, PROJECTION
+        ).sort("block_number", 1).batch_size(self.batch_size)
+        async for block in cursor:
+            check.feed(block)
+        check.finish(end)
+        return check.result(end)
+
+    async def _verify_parallel(self, start: int, end: int, prev_hash: str, workers: int) -> dict:
+        span = end - start + 1
+        step = -(-span // workers)
+        bounds = [(lo, min(lo + step - 1, end)) for lo in range(start, end + 1, step)]
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(max_workers=len(bounds), mp_context=multiprocessing.get_context("spawn")) as pool:
+            ranges = await asyncio.gather(*(
+                loop.run_in_executor(pool, verify_range_sync, self.mongo_url, self.db_name,
+                                     self.collection.name, lo, hi, self.batch_size)
+                for lo, hi in bounds
+            ))
+        return stitch(ranges, start, prev_hash, self.max_problems)
+
+    async def verify(self, full: bool = False, workers: int = 1) -> dict:
+        started = time.perf_counter()
+        checkpoint = await self.checkpoints.find_one({"_id": self.name}) or {}
+        start, prev_hash = 1, GENESIS_HASH
+        if not full and checkpoint.get("verified_through"):
+            start = checkpoint["verified_through"] + 1
+            prev_hash = checkpoint["tip_hash"]
+        end = await self._settled_end()
+
+        result = {"checked": 0, "clean_through": start - 1, "clean_hash": prev_hash,
+                  "problem_count": 0, "problems": []}
+        anchor_ok = True
+        if start > 1:
+            anchor = await self.collection.find_one({"block_number": start - 1}, {"_id": 0, "hash": 1})
+            if anchor is None or anchor.get("hash") != prev_hash:
+                anchor_ok = False
+                result["problem_count"] = 1
+                result["problems"] = [{"block_number": start - 1, "kind": "checkpoint",
+                                       "detail": "checkpoint block is missing or its hash changed; run a full audit"}]
+
+        use_workers = 1
+        if anchor_ok and end >= start:
+            if workers > 1 and self.mongo_url and end - start + 1 >= workers * self.batch_size:
+                use_workers = workers
+                result = await self._verify_parallel(start, end, prev_hash, workers)
+            else:
+                result = await self._verify_serial(start, end, prev_hash)
+
+        elapsed = time.perf_counter() - started
+        report = {
+            "full": full,
+            "from": start,
+            "to": end,
+            "workers": use_workers,
+            "checked": result["checked"],
+            "ok": result["problem_count"] == 0,
+            "problem_count": result["problem_count"],
+            "problems": result["problems"],
+            "elapsed_s": round(elapsed, 3),
+            "blocks_per_s": round(result["checked"] / elapsed, 1) if elapsed else None,
+            "finished_at": self._now(),
+        }
+
+        update = {"last_run": report}
+        # Only ever move the checkpoint forward over blocks that checked clean
+        if anchor_ok and result["clean_through"] > checkpoint.get("verified_through", 0):
+            update.update(verified_through=result["clean_through"], tip_hash=result["clean_hash"],
+                          verified_at=report["finished_at"])
+        elif full and not report["ok"] and checkpoint.get("verified_through", 0) > result["clean_through"]:
+            # a full audit found damage below the checkpoint: stop trusting it
+            update.update(verified_through=result["clean_through"], tip_hash=result["clean_hash"],
+                          verified_at=report["finished_at"])
+        await self.checkpoints.update_one({"_id": self.name}, {"$set": update}, upsert=True)
+        report["verified_through"] = update.get("verified_through", checkpoint.get("verified_through", 0))
+
+        if report["ok"]:
+            logger.info("Ledger verified %d block(s) (%s..%s) in %.2fs", report["checked"], start, end, elapsed)
+        else:
+            logger.error("Ledger verification found %d problem(s) in %s..%s: %s",
+                         report["problem_count"], start, end, report["problems"][:3])
+        return report
+
+    def start_run(self, full: bool = False, workers: int = 1) -> bool:
+        """Start a verification in the background; False if one is already running."""
+        if self.running:
+            return False
+        self._run = asyncio.create_task(self.verify(full=full, workers=workers))
+        self._run.add_done_callback(self._log_failure)
+        return True
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Ledger verification failed: %s", task.exception())
+
+    @property
+    def running(self) -> bool:
+        return self._run is not None and not self._run.done()
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self.running:
+                self.start_run()
+                await asyncio.gather(self._run, return_exceptions=True)
+
+    async def start(self):
+        if self.interval > 0 and self._loop_task is None:
+            self._loop_task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        for task in (self._loop_task, self._run):
+            if task is not None and not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._loop_task = None
+
+    async def status(self) -> dict:
+        checkpoint = await self.checkpoints.find_one({"_id": self.name}, {"_id": 0}) or {}
+        return {
+            "running": self.running,
+            "verified_through": checkpoint.get("verified_through", 0),
+            "tip_hash": checkpoint.get("tip_hash"),
+            "verified_at": checkpoint.get("verified_at"),
+            "last_run": checkpoint.get("last_run"),
+        }
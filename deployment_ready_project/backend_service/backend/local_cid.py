@@ -0,0 +1,82 @@
+# local_cid.py
+# Local computation of the CID `ipfs add --cid-version=1 --raw-leaves` would return.
+import base64
+import hashlib
+from typing import List, Tuple
+
+CHUNK_SIZE = 256 * 1024   # default size-262144 chunker
+MAX_LINKS = 174           # default links per node of the balanced DAG layout
+
+CODEC_RAW = 0x55
+CODEC_DAG_PB = 0x70
+SHA2_256 = 0x12
+UNIXFS_FILE = 2
+
+
+def _varint(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _field(number: int, wire_type: int) -> bytes:
+    return _varint((number << 3) | wire_type)
+
+
+def _bytes_field(number: int, value: bytes) -> bytes:
+    return _field(number, 2) + _varint(len(value)) + value
+
+
+def _cid_bytes(codec: int, block: bytes) -> bytes:
+    digest = hashlib.sha256(block).digest()
+    return _varint(1) + _varint(codec) + _varint(SHA2_256) + _varint(len(digest)) + digest
+
+
+def cid_to_str(cid: bytes) -> str:
+    """CIDv1 string form: multibase base32 (lowercase, unpadded)."""
+    return "b" + base64.b32encode(cid).decode("ascii").lower().rstrip("=")
+
+
+def _file_node(children: List[Tuple[bytes, int, int]]) -> Tuple[bytes, int, int]:
+    """
+    Build a UnixFS file node over `children` ([(cid, tsize, filesize)]).
+    Returns (cid, tsize, filesize) of the new node.
+    """
+    filesize = sum(c[2] for c in children)
+
+    unixfs = _field(1, 0) + _varint(UNIXFS_FILE) + _field(3, 0) + _varint(filesize)
+    for _, _, size in children:
+        unixfs += _field(4, 0) + _varint(size)
+
+    # dag-pb canonical form: all Links (field 2) first, then Data (field 1)
+    node = b""
+    for cid, tsize, _ in children:
+        link = _bytes_field(1, cid) + _bytes_field(2, b"") + _field(3, 0) + _varint(tsize)
+        node += _bytes_field(2, link)
+    node += _bytes_field(1, unixfs)
+
+    return _cid_bytes(CODEC_DAG_PB, node), len(node) + sum(c[1] for c in children), filesize
+
+
+def compute_cid(data: bytes) -> str:
+    """
+    CIDv1 (sha2-256, base32) of `data` as added with `ipfs add --cid-version=1`
+    (raw leaves, size-262144 chunker, balanced layout). Content that fits in a
+    single chunk is just a raw block, so its CID is `bafkrei...`.
+    """
+    if len(data) <= CHUNK_SIZE:
+        return cid_to_str(_cid_bytes(CODEC_RAW, data))
+
+    level = [
+        (_cid_bytes(CODEC_RAW, chunk), len(chunk), len(chunk))
+        for chunk in (data[i:i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE))
+    ]
+    while len(level) > 1:
+        level = [_file_node(level[i:i + MAX_LINKS]) for i in range(0, len(level), MAX_LINKS)]
+    return cid_to_str(level[0][0])
@@ -0,0 +1,60 @@
+# merkle.py
+# Merkle trees over attendance block hashes: roots, inclusion proofs and offline verification.
+#
+#   leaf  = sha256(0x00 || bytes(block_hash))
+#   node  = sha256(0x01 || left || right)
+#
+# Leaves and nodes are domain-separated so a node can never pass as a leaf. A
+# node without a sibling on its level is promoted unchanged to the next level.
+import hashlib
+from typing import Dict, List
+
+ALGORITHM = "sha256; leaf = H(0x00 || block_hash), node = H(0x01 || left || right); unpaired nodes are promoted"
+
+
+def leaf_hash(block_hash: str) -> bytes:
+    return hashlib.sha256(b"\x00" + bytes.fromhex(block_hash)).digest()
+
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+
+def build_levels(block_hashes: List[str]) -> List[List[bytes]]:
+    """All levels of the tree, leaves first, root last."""
+    if not block_hashes:
+        raise ValueError("Cannot build a Merkle tree without leaves")
+    level = [leaf_hash(h) for h in block_hashes]
+    levels = [level]
+    while len(level) > 1:
+        nxt = [node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            nxt.append(level[-1])
+        levels.append(nxt)
+        level = nxt
+    return levels
+
+
+def merkle_root(block_hashes: List[str]) -> str:
+    return build_levels(block_hashes)[-1][0].hex()
+
+
+def inclusion_proof(block_hashes: List[str], index: int) -> List[Dict[str, str]]:
+    """Sibling path from leaf `index` up to the root, as [{"position": "left"|"right", "hash": hex}]."""
+    if not 0 <= index < len(block_hashes):
+        raise IndexError("Leaf index out of range")
+    proof = []
+    for level in build_levels(block_hashes)[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append({"position": "left" if sibling < index else "right", "hash": level[sibling].hex()})
+        index //= 2
+    return proof
+
+
+def verify_proof(block_hash: str, proof: List[Dict[str, str]], root: str) -> bool:
+    node = leaf_hash(block_hash)
+    for step in proof:
+        sibling = bytes.fromhex(step["hash"])
+        node = node_hash(sibling, node) if step["position"] == "left" else node_hash(node, sibling)
+    return node.hex() == root.lower().removeprefix("0x")
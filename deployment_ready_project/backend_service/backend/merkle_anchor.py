@@ -0,0 +1,177 @@
+# merkle_anchor.py
+# Anchors one Merkle root per session / time window on-chain instead of one transaction per attendance mark.
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional
+
+from merkle import merkle_root
+
+logger = logging.getLogger(__name__)
+
+
+class MerkleAnchorer:
+    """
+    Attendance records waiting for an anchor carry `chain_status:
+    "anchor_pending"`, an `anchor_group` (the session code, or a time window)
+    and `anchor_after` (when the group is complete). Once that time has
+    passed, the group's records are claimed (`"anchoring"` under a lease),
+    their `blockchain_hash` values become the leaves of a Merkle tree in
+    (timestamp, id) order, and only the root goes on-chain through
+    `commit(anchor_id, root_hex, leaf_count)`.
+
+    Each tree is stored in `anchors` (root, ordered leaves and attendance ids)
+    so inclusion proofs can be served later; records point at it by
+    `anchor_id`.
+    """
+
+    def __init__(
+        self,
+        collection,
+        anchors,
+        commit: Callable[[str, str, int], Awaitable[Optional[dict]]],
+        interval: float = 30.0,
+        max_attempts: int = 8,
+        lease_seconds: float = 300.0,
+    ):
+        self.collection = collection
+        self.anchors = anchors
+        self.commit = commit
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self._task: Optional[asyncio.Task] = None
+        self.anchored = 0
+        self.leaves = 0
+        self.failures = 0
+
+    @staticmethod
+    def _now():
+        return datetime.now(timezone.utc)
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("chain_status", 1), ("anchor_after", 1), ("anchor_group", 1)])
+        await self.collection.create_index("anchor_id", sparse=True)
+        await self.anchors.create_index("id", unique=True)
+        await self.anchors.create_index("group")
+
+    def _claimable(self, now) -> dict:
+        return {"$or": [
+            {"chain_status": "anchor_pending", "anchor_after": {"$lte": now}},
+            {"chain_status": "anchoring", "chain_lease_until": {"$lte": now}},
+        ]}
+
+    async def anchor_group(self, group: str) -> Optional[str]:
+        """Anchor every due record of one group; returns the anchor id."""
+        now = self._now()
+        anchor_id = str(uuid.uuid4())
+        await self.collection.update_many(
+            {"anchor_group": group, **self._claimable(now)},
+            {"$set": {
+                "chain_status": "anchoring",
+                "anchor_id": anchor_id,
+                "chain_lease_until": now + timedelta(seconds=self.lease_seconds),
+            }, "$inc": {"chain_attempts": 1}},
+        )
+        claimed = await self.collection.find(
+            {"anchor_id": anchor_id, "chain_status": "anchoring"},
+            {"_id": 0, "id": 1, "blockchain_hash": 1, "chain_attempts": 1},
+        ).sort([("timestamp", 1), ("id", 1)]).to_list(None)
+        if not claimed:
+            return None
+
+        leaves = [r["blockchain_hash"] for r in claimed]
+        root = merkle_root(leaves)
+        await self.anchors.insert_one({
+            "id": anchor_id,
+            "group": group,
+            "root": root,
+            "leaf_count": len(leaves),
+            "leaves": leaves,
+            "attendance_ids": [r["id"] for r in claimed],
+            "status": "pending",
+            "tx_hash": None,
+            "created_at": now,
+        })
+
+        try:
+            result = await self.commit(anchor_id, root, len(leaves))
+        except Exception:
+            logger.exception("Anchoring Merkle root for %s raised", group)
+            result = None
+
+        if result and result.get("txHash"):
+            await self.anchors.update_one(
+                {"id": anchor_id},
+                {"$set": {"status": "anchored", "tx_hash": result["txHash"],
+                          "chain_block_number": result.get("blockNumber"), "anchored_at": self._now()}},
+            )
+            await self.collection.update_many(
+                {"anchor_id": anchor_id, "chain_status": "anchoring"},
+                {"$set": {"chain_status": "done", "blockchain_tx": result["txHash"], "chain_lease_until": None}},
+            )
+            self.anchored += 1
+            self.leaves += len(leaves)
+            logger.info("Anchored %d record(s) of %s under root %s in tx %s",
+                        len(leaves), group, root, result["txHash"])
+            return anchor_id
+
+        self.failures += 1
+        await self.anchors.update_one({"id": anchor_id}, {"$set": {"status": "failed"}})
+        exhausted = [r["id"] for r in claimed if r.get("chain_attempts", 0) >= self.max_attempts]
+        retry = [r["id"] for r in claimed if r["id"] not in exhausted]
+        if exhausted:
+            await self.collection.update_many(
+                {"id": {"$in": exhausted}, "anchor_id": anchor_id},
+                {"$set": {"chain_status": "failed", "chain_lease_until": None}},
+            )
+        if retry:
+            await self.collection.update_many(
+                {"id": {"$in": retry}, "anchor_id": anchor_id},
+                {"$set": {"chain_status": "anchor_pending", "chain_lease_until": None},
+                 "$unset": {"anchor_id": ""}},
+            )
+        logger.warning("Anchoring %s failed (%d to retry, %d given up)", group, len(retry), len(exhausted))
+        return None
+
+    async def run_once(self) -> int:
+        groups = await self.collection.distinct("anchor_group", self._claimable(self._now()))
+        made = 0
+        for group in groups:
+            try:
+                if await self.anchor_group(group):
+                    made += 1
+            except Exception:
+                # claimed records keep their lease and are picked up again later
+                logger.exception("Anchoring group %s failed", group)
+        return made
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Merkle anchor sweep failed")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if self._task is None:
+            await self.ensure_indexes()
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "anchored_roots": self.anchored,
+            "anchored_records": self.leaves,
+            "avg_records_per_root": round(self.leaves / self.anchored, 2) if self.anchored else 0,
+            "failures": self.failures,
+        }
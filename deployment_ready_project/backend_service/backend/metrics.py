@@ -0,0 +1,330 @@
+# metrics.py
+# In-process latency histograms, counters and gauges, merged across workers and rendered in the Prometheus text format.
+import asyncio
+import functools
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# seconds; spans from sub-millisecond Mongo reads to chain confirmations
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: "Histogram", labels: tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, self.labels)
+        return False
+
+
+class Histogram:
+    """
+    Cumulative-bucket latency histogram per label set. observe() is a bisect
+    and three additions under a lock (Mongo events arrive on driver
+    threads), about a microsecond.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[tuple, list] = {}  # labels -> [count per bucket..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, labels: tuple = ()):
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += seconds
+
+    def time(self, *labels) -> _Timer:
+        """`with histogram.time("label"):` records the block's wall time."""
+        return _Timer(self, labels)
+
+    def timed(self, *labels):
+        """
+        Decorator for coroutines: records each call with an extra trailing
+        `outcome` label, "error" if it raised, "none" if it returned None
+        (how most helpers here report failure) and "ok" otherwise.
+        """
+        def decorate(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                outcome = "error"
+                try:
+                    result = await fn(*args, **kwargs)
+                    outcome = "none" if result is None else "ok"
+                    return result
+                finally:
+                    self.observe(time.perf_counter() - started, (*labels, outcome))
+            return wrapper
+        return decorate
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            series = [[list(labels), list(values)] for labels, values in self._series.items()]
+        return {"type": self.kind, "help": self.help, "labelnames": list(self.labelnames),
+                "buckets": list(self.buckets), "series": series}
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, labels: tuple = ()):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            series = [[list(labels), [value]] for labels, value in self._series.items()]
+        return {"type": self.kind, "help": self.help, "labelnames": list(self.labelnames), "series": series}
+
+
+class Gauge:
+    """
+    Current value per label set, from set() or, when given, from `collect`
+    (returning {labels: value}) called at snapshot time. Merged across
+    workers by summing, i.e. gauges are totals such as queue depths.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 collect: Optional[Callable[[], Dict[tuple, float]]] = None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        self._series: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, labels: tuple = ()):
+        with self._lock:
+            self._series[labels] = value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            values = dict(self._series)
+        if self.collect is not None:
+            values.update(self.collect())
+        series = [[list(labels), [value]] for labels, value in values.items()]
+        return {"type": self.kind, "help": self.help, "labelnames": list(self.labelnames), "series": series}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, help, labelnames, buckets))
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = (),
+              collect: Optional[Callable[[], Dict[tuple, float]]] = None) -> Gauge:
+        return self._metrics.setdefault(name, Gauge(name, help, labelnames, collect))
+
+    def snapshot(self) -> dict:
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+
+# ==================== MERGING & RENDERING ====================
+def merge(snapshots: Iterable[dict]) -> dict:
+    """Sum several workers' snapshots series by series (bucket counts, sums and counters all add up)."""
+    merged: Dict[str, dict] = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.get(name)
+            if target is None:
+                target = merged[name] = {**metric, "series": {}}
+            elif metric.get("buckets") != target.get("buckets"):
+                logger.warning("Skipping %s from a worker with different buckets", name)
+                continue
+            for labels, values in metric["series"]:
+                key = tuple(labels)
+                current = target["series"].get(key)
+                target["series"][key] = list(values) if current is None else [a + b for a, b in zip(current, values)]
+    for metric in merged.values():
+        metric["series"] = [[list(k), v] for k, v in metric["series"].items()]
+    return merged
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(snapshot: dict) -> str:
+    """Prometheus text exposition format (version 0.0.4)."""
+    lines: List[str] = []
+    for name in sorted(snapshot):
+        metric = snapshot[name]
+        names = metric["labelnames"]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for labels, values in sorted(metric["series"]):
+            if metric["type"] in ("counter", "gauge"):
+                lines.append(f"{name}{_labels(names, labels)} {_number(values[0])}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric["buckets"], values):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{name}_bucket{_labels(names, labels, le)} {cumulative}")
+            cumulative += values[len(metric["buckets"])]
+            le = 'le="+Inf"'
+            lines.append(f"{name}_bucket{_labels(names, labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(names, labels)} {_number(values[-1])}")
+            lines.append(f"{name}_count{_labels(names, labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+class WorkerSnapshots:
+    """
+    Cross-worker aggregation through a shared directory: each worker writes
+    its snapshot to `<directory>/worker-<pid>-<start time>.json` every
+    `interval` seconds (atomically, via rename) and collect() merges every
+    file with this worker's live numbers. Other workers' figures are at most
+    `interval` old. Files of exited workers are kept, and the start time in
+    the name keeps a recycled pid from overwriting one, so counters and
+    histograms never go backwards; empty the directory when redeploying.
+    Gauges are current values, not totals over time, so a file not rewritten
+    for `STALE_FLUSHES` intervals contributes none.
+    """
+
+    STALE_FLUSHES = 3
+
+    def __init__(self, registry: MetricsRegistry, directory: Optional[str], interval: float = 5.0):
+        self.registry = registry
+        self.directory = directory
+        self.interval = interval
+        self._task = None
+        self._name = f"worker-{os.getpid()}-{time.time_ns()}.json"
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, self._name)
+
+    def flush(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.registry.snapshot(), f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def collect(self) -> dict:
+        snapshots = [self.registry.snapshot()]
+        if self.directory:
+            own = self.path
+            stale_before = time.time() - self.STALE_FLUSHES * self.interval
+            for path in glob.glob(os.path.join(self.directory, "worker-*.json")):
+                if path == own:
+                    continue
+                try:
+                    with open(path) as f:
+                        snapshot = json.load(f)
+                        stale = os.fstat(f.fileno()).st_mtime < stale_before
+                except (OSError, ValueError) as e:
+                    logger.warning("Skipping unreadable metrics file %s: %s", path, e)
+                    continue
+                if stale:
+                    snapshot = {name: m for name, m in snapshot.items() if m["type"] != "gauge"}
+                snapshots.append(snapshot)
+        return merge(snapshots)
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.warning("Could not write metrics snapshot: %s", e)
+
+    async def start(self):
+        if self.directory and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            self.flush()
+
+
+# ==================== MONGO ====================
+class MongoCommandTimer(monitoring.CommandListener):
+    """
+    Driver-level timing of every command, labelled with its collection, so
+    no call site needs wrapping. Register it on the client
+    (`event_listeners=[...]`); durations are the driver's own round-trip
+    measurement.
+    """
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+        self._inflight: Dict[Tuple[int, object], Tuple[str, str]] = {}
+
+    def started(self, event):
+        name = event.command_name
+        target = event.command.get(name)
+        if name == "getMore":
+            target = event.command.get("collection")
+        self._inflight[(event.request_id, event.connection_id)] = (
+            target if isinstance(target, str) else "-", name)
+
+    def _finish(self, event, outcome: str):
+        collection, name = self._inflight.pop((event.request_id, event.connection_id), ("-", event.command_name))
+        self.histogram.observe(event.duration_micros / 1e6, (collection, name, outcome))
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
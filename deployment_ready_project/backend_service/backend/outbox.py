@@ -0,0 +1,205 @@
+# outbox.py
+# Durable write-behind queue stored in MongoDB and drained by background workers.
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, List, Optional
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxFatal(Exception):
+    """Raised by a handler when retrying the job can never succeed."""
+
+
+class Outbox:
+    """
+    Jobs live in a Mongo collection, one document per job:
+
+        {"id", "kind", "payload", "status": pending|in_progress|done|failed,
+         "attempts", "next_attempt_at", "lease_until", "last_error", ...}
+
+    Workers claim a job atomically with find_one_and_update and hold a lease on
+    it. A job whose lease runs out (the worker or the whole process died) is
+    claimed again, so the queue resumes by itself after a restart. Failed
+    attempts are retried with exponential backoff and jitter until
+    `max_attempts`, after which the job is parked as "failed" and `on_give_up`
+    is called.
+    """
+
+    def __init__(
+        self,
+        collection,
+        handler: Callable[[dict], Awaitable[None]],
+        workers: int = 4,
+        max_attempts: int = 8,
+        base_delay: float = 2.0,
+        max_delay: float = 300.0,
+        lease_seconds: float = 120.0,
+        poll_interval: float = 5.0,
+        on_give_up: Optional[Callable[[dict, str], Awaitable[None]]] = None,
+    ):
+        self.collection = collection
+        self.handler = handler
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.on_give_up = on_give_up
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+
+    @staticmethod
+    def _now():
+        return datetime.now(timezone.utc)
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("id", unique=True)
+        await self.collection.create_index([("status", 1), ("next_attempt_at", 1)])
+        await self.collection.create_index([("status", 1), ("lease_until", 1)])
+
+    async def enqueue(self, job_id: str, kind: str, payload: dict):
+        """Add a job (idempotent per job_id) and wake a worker."""
+        now = self._now()
+        await self.collection.update_one(
+            {"id": job_id},
+            {"$setOnInsert": {
+                "id": job_id,
+                "kind": kind,
+                "payload": payload,
+                "status": "pending",
+                "attempts": 0,
+                "next_attempt_at": now,
+                "lease_until": None,
+                "last_error": None,
+                "created_at": now,
+                "updated_at": now,
+            }},
+            upsert=True,
+        )
+        self._wakeup.set()
+
+    async def _claim(self) -> Optional[dict]:
+        now = self._now()
+        return await self.collection.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now}},
+                {"status": "in_progress", "lease_until": {"$lte": now}},
+            ]},
+            {
+                "$set": {
+                    "status": "in_progress",
+                    "lease_until": now + timedelta(seconds=self.lease_seconds),
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("next_attempt_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.max_delay, self.base_delay * (2 ** max(0, attempts - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _run_job(self, job: dict):
+        try:
+            await self.handler(job)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            now = self._now()
+            if isinstance(e, OutboxFatal) or job["attempts"] >= self.max_attempts:
+                logger.error("Outbox job %s (%s) failed permanently after %s attempt(s): %s",
+                             job["id"], job["kind"], job["attempts"], error)
+                self.failed += 1
+                await self.collection.update_one(
+                    {"id": job["id"]},
+                    {"$set": {"status": "failed", "last_error": error, "lease_until": None, "updated_at": now}},
+                )
+                if self.on_give_up is not None:
+                    try:
+                        await self.on_give_up(job, error)
+                    except Exception:
+                        logger.exception("Outbox on_give_up hook failed for job %s", job["id"])
+            else:
+                delay = self._backoff(job["attempts"])
+                logger.warning("Outbox job %s (%s) attempt %s failed, retrying in %.1fs: %s",
+                               job["id"], job["kind"], job["attempts"], delay, error)
+                self.retried += 1
+                await self.collection.update_one(
+                    {"id": job["id"]},
+                    {"$set": {
+                        "status": "pending",
+                        "last_error": error,
+                        "lease_until": None,
+                        "next_attempt_at": now + timedelta(seconds=delay),
+                        "updated_at": now,
+                    }},
+                )
+            return
+
+        self.processed += 1
+        await self.collection.update_one(
+            {"id": job["id"]},
+            {"$set": {"status": "done", "lease_until": None, "last_error": None, "updated_at": self._now()}},
+        )
+
+    async def _worker(self, n: int):
+        while True:
+            try:
+                job = await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Outbox worker %s could not claim a job", n)
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Bookkeeping failed (e.g. Mongo down); the lease will expire and
+                # the job gets picked up again.
+                logger.exception("Outbox worker %s lost track of job %s", n, job.get("id"))
+
+    async def start(self):
+        if self._tasks:
+            return
+        await self.ensure_indexes()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info("Outbox started with %d worker(s) on %s", self.workers, self.collection.name)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def stats(self) -> dict:
+        counts = {"pending": 0, "in_progress": 0, "done": 0, "failed": 0}
+        async for row in self.collection.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+            counts[row["_id"]] = row["count"]
+        return {
+            "workers": len(self._tasks),
+            "jobs": counts,
+            "processed": self.processed,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
@@ -0,0 +1,56 @@
+# pagination.py
+# Keyset (cursor) pagination over (timestamp, id), newest first.
+import base64
+import json
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+# Sort order every paginated listing uses; backed by (<filter>, timestamp, id) indexes
+KEYSET_SORT = [("timestamp", -1), ("id", -1)]
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(doc: dict) -> str:
+    """Opaque cursor pointing just after `doc` (the last row of a page)."""
+    ts = doc.get("timestamp")
+    if isinstance(ts, datetime):
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        ts = ts.isoformat()
+    raw = json.dumps({"t": ts, "i": doc.get("id")}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        ts = datetime.fromisoformat(data["t"])
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        return ts, str(data["i"])
+    except Exception:
+        raise InvalidCursor("Invalid pagination cursor")
+
+
+def keyset_query(query: dict, cursor: Optional[str]) -> dict:
+    """`query` restricted to the rows that sort after `cursor` in KEYSET_SORT order."""
+    if not cursor:
+        return query
+    ts, last_id = decode_cursor(cursor)
+    after = {"$or": [
+        {"timestamp": {"$lt": ts}},
+        {"timestamp": ts, "id": {"$lt": last_id}},
+    ]}
+    return {"$and": [query, after]} if query else after
+
+
+def split_page(rows: List[dict], limit: int) -> Tuple[List[dict], Optional[str]]:
+    """Given up to limit + 1 rows, return the page and the cursor of the next one (None on the last page)."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1])
@@ -0,0 +1,140 @@
+# password_pool.py
+# bcrypt hashing/verification in a process pool, with bounded concurrency and latency / queue metrics.
+import asyncio
+import logging
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from passlib.context import CryptContext
+
+logger = logging.getLogger(__name__)
+
+_context: Optional[CryptContext] = None
+
+
+def _crypt_context() -> CryptContext:
+    # built lazily so each worker process creates its own
+    global _context
+    if _context is None:
+        _context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _context
+
+
+def _hash(password: str) -> str:
+    return _crypt_context().hash(password)
+
+
+def _verify(plain: str, hashed: str) -> bool:
+    return _crypt_context().verify(plain, hashed)
+
+
+def _warmup() -> bool:
+    _crypt_context()
+    return True
+
+
+class PasswordHasherBusy(Exception):
+    """Raised instead of queueing once `max_waiting` calls are already waiting."""
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt outside the event loop. `executor` is "process" (default; a
+    spawn-context ProcessPoolExecutor so the work does not compete for this
+    process' GIL), "thread" or "inline" (on the loop, for debugging).
+
+    At most `max_concurrent` hashes run at once; up to `max_waiting` more
+    wait for a slot, and beyond that callers get PasswordHasherBusy so the
+    API can answer 429 instead of building an unbounded backlog.
+    """
+
+    def __init__(self, executor: str = "process", workers: int = 2,
+                 max_concurrent: Optional[int] = None, max_waiting: int = 64):
+        self.executor_kind = executor
+        self.workers = max(1, workers)
+        self.max_concurrent = max_concurrent or self.workers
+        self.max_waiting = max_waiting
+        self._executor: Optional[Executor] = None
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self._latencies = deque(maxlen=1000)  # seconds, including queueing
+        self.running = 0
+        self.waiting = 0
+        self.max_waiting_seen = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> Optional[Executor]:
+        if self._executor is None and self.executor_kind != "inline":
+            if self.executor_kind == "thread":
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="bcrypt")
+            else:
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    async def start(self):
+        """Start the workers now so the first login does not pay for process startup."""
+        executor = self._get_executor()
+        if executor is not None:
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(loop.run_in_executor(executor, _warmup) for _ in range(self.workers)))
+
+    async def close(self):
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown, True)
+
+    async def _run(self, fn, *args):
+        if self._semaphore.locked() and self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise PasswordHasherBusy("Too many password operations in progress")
+
+        started = time.perf_counter()
+        self.waiting += 1
+        self.max_waiting_seen = max(self.max_waiting_seen, self.waiting)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            executor = self._get_executor()
+            if executor is None:
+                return fn(*args)
+            return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+            self.completed += 1
+            self._latencies.append(time.perf_counter() - started)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify(self, plain: str, hashed: str) -> bool:
+        return await self._run(_verify, plain, hashed)
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+
+        def pct(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 2)
+
+        return {
+            "executor": self.executor_kind,
+            "workers": self.workers,
+            "max_concurrent": self.max_concurrent,
+            "max_waiting": self.max_waiting,
+            "running": self.running,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting_seen,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "latency_ms_p50": pct(0.50),
+            "latency_ms_p95": pct(0.95),
+            "latency_ms_p99": pct(0.99),
+        }
@@ -0,0 +1,187 @@
+# qr_render.py
+# QR code rendering as PNG, SVG or a raw module matrix, off the event loop and cached by content.
+import asyncio
+import base64
+import io
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import qrcode
+from PIL import Image
+
+FORMATS = ("png", "svg", "matrix")
+QUIET_ZONE = 4
+
+
+def qr_matrix(content: str, mask_pattern: Optional[int] = None) -> List[List[bool]]:
+    """
+    Dark/light modules of the smallest fitting symbol, without the quiet zone.
+    With `mask_pattern` None the encoder scores all eight masks and keeps the
+    best, which is most of the encoding time; a fixed mask (0-7) scans fine
+    for short-lived codes and encodes about five times faster.
+    """
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_L, border=0, mask_pattern=mask_pattern)
+    qr.add_data(content)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+def matrix_rows(matrix: List[List[bool]]) -> dict:
+    """Compact JSON form for clients that draw the code themselves: one "0"/"1" string per row."""
+    return {"size": len(matrix), "quiet_zone": QUIET_ZONE,
+            "rows": ["".join("1" if m else "0" for m in row) for row in matrix]}
+
+
+def matrix_svg(matrix: List[List[bool]]) -> str:
+    """One <path> with a rectangle per horizontal run of dark modules."""
+    size = len(matrix) + 2 * QUIET_ZONE
+    parts = []
+    for y, row in enumerate(matrix, QUIET_ZONE):
+        x, n = 0, len(row)
+        while x < n:
+            if row[x]:
+                start = x
+                while x < n and row[x]:
+                    x += 1
+                parts.append(f"M{start + QUIET_ZONE} {y}h{x - start}v1h-{x - start}z")
+            else:
+                x += 1
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" '
+            f'shape-rendering="crispEdges"><rect width="{size}" height="{size}" fill="#fff"/>'
+            f'<path fill="#000" d="{"".join(parts)}"/></svg>')
+
+
+def matrix_png(matrix: List[List[bool]], box_size: int = 10) -> bytes:
+    """1-bit image at one pixel per module, scaled up with nearest-neighbour."""
+    n = len(matrix)
+    size = n + 2 * QUIET_ZONE
+    img = Image.new("1", (size, size), 1)
+    img.putdata([0 if (QUIET_ZONE <= y < n + QUIET_ZONE and QUIET_ZONE <= x < n + QUIET_ZONE
+                       and matrix[y - QUIET_ZONE][x - QUIET_ZONE]) else 1
+                 for y in range(size) for x in range(size)])
+    img = img.resize((size * box_size, size * box_size), Image.NEAREST)
+    buffered = io.BytesIO()
+    img.save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
+def render(content: str, fmt: str, box_size: int = 10, mask_pattern: Optional[int] = None):
+    """PNG -> base64 string, SVG -> markup, matrix -> {"size", "quiet_zone", "rows"}."""
+    matrix = qr_matrix(content, mask_pattern)
+    if fmt == "png":
+        return base64.b64encode(matrix_png(matrix, box_size)).decode()
+    if fmt == "svg":
+        return matrix_svg(matrix)
+    if fmt == "matrix":
+        return matrix_rows(matrix)
+    raise ValueError(f"Unknown QR format {fmt!r}")
+
+
+class QRRenderer:
+    """
+    Renders in a small thread pool so the event loop never runs the encoder,
+    keeps the last `max_entries` results keyed by (format, content), and
+    collapses concurrent requests for the same image into one render.
+    Rotating codes are deterministic per time slot, so every display of a
+    session (and every worker's pre-generation) asks for the same content.
+    """
+
+    def __init__(self, max_entries: int = 512, workers: int = 2, box_size: int = 10,
+                 mask_pattern: Optional[int] = None, observe: Optional[Callable[[str, float], None]] = None):
+        self.max_entries = max_entries
+        self.observe = observe
+        self.box_size = box_size
+        self.mask_pattern = mask_pattern
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="qr-render")
+        self._cache: "OrderedDict[Tuple[str, str], object]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self._render_seconds: Dict[str, float] = {f: 0.0 for f in FORMATS}
+        self._renders: Dict[str, int] = {f: 0 for f in FORMATS}
+
+    def _timed_render(self, content: str, fmt: str):
+        started = time.perf_counter()
+        result = render(content, fmt, self.box_size, self.mask_pattern)
+        elapsed = time.perf_counter() - started
+        self._render_seconds[fmt] += elapsed
+        self._renders[fmt] += 1
+        if self.observe is not None:
+            self.observe(fmt, elapsed)
+        return result
+
+    async def render(self, content: str, fmt: str = "png"):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown QR format {fmt!r}")
+        key = (fmt, content)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return cached
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.hits += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        fut = loop.run_in_executor(self._executor, self._timed_render, content, fmt)
+        self._inflight[key] = fut
+        try:
+            result = await asyncio.shield(fut)
+        finally:
+            self._inflight.pop(key, None)
+        self._cache[key] = result
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return result
+
+    def prerender(self, contents: List[str], fmt: str = "png"):
+        """Warm the cache for upcoming codes without waiting for them."""
+        for content in contents:
+            if (fmt, content) not in self._cache and (fmt, content) not in self._inflight:
+                task = asyncio.ensure_future(self.render(content, fmt))
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._cache),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "renders": dict(self._renders),
+            "avg_render_ms": {f: round(self._render_seconds[f] / n * 1000, 3)
+                              for f, n in self._renders.items() if n},
+        }
+
+
+def slot_bounds(now: float, rotation: int, offset: int = 0) -> Tuple[int, int]:
+    """[start, end) of the rotation slot `offset` slots after the one containing `now`."""
+    start = (int(now) // rotation + offset) * rotation
+    return start, start + rotation
+
+
+def rotating_expiry(slot_end: int, grace: int, session_end: float) -> int:
+    """A slot's code stays valid `grace` seconds into the next slot, never past the session."""
+    return int(min(slot_end + grace, session_end))
+
+
+def rotation_slots(now: float, rotation: int, count: int, grace: int,
+                   session_end: float) -> List[Tuple[int, int]]:
+    """(valid_from, expires) for the current slot and the next `count - 1` that start before the session ends."""
+    slots = []
+    for offset in range(count):
+        start, end = slot_bounds(now, rotation, offset)
+        if start >= session_end:
+            break
+        slots.append((start, rotating_expiry(end, grace, session_end)))
+    return slots
+
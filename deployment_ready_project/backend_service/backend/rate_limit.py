@@ -0,0 +1,477 @@
+# rate_limit.py
+# Per-route rate limiting as a pure ASGI middleware, with in-process, shared-memory or Mongo counters.
+import hashlib
+import ipaddress
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+ALGORITHMS = ("sliding_window", "token_bucket")
+
+# Counter state is three floats whatever the algorithm, so every store keeps
+# the same fixed-size record:
+#   token_bucket:   (tokens, updated_at, 0)
+#   sliding_window: (window_index, count_in_window, count_in_previous_window)
+State = Tuple[float, float, float]
+
+
+class RatePolicy(NamedTuple):
+    name: str
+    limit: int
+    window: float
+    algorithm: str = "sliding_window"
+
+
+class Decision(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: float
+
+
+# ==================== ALGORITHMS ====================
+def token_bucket(state: Optional[State], policy: RatePolicy, now: float) -> Tuple[State, bool]:
+    """Bucket of `limit` tokens refilled continuously at limit/window per second; a request takes one."""
+    rate = policy.limit / policy.window
+    if state is None:
+        tokens = float(policy.limit)
+    else:
+        tokens = min(float(policy.limit), state[0] + max(0.0, now - state[1]) * rate)
+    allowed = tokens >= 1
+    if allowed:
+        tokens -= 1
+    return (tokens, now, 0.0), allowed
+
+
+def sliding_window(state: Optional[State], policy: RatePolicy, now: float) -> Tuple[State, bool]:
+    """
+    Two fixed windows, the previous one weighted by how much of it still
+    overlaps the sliding window: a close approximation of a true sliding
+    log in constant space.
+    """
+    window = float(now // policy.window)
+    if state is None or state[0] < window - 1:
+        current, previous = 0.0, 0.0
+    elif state[0] == window - 1:
+        current, previous = 0.0, state[1]
+    else:
+        current, previous = state[1], state[2]
+    weight = 1 - (now - window * policy.window) / policy.window
+    allowed = previous * weight + current + 1 <= policy.limit
+    if allowed:
+        current += 1
+    return (window, current, previous), allowed
+
+
+STEPS = {"token_bucket": token_bucket, "sliding_window": sliding_window}
+
+
+def decide(state: State, policy: RatePolicy, now: float, allowed: bool) -> Decision:
+    """Remaining requests and, when refused, seconds until the next one would pass, from the state after a hit."""
+    if policy.algorithm == "token_bucket":
+        tokens = state[0]
+        rate = policy.limit / policy.window
+        return Decision(allowed, policy.limit, max(0, int(tokens)), 0.0 if allowed else (1 - tokens) / rate)
+
+    window, current, previous = state
+    elapsed = (now - window * policy.window) / policy.window
+    used = previous * (1 - elapsed) + current
+    remaining = max(0, int(policy.limit - used))
+    if allowed:
+        return Decision(True, policy.limit, remaining, 0.0)
+    if previous > 0 and current + 1 <= policy.limit:
+        # the previous window's weight has to decay by the excess
+        retry_after = policy.window * (used + 1 - policy.limit) / previous
+    else:
+        retry_after = (1 - elapsed) * policy.window
+    return Decision(False, policy.limit, remaining, retry_after)
+
+
+# ==================== STORES ====================
+class MemoryStore:
+    """Counters of this process only, LRU-bounded to `max_keys` clients x policies."""
+
+    name = "memory"
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._states: "OrderedDict[str, State]" = OrderedDict()
+        self.evictions = 0
+
+    async def hit(self, key: str, policy: RatePolicy, now: float) -> Decision:
+        state, allowed = STEPS[policy.algorithm](self._states.get(key), policy, now)
+        self._states[key] = state
+        self._states.move_to_end(key)
+        if len(self._states) > self.max_keys:
+            self._states.popitem(last=False)
+            self.evictions += 1
+        return decide(state, policy, now, allowed)
+
+    def stats(self) -> dict:
+        return {"keys": len(self._states), "max_keys": self.max_keys, "evictions": self.evictions}
+
+    def close(self):
+        pass
+
+
+class SharedMemoryStore:
+    """
+    Counters shared by every worker on the host through a memory-mapped file
+    (on /dev/shm by default, so it never touches disk). The table is
+    4-way set associative with a fixed number of slots:
+
+        slot = key hash (u64, 0 = empty) | state (3 x f64) | last used (f64)
+
+    A key lives in one set of four slots; when the set is full the least
+    recently used slot is reused, so memory is bounded whatever clients
+    send. Each hit holds a POSIX record lock on its set only, so workers
+    contend only when they hit the same set at the same moment.
+
+    The first worker creates the file; the others attach to it. It is left in
+    place on shutdown (other workers may still use it) and reused on restart.
+    """
+
+    name = "shared"
+    MAGIC = b"RLT1"
+    HEADER = struct.Struct("<4sI8x")
+    SLOT = struct.Struct("<Qdddd")
+    WAYS = 4
+
+    def __init__(self, path: str, slots: int = 65536):
+        import fcntl
+
+        self._fcntl = fcntl
+        self.path = path
+        self.sets = max(1, slots // self.WAYS)
+        self.slots = self.sets * self.WAYS
+        self.size = self.HEADER.size + self.slots * self.SLOT.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, self.HEADER.size, 0)
+        try:
+            if os.fstat(self._fd).st_size == 0:
+                os.ftruncate(self._fd, self.size)
+                os.pwrite(self._fd, self.HEADER.pack(self.MAGIC, self.slots), 0)
+            magic, slots_in_file = self.HEADER.unpack(os.pread(self._fd, self.HEADER.size, 0))
+            if magic != self.MAGIC or slots_in_file != self.slots:
+                raise ValueError(f"{path} holds a different rate limit table "
+                                 f"({slots_in_file} slots); remove it or use another path")
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, self.HEADER.size, 0)
+        self._map = mmap.mmap(self._fd, self.size)
+        self.evictions = 0
+
+    @staticmethod
+    def key_hash(key: str) -> int:
+        # Python's hash() is salted per process, so workers would disagree on it
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+
+    async def hit(self, key: str, policy: RatePolicy, now: float) -> Decision:
+        h = self.key_hash(key)
+        first = (h % self.sets) * self.WAYS
+        start = self.HEADER.size + first * self.SLOT.size
+        length = self.WAYS * self.SLOT.size
+        fcntl = self._fcntl
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, length, start)
+        try:
+            state = None
+            empty = lru = None
+            lru_used = math.inf
+            for way in range(self.WAYS):
+                offset = start + way * self.SLOT.size
+                slot_hash, s0, s1, s2, used = self.SLOT.unpack_from(self._map, offset)
+                if slot_hash == h:
+                    state, target = (s0, s1, s2), offset
+                    break
+                if slot_hash == 0:
+                    if empty is None:
+                        empty = offset
+                elif used < lru_used:
+                    lru, lru_used = offset, used
+            else:
+                target = empty if empty is not None else lru
+                if empty is None:
+                    self.evictions += 1
+            state, allowed = STEPS[policy.algorithm](state, policy, now)
+            self.SLOT.pack_into(self._map, target, h, state[0], state[1], state[2], now)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, length, start)
+        return decide(state, policy, now, allowed)
+
+    def stats(self) -> dict:
+        used = sum(1 for i in range(self.slots)
+                   if self.SLOT.unpack_from(self._map, self.HEADER.size + i * self.SLOT.size)[0])
+        return {"path": self.path, "keys": used, "slots": self.slots,
+                "evictions_by_this_worker": self.evictions}
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+
+class MongoStore:
+    """
+    Counters in a Mongo collection, for several hosts sharing one limit. Each
+    hit is a single find_one_and_update whose update pipeline runs the
+    algorithm server-side, so concurrent hits on a key are serialized by
+    Mongo. Documents expire through a TTL index on `expires_at` once the
+    client has been idle long enough for its state to be back to empty.
+
+    If Mongo is unreachable the request is let through (and counted in
+    `errors`): rate limiting should not take the API down with it.
+    """
+
+    name = "mongo"
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.errors = 0
+
+    @staticmethod
+    def pipeline(policy: RatePolicy, now: float) -> List[dict]:
+        expires_at = datetime.fromtimestamp(now, tz=timezone.utc) + timedelta(seconds=2 * policy.window)
+        if policy.algorithm == "token_bucket":
+            elapsed = {"$max": [0, {"$subtract": [now, {"$ifNull": ["$s1", now]}]}]}
+            return [
+                {"$set": {"_tokens": {"$min": [policy.limit, {"$add": [
+                    {"$ifNull": ["$s0", policy.limit]},
+                    {"$multiply": [elapsed, policy.limit / policy.window]},
+                ]}]}}},
+                {"$set": {"allowed": {"$gte": ["$_tokens", 1]}}},
+                {"$set": {
+                    "s0": {"$cond": ["$allowed", {"$subtract": ["$_tokens", 1]}, "$_tokens"]},
+                    "s1": now,
+                    "s2": 0,
+                    "expires_at": expires_at,
+                }},
+                {"$unset": "_tokens"},
+            ]
+
+        window = float(now // policy.window)
+        weight = 1 - (now - window * policy.window) / policy.window
+        return [
+            {"$set": {
+                "_current": {"$cond": [{"$eq": ["$s0", window]}, "$s1", 0]},
+                "_previous": {"$switch": {"branches": [
+                    {"case": {"$eq": ["$s0", window]}, "then": "$s2"},
+                    {"case": {"$eq": ["$s0", window - 1]}, "then": "$s1"},
+                ], "default": 0}},
+            }},
+            {"$set": {"allowed": {"$lte": [
+                {"$add": [{"$multiply": ["$_previous", weight]}, "$_current", 1]}, policy.limit,
+            ]}}},
+            {"$set": {
+                "s0": window,
+                "s1": {"$cond": ["$allowed", {"$add": ["$_current", 1]}, "$_current"]},
+                "s2": "$_previous",
+                "expires_at": expires_at,
+            }},
+            {"$unset": ["_current", "_previous"]},
+        ]
+
+    async def hit(self, key: str, policy: RatePolicy, now: float) -> Decision:
+        for attempt in range(2):
+            try:
+                doc = await self.collection.find_one_and_update(
+                    {"_id": key},
+                    self.pipeline(policy, now),
+                    projection={"_id": 0, "s0": 1, "s1": 1, "s2": 1, "allowed": 1},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                )
+                return decide((doc["s0"], doc["s1"], doc["s2"]), policy, now, doc["allowed"])
+            except DuplicateKeyError:
+                # two workers upserted a new key at once; the loser retries as an update
+                if attempt:
+                    break
+            except Exception as e:
+                logger.warning("Rate limit store unavailable, allowing request: %s", e)
+                break
+        self.errors += 1
+        return Decision(True, policy.limit, policy.limit, 0.0)
+
+    def stats(self) -> dict:
+        return {"collection": self.collection.name, "errors": self.errors}
+
+    def close(self):
+        pass
+
+
+# ==================== CLIENT ADDRESS ====================
+def parse_networks(spec: str) -> List[ipaddress._BaseNetwork]:
+    """Comma-separated addresses / CIDR ranges, e.g. "127.0.0.1,10.0.0.0/8"."""
+    return [ipaddress.ip_network(part.strip(), strict=False) for part in spec.split(",") if part.strip()]
+
+
+def client_address(peer: Optional[str], forwarded_for: Optional[str],
+                   trusted: List[ipaddress._BaseNetwork]) -> str:
+    """
+    The connecting address, unless it is a trusted proxy: then X-Forwarded-For
+    is read right to left, skipping further trusted proxies, and the first
+    address not in the list is the client. Entries left of it were written by
+    the client and are never believed, so spoofed headers cannot mint new keys.
+    """
+    if not peer or not trusted or not forwarded_for or not _is_trusted(peer, trusted):
+        return peer or "unknown"
+    client = peer
+    for hop in reversed(forwarded_for.split(",")):
+        hop = hop.strip()
+        try:
+            ipaddress.ip_address(hop)
+        except ValueError:
+            break
+        client = hop
+        if not _is_trusted(hop, trusted):
+            break
+    return client
+
+
+def _is_trusted(address: str, trusted: List[ipaddress._BaseNetwork]) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in net for net in trusted)
+
+
+# ==================== POLICIES ====================
+def parse_policies(spec: str) -> List[Tuple[List[str], RatePolicy]]:
+    """
+    `name=path|path:limit/window[:algorithm]` entries separated by ";". Paths
+    listed under one name share a counter; a trailing "*" matches a prefix:
+
+        auth=/api/auth/login|/api/auth/register:10/60;scan=/api/attendance/mark:30/60:token_bucket
+    """
+    policies = []
+    for entry in spec.split(";"):
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            name, rest = entry.split("=", 1)
+            paths, rule = rest.split(":", 1)
+            limit, _, rule = rule.partition("/")
+            window, _, algorithm = rule.partition(":")
+            policy = RatePolicy(name.strip(), int(limit), float(window), algorithm.strip() or "sliding_window")
+        except ValueError:
+            raise ValueError(f"Bad rate limit policy {entry!r} (expected name=path|path:limit/window[:algorithm])")
+        if policy.algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown rate limit algorithm {policy.algorithm!r} in {entry!r}")
+        if policy.limit < 1 or policy.window <= 0:
+            raise ValueError(f"Rate limit policy {entry!r} needs a positive limit and window")
+        policies.append(([p.strip() for p in paths.split("|") if p.strip()], policy))
+    return policies
+
+
+class RateLimiter:
+    """
+    Route -> policy lookup, client identification and per-policy counters.
+    Exact paths are a dict lookup; prefixes are tried longest first, so
+    requests to unlimited routes cost one dict miss and a short scan.
+    """
+
+    def __init__(self, store, policies: Iterable[Tuple[List[str], RatePolicy]],
+                 trusted_proxies: Optional[List[ipaddress._BaseNetwork]] = None):
+        self.store = store
+        self.trusted_proxies = trusted_proxies or []
+        self._exact: Dict[str, RatePolicy] = {}
+        self._prefixes: List[Tuple[str, RatePolicy]] = []
+        self.policies: Dict[str, RatePolicy] = {}
+        for paths, policy in policies:
+            self.policies[policy.name] = policy
+            for path in paths:
+                if path.endswith("*"):
+                    self._prefixes.append((path[:-1], policy))
+                else:
+                    self._exact[path] = policy
+        self._prefixes.sort(key=lambda p: len(p[0]), reverse=True)
+        self.allowed: Dict[str, int] = {name: 0 for name in self.policies}
+        self.limited: Dict[str, int] = {name: 0 for name in self.policies}
+
+    def policy_for(self, path: str) -> Optional[RatePolicy]:
+        policy = self._exact.get(path)
+        if policy is None:
+            for prefix, candidate in self._prefixes:
+                if path.startswith(prefix):
+                    return candidate
+        return policy
+
+    async def check(self, policy: RatePolicy, client: str) -> Decision:
+        decision = await self.store.hit(f"{policy.name}:{client}", policy, time.time())
+        if decision.allowed:
+            self.allowed[policy.name] += 1
+        else:
+            self.limited[policy.name] += 1
+        return decision
+
+    def stats(self) -> dict:
+        return {
+            "store": self.store.name,
+            "trusted_proxies": [str(n) for n in self.trusted_proxies],
+            "policies": {name: {**p._asdict(), "allowed": self.allowed[name], "limited": self.limited[name]}
+                         for name, p in self.policies.items()},
+            **self.store.stats(),
+        }
+
+
+class RateLimitMiddleware:
+    """
+    Raw ASGI middleware: requests to routes without a policy go straight to
+    the app. Limited responses carry X-RateLimit-Limit / -Remaining headers;
+    refused ones are a 429 with Retry-After.
+    """
+
+    def __init__(self, app, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        policy = self.limiter.policy_for(scope["path"])
+        if policy is None:
+            return await self.app(scope, receive, send)
+
+        peer = scope.get("client")
+        forwarded_for = None
+        if self.limiter.trusted_proxies:
+            for name, value in scope["headers"]:
+                if name == b"x-forwarded-for":
+                    forwarded_for = value.decode("latin-1")
+                    break
+        client = client_address(peer[0] if peer else None, forwarded_for, self.limiter.trusted_proxies)
+        decision = await self.limiter.check(policy, client)
+        limit_headers = [
+            (b"x-ratelimit-limit", str(decision.limit).encode()),
+            (b"x-ratelimit-remaining", str(decision.remaining).encode()),
+        ]
+
+        if not decision.allowed:
+            retry_after = max(1, math.ceil(decision.retry_after))
+            body = json.dumps({"detail": f"Rate limit exceeded. Try again in {retry_after} seconds."}).encode()
+            await send({"type": "http.response.start", "status": 429, "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+                *limit_headers,
+            ]})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), *limit_headers]}
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
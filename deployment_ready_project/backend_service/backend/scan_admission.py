@@ -0,0 +1,219 @@
+# scan_admission.py
+# Admission control for QR scans: global and per-session concurrency, a fair queue per session, fast rejections.
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+from metrics import MetricsRegistry
+
+# queue depth seen by an arriving scan; spans one seminar to the largest lecture hall
+DEPTH_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class ScanRejected(Exception):
+    """The scan was not admitted; the client should resend it after `retry_after` seconds."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class ScanAdmission:
+    """
+    Bounds how many scans are processed at once (each one is several Mongo
+    round-trips, an IPFS upload and Ethereum runner calls): at most
+    `max_active` in total and `session_max_active` per QR session, so one
+    lecture hall cannot take every slot.
+
+    Scans beyond that wait in a FIFO queue per session; freed slots go to
+    the sessions round-robin, so a small class starting next to a 500-seat
+    lecture still gets through. A scan is rejected at once (ScanRejected,
+    reason "full") when its session already has `session_max_queued`
+    waiting or `max_queued` wait in total, and after `max_wait` seconds
+    (reason "timeout") rather than hanging until the client gives up.
+    `retry_after` is estimated from the queue length and the recent time a
+    scan holds its slot.
+
+    Limits are per worker process. With `registry`, queue depth on arrival,
+    waiting time, outcomes and current active / queued counts are exported
+    with the other metrics.
+    """
+
+    def __init__(self, max_active: int = 32, session_max_active: Optional[int] = None,
+                 max_queued: int = 1000, session_max_queued: int = 500, max_wait: float = 5.0,
+                 retry_after_max: int = 30, registry: Optional[MetricsRegistry] = None):
+        self.max_active = max_active
+        self.session_max_active = min(session_max_active or max_active, max_active)
+        self.max_queued = max_queued
+        self.session_max_queued = session_max_queued
+        self.max_wait = max_wait
+        self.retry_after_max = retry_after_max
+
+        self.active = 0
+        self.queued = 0
+        self._active_by_session: Dict[str, int] = {}
+        # sessions with waiters, in round-robin order
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._hold_seconds = 0.5  # moving average of how long a scan keeps its slot
+
+        self.outcomes = {"admitted": 0, "queued": 0, "rejected_full": 0, "rejected_timeout": 0, "cancelled": 0}
+        self.max_queued_seen = 0
+        self.max_session_queued_seen = 0
+
+        self._wait_seconds = self._depth = self._outcome_counter = None
+        if registry is not None:
+            self._wait_seconds = registry.histogram(
+                "scan_admission_wait_seconds", "Time a QR scan waited for a processing slot", ("outcome",))
+            self._depth = registry.histogram(
+                "scan_admission_queue_depth", "Scans already queued for the session when a scan arrives",
+                buckets=DEPTH_BUCKETS)
+            self._outcome_counter = registry.counter(
+                "scan_admission_total", "QR scans by admission outcome", ("outcome",))
+            registry.gauge("scan_admission_active", "QR scans being processed",
+                           collect=lambda: {(): self.active})
+            registry.gauge("scan_admission_queued", "QR scans waiting for a slot",
+                           collect=lambda: {(): self.queued})
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_active > 0
+
+    def _count(self, outcome: str):
+        self.outcomes[outcome] += 1
+        if self._outcome_counter is not None:
+            self._outcome_counter.inc(1, (outcome,))
+
+    def _observe_wait(self, seconds: float, outcome: str):
+        if self._wait_seconds is not None:
+            self._wait_seconds.observe(seconds, (outcome,))
+
+    def retry_after(self) -> int:
+        """Seconds until the current backlog has probably drained, at least 1."""
+        estimate = self._hold_seconds * (self.queued + 1) / max(1, self.max_active)
+        return max(1, min(self.retry_after_max, math.ceil(estimate)))
+
+    def _can_run(self, session: str) -> bool:
+        return self.active < self.max_active and self._active_by_session.get(session, 0) < self.session_max_active
+
+    def _grant(self, session: str):
+        self.active += 1
+        self._active_by_session[session] = self._active_by_session.get(session, 0) + 1
+
+    def _dispatch(self):
+        """Hand free slots to waiting scans, one per session per turn."""
+        progress = True
+        while progress and self._queues and self.active < self.max_active:
+            progress = False
+            for session in list(self._queues):
+                if self.active >= self.max_active:
+                    return
+                # served or at its cap, the session goes to the back of the line
+                queue = self._queues.pop(session)
+                if self._active_by_session.get(session, 0) < self.session_max_active:
+                    self._grant(session)
+                    self.queued -= 1
+                    queue.popleft().set_result(None)
+                    progress = True
+                if queue:
+                    self._queues[session] = queue
+
+    async def acquire(self, session: str):
+        depth = len(self._queues.get(session, ()))
+        if self._depth is not None:
+            self._depth.observe(depth)
+        if not self.queued and self._can_run(session):
+            self._grant(session)
+            self._count("admitted")
+            return
+        if depth >= self.session_max_queued or self.queued >= self.max_queued:
+            self._count("rejected_full")
+            raise ScanRejected("full", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue = self._queues.setdefault(session, deque())
+        queue.append(waiter)
+        self.queued += 1
+        self.max_queued_seen = max(self.max_queued_seen, self.queued)
+        self.max_session_queued_seen = max(self.max_session_queued_seen, len(queue))
+        self._dispatch()  # a slot may be free for this session while others sit at their cap
+
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.max_wait)
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                self._abandon(session, waiter)
+                self._count("rejected_timeout")
+                self._observe_wait(time.perf_counter() - started, "timeout")
+                raise ScanRejected("timeout", self.retry_after())
+        except asyncio.CancelledError:
+            # client went away; give back the slot if it was granted meanwhile
+            if waiter.done():
+                self.release(session)
+            else:
+                self._abandon(session, waiter)
+            self._count("cancelled")
+            raise
+        self._count("queued")
+        self._observe_wait(time.perf_counter() - started, "admitted")
+
+    def _abandon(self, session: str, waiter: asyncio.Future):
+        waiter.cancel()
+        self.queued -= 1
+        queue = self._queues.get(session)
+        if queue is not None:
+            try:
+                queue.remove(waiter)
+            except ValueError:
+                pass
+            if not queue:
+                del self._queues[session]
+
+    def release(self, session: str, held: Optional[float] = None):
+        self.active -= 1
+        remaining = self._active_by_session.get(session, 1) - 1
+        if remaining:
+            self._active_by_session[session] = remaining
+        else:
+            self._active_by_session.pop(session, None)
+        if held is not None:
+            self._hold_seconds += (held - self._hold_seconds) * 0.1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, session: str):
+        """`async with admission.slot(qr_id):` - raises ScanRejected if the scan is not admitted."""
+        if not self.enabled:
+            yield
+            return
+        await self.acquire(session)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(session, time.perf_counter() - started)
+
+    def stats(self) -> dict:
+        busiest = sorted(self._queues.items(), key=lambda item: -len(item[1]))[:10]
+        return {
+            "enabled": self.enabled,
+            "max_active": self.max_active,
+            "session_max_active": self.session_max_active,
+            "max_queued": self.max_queued,
+            "session_max_queued": self.session_max_queued,
+            "max_wait_s": self.max_wait,
+            "active": self.active,
+            "queued": self.queued,
+            "sessions_waiting": len(self._queues),
+            "busiest_sessions": [{"session": s, "queued": len(q), "active": self._active_by_session.get(s, 0)}
+                                 for s, q in busiest],
+            "max_queued_seen": self.max_queued_seen,
+            "max_session_queued_seen": self.max_session_queued_seen,
+            "avg_hold_ms": round(self._hold_seconds * 1000, 1),
+            "retry_after_s": self.retry_after(),
+            "outcomes": dict(self.outcomes),
+        }
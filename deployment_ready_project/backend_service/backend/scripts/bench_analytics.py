@@ -0,0 +1,69 @@
+# bench_analytics.py
+# Time compute_class_analytics on a synthetic class (no database needed).
+#
+#   python scripts/bench_analytics.py --students 500 --sessions 120
+#
+# Each student attends each session with probability --attendance; the
+# reported time covers the matrix build, every metric and the conversion
+# of the result to plain Python values, i.e. what a cache miss costs after
+# the marks have been read.
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from analytics import compute_class_analytics  # noqa: E402
+
+
+def synthetic_class(students: int, sessions: int, attendance: float, seed: int):
+    rng = random.Random(seed)
+    student_ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(students)]
+    start = datetime(2025, 1, 6, 9, tzinfo=timezone.utc)
+    session_list = [(str(uuid.UUID(int=rng.getrandbits(128))), start + timedelta(days=i * 7 // 3))
+                    for i in range(sessions)]
+    mark_students, mark_sessions = [], []
+    for sid in student_ids:
+        for qr_id, _ in session_list:
+            if rng.random() < attendance:
+                mark_students.append(sid)
+                mark_sessions.append(qr_id)
+    names = {sid: f"Student {i}" for i, sid in enumerate(student_ids)}
+    return student_ids, names, session_list, mark_students, mark_sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-class attendance analytics")
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--sessions", type=int, default=120)
+    parser.add_argument("--attendance", type=float, default=0.7)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    student_ids, names, sessions, mark_students, mark_sessions = synthetic_class(
+        args.students, args.sessions, args.attendance, args.seed)
+    timings = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        result = compute_class_analytics("bench", student_ids, names, sessions, mark_students, mark_sessions)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    print(json.dumps({
+        "students": args.students,
+        "sessions": args.sessions,
+        "marks": len(mark_students),
+        "at_risk": len(result["at_risk"]),
+        "weeks": len(result["weekly_rates"]),
+        "median_ms": round(statistics.median(timings), 2),
+        "max_ms": round(max(timings), 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# bench_attendance_join.py
+# Round trips and latency of GET /attendance's student join: per-row find_one (old) vs one $lookup aggregation.
+#
+#   MONGO_URL=mongodb://localhost:27017 python scripts/bench_attendance_join.py --sizes 1000 10000
+#
+# Seeds a throwaway database (dropped afterwards), runs both variants against the
+# same query the teacher view issues and prints / writes JSON results.
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from db_joins import find_with_students  # noqa: E402
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts commands (find, aggregate, getMore, ...) sent to the server."""
+
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+async def seed(db, records: int, students: int, classes: int):
+    await db.users.create_index("id", unique=True)
+    await db.attendance.create_index("class_id")
+    student_ids = [str(uuid.uuid4()) for _ in range(students)]
+    class_ids = [str(uuid.uuid4()) for _ in range(classes)]
+    await db.users.insert_many([
+        {"id": sid, "name": f"Student {i}", "email": f"s{i}@bench.local", "role": "student",
+         "password": "x" * 60, "walletAddress": "0x" + uuid.uuid4().hex[:40]}
+        for i, sid in enumerate(student_ids)
+    ])
+    now = datetime.now(timezone.utc)
+    batch = []
+    for i in range(records):
+        batch.append({
+            "id": str(uuid.uuid4()),
+            "student_id": student_ids[i % students],
+            "student_name": f"Student {i % students}",
+            "class_id": class_ids[i % classes],
+            "class_name": "Bench class",
+            "qr_code_id": str(uuid.uuid4()),
+            "timestamp": now - timedelta(seconds=i),
+            "blockchain_hash": uuid.uuid4().hex * 2,
+            "verified": True,
+        })
+        if len(batch) == 5000:
+            await db.attendance.insert_many(batch)
+            batch = []
+    if batch:
+        await db.attendance.insert_many(batch)
+    return class_ids
+
+
+async def n_plus_one(db, query, limit):
+    records = await db.attendance.find(query).sort("timestamp", -1).to_list(limit)
+    for r in records:
+        student = await db.users.find_one({"id": r.get("student_id")})
+        r["student_wallet"] = student.get("walletAddress", "") if student else ""
+    return records
+
+
+async def joined(db, query, limit):
+    records = await find_with_students(db.attendance, query, sort={"timestamp": -1}, limit=limit)
+    for r in records:
+        student = r.pop("student", None) or {}
+        r["student_wallet"] = student.get("walletAddress", "")
+    return records
+
+
+async def measure(fn, db, query, limit, counter, repeat):
+    latencies, trips, rows = [], 0, 0
+    for _ in range(repeat):
+        before = counter.count
+        started = time.perf_counter()
+        rows = len(await fn(db, query, limit))
+        latencies.append((time.perf_counter() - started) * 1000)
+        trips = counter.count - before
+    return {
+        "rows": rows,
+        "round_trips": trips,
+        "latency_ms_median": round(statistics.median(latencies), 2),
+        "latency_ms_min": round(min(latencies), 2),
+    }
+
+
+async def run(args):
+    counter = CommandCounter()
+    client = AsyncIOMotorClient(args.mongo_url, event_listeners=[counter])
+    results = []
+    for size in args.sizes:
+        db = client[f"bench_attendance_join_{uuid.uuid4().hex[:8]}"]
+        try:
+            class_ids = await seed(db, size, students=max(1, size // 10), classes=args.classes)
+            # the teacher's default view: every class they teach
+            query = {"class_id": {"$in": class_ids}}
+            limit = args.limit or size
+            row = {"records": size, "limit": limit}
+            row["n_plus_one"] = await measure(n_plus_one, db, query, limit, counter, args.repeat)
+            row["aggregation"] = await measure(joined, db, query, limit, counter, args.repeat)
+            results.append(row)
+            print(json.dumps(row), flush=True)
+        finally:
+            await client.drop_database(db.name)
+    client.close()
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the GET /attendance student join")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--limit", type=int, default=0,
+                        help="rows returned per query (0 = all; the endpoint itself caps at 1000)")
+    parser.add_argument("--classes", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="bench-attendance-join.json")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# bench_metrics.py
+# Cost of the timing instrumentation per call, and per /attendance/mark request.
+#
+#   python scripts/bench_metrics.py --calls 200000 --request-ms 5
+#
+# Times Histogram.observe, a `with histogram.time(...)` span, the timed()
+# decorator around an empty coroutine, and one Mongo command through
+# MongoCommandTimer (started + succeeded events). The per-request figure
+# assumes what one mark does: --mongo-commands driver commands and
+# --spans decorated / spanned stages; it is compared against
+# --request-ms, the latency of the request itself (a mark with local
+# Mongo and no chain wait is a few milliseconds; real ones are slower).
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from metrics import MetricsRegistry, MongoCommandTimer, render  # noqa: E402
+
+
+def per_call_us(fn, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+async def per_await_us(fn, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        await fn()
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark metrics instrumentation overhead")
+    parser.add_argument("--calls", type=int, default=200000)
+    parser.add_argument("--mongo-commands", type=int, default=12)
+    parser.add_argument("--spans", type=int, default=4)
+    parser.add_argument("--request-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    registry = MetricsRegistry()
+    stages = registry.histogram("stage_seconds", "bench", ("stage", "outcome"))
+    mongo = registry.histogram("mongo_seconds", "bench", ("collection", "command", "outcome"))
+    timer = MongoCommandTimer(mongo)
+
+    def observe():
+        stages.observe(0.0042, ("ipfs_upload", "ok"))
+
+    def span():
+        with stages.time("qr_image", "ok"):
+            pass
+
+    started_event = SimpleNamespace(command_name="find", command={"find": "attendance"}, request_id=1,
+                                     connection_id=("localhost", 27017))
+    finished_event = SimpleNamespace(command_name="find", request_id=1, connection_id=("localhost", 27017),
+                                      duration_micros=850)
+
+    def mongo_command():
+        timer.started(started_event)
+        timer.succeeded(finished_event)
+
+    async def bare():
+        return 1
+
+    timed = stages.timed("mark")(bare)
+
+    result = {
+        "observe_us": round(per_call_us(observe, args.calls), 3),
+        "span_us": round(per_call_us(span, args.calls), 3),
+        "mongo_command_us": round(per_call_us(mongo_command, args.calls), 3),
+    }
+    bare_us = asyncio.run(per_await_us(bare, args.calls))
+    timed_us = asyncio.run(per_await_us(timed, args.calls))
+    result["timed_decorator_us"] = round(timed_us - bare_us, 3)
+
+    per_request = args.mongo_commands * result["mongo_command_us"] + args.spans * result["timed_decorator_us"]
+    result["per_request_us"] = round(per_request, 2)
+    result["per_request_overhead_pct"] = round(per_request / (args.request_ms * 1000) * 100, 3)
+
+    started = time.perf_counter()
+    text = render(registry.snapshot())
+    result["render_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    result["render_bytes"] = len(text)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# bench_qr_render.py
+# Renders per second for each QR output mode, cold and through the render cache.
+#
+#   python scripts/bench_qr_render.py --renders 300
+#
+# "legacy_png" is the previous generate_qr_code (qrcode's PIL image factory);
+# the png / svg / matrix modes are qr_render.render with the encoder's mask
+# search ("auto") and with a fixed mask (QR_MASK_PATTERN). Every cold render
+# uses distinct content; "cached" replays one rotation's worth of codes
+# through QRRenderer, as repeated polls of the same session would.
+import argparse
+import asyncio
+import base64
+import io
+import json
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import qrcode
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from qr_render import FORMATS, QRRenderer, render  # noqa: E402
+from qr_tokens import QRTokenSigner  # noqa: E402
+
+
+def sample_contents(count: int):
+    signer = QRTokenSigner(b"bench-key")
+    class_id = str(uuid.uuid4())
+    expires = datetime.now(timezone.utc) + timedelta(minutes=5)
+    return [signer.issue(class_id, str(uuid.uuid4()), expires) for _ in range(count)]
+
+
+def legacy_png(content: str) -> str:
+    qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=10, border=4)
+    qr.add_data(content)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+    buffered = io.BytesIO()
+    img.save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode()
+
+
+def rate(fn, contents) -> dict:
+    started = time.perf_counter()
+    size = 0
+    for content in contents:
+        out = fn(content)
+        size += len(out) if isinstance(out, str) else len(json.dumps(out))
+    elapsed = time.perf_counter() - started
+    return {"renders_per_s": round(len(contents) / elapsed, 1),
+            "avg_ms": round(elapsed / len(contents) * 1000, 3),
+            "avg_response_bytes": size // len(contents)}
+
+
+async def cached_rate(fmt: str, contents, lookups: int) -> dict:
+    renderer = QRRenderer(max_entries=len(contents))
+    try:
+        for content in contents:
+            await renderer.render(content, fmt)
+        started = time.perf_counter()
+        for i in range(lookups):
+            await renderer.render(contents[i % len(contents)], fmt)
+        elapsed = time.perf_counter() - started
+        return {"lookups_per_s": round(lookups / elapsed, 1), **renderer.stats()}
+    finally:
+        renderer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark QR rendering modes")
+    parser.add_argument("--renders", type=int, default=300)
+    parser.add_argument("--lookups", type=int, default=100000)
+    parser.add_argument("--mask-pattern", type=int, default=2)
+    parser.add_argument("--output", default="bench-qr-render.json")
+    args = parser.parse_args()
+
+    contents = sample_contents(args.renders)
+    result = {"renders": args.renders, "content_length": len(contents[0]),
+              "legacy_png": rate(legacy_png, contents)}
+    for fmt in FORMATS:
+        result[fmt] = {
+            "auto_mask": rate(lambda c: render(c, fmt), contents),
+            "fixed_mask": rate(lambda c: render(c, fmt, mask_pattern=args.mask_pattern), contents),
+            "cached": asyncio.run(cached_rate(fmt, contents[:4], args.lookups)),
+        }
+
+    print(json.dumps(result, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# bench_rate_limit.py
+# Per-request overhead of the rate limit middleware, driven in-process without a server.
+#
+#   python scripts/bench_rate_limit.py --requests 50000
+#
+# Every case calls the same trivial ASGI app through the middleware stack
+# and reports microseconds per request above calling the app directly:
+# "base_http_passthrough" is a do-nothing BaseHTTPMiddleware (what every
+# request used to pay), "unlimited_route" a request no policy matches, and
+# the other cases a limited route on each store and algorithm, spread
+# over --clients addresses. Pass --mongo-url to include the Mongo store.
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from starlette.middleware.base import BaseHTTPMiddleware
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from rate_limit import (MemoryStore, MongoStore, RateLimiter, RateLimitMiddleware,  # noqa: E402
+                        SharedMemoryStore, parse_policies)
+
+
+async def app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+class PassThrough(BaseHTTPMiddleware):
+    async def dispatch(self, request, call_next):
+        return await call_next(request)
+
+
+def receiver():
+    """The request body once, then block as a connected client would."""
+    delivered = False
+
+    async def receive():
+        nonlocal delivered
+        if not delivered:
+            delivered = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Future()
+
+    return receive
+
+
+async def send(message):
+    pass
+
+
+def scope(path: str, client: str) -> dict:
+    return {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+            "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+            "root_path": "", "headers": [(b"host", b"bench")], "client": (client, 50000),
+            "server": ("bench", 80)}
+
+
+async def per_request_us(handler, path: str, requests: int, clients: int, rounds: int = 5) -> float:
+    scopes = [scope(path, f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}") for i in range(clients)]
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for i in range(requests):
+            await handler(scopes[i % clients], receiver(), send)
+        timings.append((time.perf_counter() - started) / requests * 1e6)
+    return statistics.median(timings)
+
+
+async def run(args) -> dict:
+    # a limit no client reaches, so every request takes the full "allowed" path
+    spec = f"bench=/bench:{10 ** 9}/60"
+    baseline = await per_request_us(app, "/bench", args.requests, args.clients)
+    result = {"requests": args.requests, "clients": args.clients, "app_us": round(baseline, 2), "overhead_us": {}}
+    overhead = result["overhead_us"]
+
+    async def case(name, handler, path="/bench"):
+        overhead[name] = round(await per_request_us(handler, path, args.requests, args.clients) - baseline, 2)
+
+    await case("base_http_passthrough", PassThrough(app))
+    await case("unlimited_route", RateLimitMiddleware(app, RateLimiter(MemoryStore(), parse_policies(spec))),
+               path="/other")
+
+    shm_path = os.path.join(tempfile.gettempdir(), f"bench-rate-limit-{os.getpid()}")
+    stores = [("memory", MemoryStore(max_keys=args.clients * 2)), ("shared", SharedMemoryStore(shm_path))]
+    if args.mongo_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(args.mongo_url)
+        collection = client[args.db_name].bench_rate_limits
+        await collection.drop()
+        stores.append(("mongo", MongoStore(collection)))
+    try:
+        for store_name, store in stores:
+            for algorithm in ("sliding_window", "token_bucket"):
+                limiter = RateLimiter(store, parse_policies(f"{spec}:{algorithm}"))
+                await case(f"{store_name}_{algorithm}", RateLimitMiddleware(app, limiter))
+    finally:
+        for _, store in stores:
+            store.close()
+        os.remove(shm_path)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark rate limit middleware overhead")
+    parser.add_argument("--requests", type=int, default=50000)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--mongo-url", default=None)
+    parser.add_argument("--db-name", default="bench_rate_limit")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# bench_serialization.py
+# CPU time to turn a 1000-document listing into a JSON response body, before and after serializers.py.
+#
+#   python scripts/bench_serialization.py --docs 1000 --repeat 50
+#
+# "legacy" is the previous path: serialize_doc on each document (as read
+# without a projection, so with _id and the password hash), then FastAPI's
+# jsonable_encoder and JSONResponse's json.dumps. "shaped" is what the
+# endpoints do now: documents already projected by Mongo, the shape's
+# serializer and FastJSONResponse (orjson). Documents are synthetic and
+# shaped like real users / attendance rows; no database is needed.
+import argparse
+import json
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from serializers import (ATTENDANCE_SHAPE, ATTENDANCE_SUMMARY_SHAPE, USER_SHAPE,  # noqa: E402
+                         DocumentShape, FastJSONResponse)
+
+
+def serialize_doc(doc):
+    """The previous server.serialize_doc."""
+    if doc is None:
+        return None
+    if isinstance(doc, list):
+        return [serialize_doc(d) for d in doc]
+    if isinstance(doc, dict):
+        result = {}
+        for k, v in doc.items():
+            if k == "_id":
+                continue
+            elif isinstance(v, ObjectId):
+                result[k] = str(v)
+            elif isinstance(v, datetime):
+                result[k] = v.isoformat() if v.tzinfo else v.replace(tzinfo=timezone.utc).isoformat()
+            elif isinstance(v, dict):
+                result[k] = serialize_doc(v)
+            elif isinstance(v, list):
+                result[k] = [serialize_doc(i) if isinstance(i, (dict, ObjectId)) else i for i in v]
+            else:
+                result[k] = v
+        return result
+    if isinstance(doc, ObjectId):
+        return str(doc)
+    return doc
+
+
+def users(count: int):
+    now = datetime(2025, 3, 1, 9, 30)
+    return [{
+        "_id": ObjectId(), "id": str(uuid.uuid4()), "name": f"Student {i}", "email": f"s{i}@example.edu",
+        "password": "$2b$12$" + "x" * 53, "role": "student", "walletAddress": "0x" + "ab" * 20,
+        "created_at": now - timedelta(days=i), "dob": "2003-04-05", "rollNo": f"R{i:05d}",
+        "batchYear": "2022", "program": "B.Tech", "academicYear": "2024-25",
+    } for i in range(count)]
+
+
+def attendance(count: int):
+    now = datetime(2025, 3, 1, 9, 30)
+    class_id = str(uuid.uuid4())
+    return [{
+        "_id": ObjectId(), "id": str(uuid.uuid4()), "student_id": str(uuid.uuid4()), "student_name": f"Student {i}",
+        "class_id": class_id, "class_name": "Distributed Systems", "qr_code_id": str(uuid.uuid4()),
+        "timestamp": now - timedelta(minutes=i), "verified": True, "blockchain_hash": "f" * 64,
+        "blockchain_tx": "0x" + "e" * 64, "ipfs_cid": "bafy" + "k" * 55, "ipfs_status": "done",
+        "chain_status": "done", "ipfs_data": {"student_id": "s", "timestamp": now, "class_id": class_id},
+    } for i in range(count)]
+
+
+def projected(docs, shape: DocumentShape):
+    """What Mongo returns for the shape's projection."""
+    if shape.fields is not None:
+        return [{k: d[k] for k in shape.fields if k in d} for d in docs]
+    return [{k: v for k, v in d.items() if k not in shape.hidden} for d in docs]
+
+
+def legacy_body(docs) -> bytes:
+    return JSONResponse(jsonable_encoder(serialize_doc(docs))).body
+
+
+def legacy_summary_body(docs) -> bytes:
+    rows = []
+    for r in docs:
+        ts = r.get("timestamp")
+        ts = ts.replace(tzinfo=timezone.utc) if ts and ts.tzinfo is None else ts
+        rows.append({"id": r.get("id"), "student_id": r.get("student_id"), "student_name": r.get("student_name"),
+                     "class_id": r.get("class_id"), "class_name": r.get("class_name"),
+                     "timestamp": ts.isoformat() if ts else None, "blockchain_hash": r.get("blockchain_hash"),
+                     "blockchain_tx": r.get("blockchain_tx"), "ipfs_cid": r.get("ipfs_cid"),
+                     "qr_code_id": r.get("qr_code_id"), "verified": r.get("verified", True)})
+    return JSONResponse(jsonable_encoder(rows)).body
+
+
+def cpu_ms(fn, arg, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.process_time()
+        fn(arg)
+        timings.append((time.process_time() - started) * 1000)
+    return round(statistics.median(timings), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark listing serialization")
+    parser.add_argument("--docs", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    cases = {
+        "users": (users(args.docs), USER_SHAPE, legacy_body),
+        "attendance": (attendance(args.docs), ATTENDANCE_SHAPE, legacy_body),
+        "attendance_summary": (attendance(args.docs), ATTENDANCE_SUMMARY_SHAPE, legacy_summary_body),
+    }
+    result = {"docs": args.docs}
+    for name, (docs, shape, legacy) in cases.items():
+        shaped = projected(docs, shape)
+        old_body, new_body = legacy(docs), FastJSONResponse(shape.many(shaped)).body
+        # same content, except that the legacy listing also carried the hidden fields
+        expected = [{k: v for k, v in row.items() if k not in shape.hidden} for row in json.loads(old_body)]
+        assert expected == json.loads(new_body), f"{name}: responses differ"
+        before = cpu_ms(legacy, docs, args.repeat)
+        after = cpu_ms(lambda d: FastJSONResponse(shape.many(d)).body, shaped, args.repeat)
+        result[name] = {"legacy_cpu_ms": before, "shaped_cpu_ms": after,
+                        "speedup": round(before / after, 1) if after else None,
+                        "body_bytes": len(new_body)}
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
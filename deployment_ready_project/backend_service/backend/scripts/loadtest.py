@@ -0,0 +1,736 @@
+# loadtest.py
+# Offline load test of the FastAPI app: QR scan bursts, dashboard polling, login storms and CSV exports.
+#
+#   python scripts/loadtest.py --mongod "$(which mongod)" --students 300 --output loadtest.json
+#   python scripts/loadtest.py --mongod "$(which mongod)" --baseline loadtest-main.json --fail-on-regression
+#
+# Nothing leaves the machine. The app is imported and driven in-process through
+# httpx.ASGITransport (one event loop, like a single uvicorn worker minus HTTP
+# parsing), with:
+#   - MongoDB: a throwaway mongod started with --mongod (temporary dbpath), or
+#     MONGO_URL; the --db-name database is dropped and seeded on every run
+#   - IPFS: a stub HTTP server on a free port answering /api/v0/add (multipart,
+#     CIDs from local_cid) and /ipfs/<cid>[/<name>] from memory
+#   - Ethereum: scripts/stub_eth_runner.js (STUB_ETH_* latencies) through
+#     ETH_RUNNER_PATH; --eth runner uses server/eth_runner.js instead, e.g.
+#     against `npx hardhat node` with the contract deployed (ETH_RPC_URL,
+#     CONTRACT_ADDRESS)
+# Any other setting (ATTENDANCE_OUTBOX, CHAIN_BATCHING, IPFS_LOCAL_CID, ...) is
+# taken from the environment as usual and recorded in the report.
+#
+# Scenarios (--scenarios, in this order):
+#   scan_burst      --students scan one QR code within --scan-window seconds
+#                   (0: all at once, to find the ceiling); the teacher's screen
+#                   follows rotation via /attendance/qr/{id}/current and 202
+#                   "retry" answers are resent after Retry-After
+#   dashboard_poll  every teacher polls stats, the class page and analytics,
+#                   --student-pollers students their stats, every --poll-interval
+#   login_storm     --logins logins at once (bcrypt in the password pool)
+#   csv_export      --exports class CSV exports, --export-concurrency at a time
+#
+# The JSON report carries per scenario: throughput, status counts, latency
+# percentiles, CPU / RSS / event loop lag, and the server's own histograms
+# (metrics.py) as deltas over the scenario. The load generator shares the
+# process, so CPU figures include it. --baseline compares with an earlier
+# report and lists everything that got worse by more than --tolerance.
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from local_cid import compute_cid  # noqa: E402
+
+PASSWORD = "loadtest-password"
+SCENARIOS = ("scan_burst", "dashboard_poll", "login_storm", "csv_export")
+# settings that change what a scan costs; recorded so reports are only compared like for like
+SERVER_SETTINGS = (
+    "ATTENDANCE_OUTBOX", "CHAIN_BATCHING", "CHAIN_ANCHORING", "IPFS_LOCAL_CID", "IPFS_SESSION_BUNDLES",
+    "QR_SIGNED_TOKENS", "QR_ROTATION_SECONDS", "ETH_RUNNER_MODE", "ETH_RUNNER_POOL_SIZE",
+    "RATE_LIMIT_BACKEND", "USER_CACHE_TTL", "LEDGER_MAX_BATCH", "SCAN_MAX_WAIT",
+)
+
+
+# ==================== STUB IPFS ====================
+def parse_multipart(body: bytes, content_type: str):
+    """[(filename, data), ...] of a multipart/form-data body."""
+    match = re.search(r'boundary="?([^";]+)"?', content_type)
+    if not match:
+        return []
+    delimiter = b"--" + match.group(1).encode()
+    parts = []
+    for part in body.split(delimiter)[1:]:
+        if part.startswith(b"--"):
+            break
+        head, _, data = part.partition(b"\r\n\r\n")
+        name = re.search(rb'filename="([^"]*)"', head)
+        parts.append((unquote(name.group(1).decode()) if name else "", data[:-2] if data.endswith(b"\r\n") else data))
+    return parts
+
+
+class StubIPFS:
+    """
+    Just enough of a Kubo node: POST /api/v0/add answers one NDJSON line per
+    part (plus a directory entry with wrap-with-directory) and GET
+    /ipfs/<cid>[/<name>] serves what was added. Directory CIDs are made up.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.objects = {}
+        self.requests = Counter()
+        self._server = None
+        self.port = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _read_body(self, reader, headers) -> bytes:
+        if headers.get("transfer-encoding", "").lower() != "chunked":
+            return await reader.readexactly(int(headers.get("content-length") or 0))
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            chunk = await reader.readexactly(size + 2)
+            if size == 0:
+                return b"".join(chunks)
+            chunks.append(chunk[:-2])
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = await self._read_body(reader, headers)
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                status, content_type, payload = self.route(method, target, headers, body)
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                    f"Content-Length: {len(payload)}\r\n\r\n".encode("latin-1") + payload
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def route(self, method: str, target: str, headers: dict, body: bytes):
+        url = urlsplit(target)
+        if method == "POST" and url.path == "/api/v0/add":
+            self.requests["add"] += 1
+            query = parse_qs(url.query)
+            lines, entries = [], []
+            for name, data in parse_multipart(body, headers.get("content-type", "")):
+                cid = compute_cid(data)
+                self.objects[cid] = data
+                entries.append((name, cid, data))
+                lines.append({"Name": name, "Hash": cid, "Size": str(len(data))})
+            if query.get("wrap-with-directory") == ["true"]:
+                root = compute_cid("\n".join(f"{n} {c}" for n, c, _ in entries).encode())
+                for name, _, data in entries:
+                    self.objects[f"{root}/{name}"] = data
+                lines.append({"Name": "", "Hash": root, "Size": "0"})
+            return "200 OK", "application/json", "".join(json.dumps(line) + "\n" for line in lines).encode()
+        if method == "GET" and url.path.startswith("/ipfs/"):
+            self.requests["get"] += 1
+            data = self.objects.get(url.path[len("/ipfs/"):].strip("/"))
+            if data is not None:
+                return "200 OK", "application/octet-stream", data
+        return "404 Not Found", "text/plain", b"not found"
+
+
+# ==================== MONGOD ====================
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_mongod(binary: str, timeout: float = 30.0):
+    """A mongod on a free port with a temporary dbpath; returns (process, dbpath, url)."""
+    from pymongo import MongoClient
+
+    dbpath = tempfile.mkdtemp(prefix="loadtest-mongod-")
+    port = free_port()
+    proc = subprocess.Popen(
+        [binary, "--dbpath", dbpath, "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"mongodb://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            MongoClient(url, serverSelectionTimeoutMS=500).admin.command("ping")
+            return proc, dbpath, url
+        except Exception:
+            if proc.poll() is not None or time.monotonic() > deadline:
+                proc.kill()
+                shutil.rmtree(dbpath, ignore_errors=True)
+                raise RuntimeError(f"mongod did not come up on port {port}")
+            time.sleep(0.2)
+
+
+def stop_mongod(proc, dbpath: str):
+    proc.terminate()
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+    shutil.rmtree(dbpath, ignore_errors=True)
+
+
+# ==================== MEASUREMENT ====================
+def percentiles(samples):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 2)
+
+    return {"count": len(ordered), "p50_ms": pct(0.50), "p90_ms": pct(0.90), "p95_ms": pct(0.95),
+            "p99_ms": pct(0.99), "max_ms": round(ordered[-1], 2), "mean_ms": round(statistics.mean(ordered), 2)}
+
+
+class Recorder:
+    """Latency and status of every request of one scenario (or one request kind within it)."""
+
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.bytes = 0
+
+    async def request(self, client: httpx.AsyncClient, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            resp = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.statuses[type(e).__name__] += 1
+            return None
+        self.latencies.append((time.perf_counter() - started) * 1000)
+        self.statuses[str(resp.status_code)] += 1
+        self.bytes += len(resp.content)
+        return resp
+
+    def report(self, elapsed: float) -> dict:
+        total = sum(self.statuses.values())
+        ok = sum(n for status, n in self.statuses.items() if status.startswith("2"))
+        return {
+            "requests": total,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_rps": round(total / elapsed, 2) if elapsed else None,
+            "ok_rps": round(ok / elapsed, 2) if elapsed else None,
+            "statuses": dict(sorted(self.statuses.items())),
+            "latency": percentiles(self.latencies),
+            "response_bytes": self.bytes,
+        }
+
+
+def _proc_stat(pid):
+    """(ppid, cpu seconds) of a process from /proc; None where there is no /proc."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except (OSError, IndexError):
+        return None
+    return int(fields[1]), (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def children_cpu_seconds():
+    """CPU used so far by live child processes: password hashing workers, node runners, mongod."""
+    me = os.getpid()
+    total = 0.0
+    try:
+        pids = [p for p in os.listdir("/proc") if p.isdigit()]
+    except OSError:
+        return None
+    for pid in pids:
+        stat = _proc_stat(pid)
+        if stat and stat[0] == me:
+            total += stat[1]
+    return total
+
+
+class ResourceSampler:
+    """CPU of this process and its children, peak RSS, and event loop lag sampled every `interval`."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+
+    async def _sample_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - expected) * 1000)
+
+    def start(self):
+        self.lags = []
+        self.wall = time.perf_counter()
+        self.usage = resource.getrusage(resource.RUSAGE_SELF)
+        self.children = children_cpu_seconds()
+        self._task = asyncio.create_task(self._sample_lag())
+
+    async def stop(self) -> dict:
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        wall = time.perf_counter() - self.wall
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        user = usage.ru_utime - self.usage.ru_utime
+        system = usage.ru_stime - self.usage.ru_stime
+        children = children_cpu_seconds()
+        return {
+            "cpu_user_s": round(user, 3),
+            "cpu_system_s": round(system, 3),
+            "cpu_s": round(user + system, 3),
+            "cpu_percent": round((user + system) / wall * 100, 1) if wall else None,
+            "children_cpu_s": round(children - self.children, 3) if children is not None else None,
+            # ru_maxrss is KiB on Linux; a process-lifetime peak, so it only ever grows between scenarios
+            "max_rss_mb": round(usage.ru_maxrss / 1024, 1),
+            "loop_lag": percentiles(self.lags),
+        }
+
+
+def estimate_quantile(buckets, counts, q):
+    """Upper bound of the bucket holding quantile q (None past the last bucket)."""
+    total = sum(counts)
+    if not total:
+        return None
+    running = 0
+    for bound, count in zip(buckets, counts):
+        running += count
+        if running >= q * total:
+            return round(bound * 1000, 2)
+    return None
+
+
+def histogram_deltas(before: dict, after: dict) -> dict:
+    """Per histogram and label set: observations during the scenario, mean and bucket-estimated p50 / p95."""
+    out = {}
+    for name, metric in after.items():
+        if metric["type"] != "histogram":
+            continue
+        previous = {tuple(labels): values for labels, values in before.get(name, {}).get("series", [])}
+        rows = []
+        for labels, values in metric["series"]:
+            old = previous.get(tuple(labels))
+            delta = values if old is None else [a - b for a, b in zip(values, old)]
+            count = sum(delta[:-1])
+            if not count:
+                continue
+            rows.append({
+                "labels": dict(zip(metric["labelnames"], labels)),
+                "count": count,
+                "mean_ms": round(delta[-1] / count * 1000, 2),
+                "p50_le_ms": estimate_quantile(metric["buckets"], delta[:-1], 0.50),
+                "p95_le_ms": estimate_quantile(metric["buckets"], delta[:-1], 0.95),
+            })
+        if rows:
+            out[name] = sorted(rows, key=lambda r: -r["count"] * r["mean_ms"])
+    return out
+
+
+# ==================== SEEDING ====================
+async def seed(server, args) -> dict:
+    """Teachers with one class each, every student enrolled everywhere, --history-sessions past sessions per class."""
+    rng = random.Random(args.seed)
+    password_hash = await server.hash_password(PASSWORD)
+    teachers = [server.User(name=f"Teacher {i}", email=f"teacher{i}@loadtest.example.com", password=password_hash,
+                            role="teacher") for i in range(args.teachers)]
+    students = [server.User(name=f"Student {i}", email=f"student{i}@loadtest.example.com", password=password_hash,
+                            rollNo=f"LT{i:05d}") for i in range(args.students)]
+    await server.db.users.insert_many([u.dict() for u in teachers + students])
+
+    student_ids = [s.id for s in students]
+    classes = [server.Class(name=f"Load Test {i}", code=f"LT{i:03d}", teacher_id=t.id, students_enrolled=student_ids)
+               for i, t in enumerate(teachers)]
+    await server.db.classes.insert_many([c.dict() for c in classes])
+
+    now = datetime.now(timezone.utc)
+    batch = []
+    for cls in classes:
+        for session in range(args.history_sessions):
+            qr_id = str(uuid.uuid4())
+            started = now - timedelta(days=args.history_sessions - session)
+            for student in students:
+                if rng.random() > args.history_attendance:
+                    continue
+                batch.append({
+                    "id": str(uuid.uuid4()), "student_id": student.id, "student_name": student.name,
+                    "class_id": cls.id, "class_name": cls.name, "qr_code_id": qr_id,
+                    "timestamp": started + timedelta(seconds=rng.uniform(0, 600)), "verified": True,
+                    "blockchain_hash": uuid.uuid4().hex, "ipfs_status": "done", "chain_status": "done",
+                })
+                if len(batch) >= 5000:
+                    await server.db.attendance.insert_many(batch, ordered=False)
+                    batch = []
+    if batch:
+        await server.db.attendance.insert_many(batch, ordered=False)
+    await server.dashboard_stats.rebuild()
+
+    def token(user):
+        return server.create_access_token({"sub": user.email}, expires_delta=timedelta(hours=6))
+
+    return {
+        "teachers": [{"id": t.id, "email": t.email, "token": token(t), "class_id": c.id}
+                     for t, c in zip(teachers, classes)],
+        "students": [{"id": s.id, "email": s.email, "token": token(s)} for s in students],
+        "attendance_rows": await server.db.attendance.count_documents({}),
+    }
+
+
+def bearer(user: dict) -> dict:
+    return {"Authorization": f"Bearer {user['token']}"}
+
+
+# ==================== SCENARIOS ====================
+async def scan_burst(client, users, args, rng) -> dict:
+    teacher = users["teachers"][0]
+    setup = Recorder()
+    resp = await setup.request(client, "POST", "/api/attendance/generate-qr",
+                               json={"class_id": teacher["class_id"]}, headers=bearer(teacher))
+    if resp is None or resp.status_code != 200:
+        return {"error": "could not start a QR session", "setup": setup.report(1.0)}
+    qr = resp.json()
+    current = {"qr_content": qr["qr_content"]}
+
+    display = Recorder()
+    done = asyncio.Event()
+
+    async def teacher_screen():
+        # the projector refreshes when the code rotates, as the frontend does
+        rotation = qr.get("rotation_seconds")
+        while rotation and not done.is_set():
+            try:
+                await asyncio.wait_for(done.wait(), timeout=rotation)
+            except asyncio.TimeoutError:
+                pass
+            if done.is_set():
+                break
+            r = await display.request(client, "GET", f"/api/attendance/qr/{qr['qr_id']}/current",
+                                      params={"format": "png"}, headers=bearer(teacher))
+            if r is not None and r.status_code == 200:
+                current["qr_content"] = r.json()["qr_content"]
+
+    scans = Recorder()
+    outcomes = Counter()
+
+    async def scan(student, delay):
+        await asyncio.sleep(delay)
+        content = current["qr_content"]
+        for _ in range(6):
+            r = await scans.request(client, "POST", "/api/attendance/mark",
+                                    json={"qr_content": content}, headers=bearer(student))
+            if r is None or r.status_code != 202 or r.json().get("status") != "retry":
+                break
+            # admission control turned the scan away; resend after Retry-After like the app does
+            outcomes["retry"] += 1
+            content = r.json().get("qr_content") or content
+            await asyncio.sleep(float(r.headers.get("retry-after") or 1))
+        if r is not None and r.status_code == 200:
+            outcomes[r.json().get("status", "unknown")] += 1
+
+    screen = asyncio.create_task(teacher_screen())
+    started = time.perf_counter()
+    await asyncio.gather(*(scan(s, rng.uniform(0, args.scan_window)) for s in users["students"]))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await screen
+    return {
+        **scans.report(elapsed),
+        "offered_rps": round(len(users["students"]) / args.scan_window, 2) if args.scan_window else None,
+        "outcomes": dict(outcomes),
+        "generate_qr_ms": round(setup.latencies[0], 2) if setup.latencies else None,
+        "qr_display": display.report(elapsed),
+    }
+
+
+async def dashboard_poll(client, users, args, rng) -> dict:
+    kinds = {name: Recorder() for name in ("teacher_stats", "class_attendance", "class_analytics", "student_stats")}
+    deadline = time.perf_counter() + args.poll_duration
+
+    async def teacher(user):
+        await asyncio.sleep(rng.uniform(0, args.poll_interval))
+        while time.perf_counter() < deadline:
+            await asyncio.gather(
+                kinds["teacher_stats"].request(client, "GET", "/api/dashboard/teacher-stats", headers=bearer(user)),
+                kinds["class_attendance"].request(client, "GET", f"/api/attendance/class/{user['class_id']}",
+                                                  params={"limit": 50}, headers=bearer(user)),
+                kinds["class_analytics"].request(client, "GET", f"/api/analytics/class/{user['class_id']}",
+                                                 headers=bearer(user)),
+            )
+            await asyncio.sleep(args.poll_interval)
+
+    async def student(user):
+        await asyncio.sleep(rng.uniform(0, args.poll_interval))
+        while time.perf_counter() < deadline:
+            await kinds["student_stats"].request(client, "GET", "/api/dashboard/student-stats", headers=bearer(user))
+            await asyncio.sleep(args.poll_interval)
+
+    pollers = users["students"][:args.student_pollers]
+    started = time.perf_counter()
+    await asyncio.gather(*(teacher(u) for u in users["teachers"]), *(student(u) for u in pollers))
+    elapsed = time.perf_counter() - started
+
+    combined = Recorder()
+    for recorder in kinds.values():
+        combined.latencies += recorder.latencies
+        combined.statuses.update(recorder.statuses)
+        combined.bytes += recorder.bytes
+    return {**combined.report(elapsed), "by_endpoint": {k: r.report(elapsed) for k, r in kinds.items()}}
+
+
+async def login_storm(client, users, args, rng) -> dict:
+    logins = Recorder()
+    accounts = [(u["email"], "student") for u in users["students"]] or [(users["teachers"][0]["email"], "teacher")]
+
+    async def login(i):
+        email, role = accounts[i % len(accounts)]
+        await logins.request(client, "POST", "/api/auth/login",
+                             json={"email": email, "password": PASSWORD, "role": role})
+
+    started = time.perf_counter()
+    await asyncio.gather(*(login(i) for i in range(args.logins)))
+    return logins.report(time.perf_counter() - started)
+
+
+async def csv_export(client, users, args, rng) -> dict:
+    exports = Recorder()
+    semaphore = asyncio.Semaphore(args.export_concurrency)
+
+    async def export(i):
+        teacher = users["teachers"][i % len(users["teachers"])]
+        async with semaphore:
+            await exports.request(client, "GET", f"/api/attendance/class/{teacher['class_id']}/export-csv",
+                                  headers=bearer(teacher))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(export(i) for i in range(args.exports)))
+    return exports.report(time.perf_counter() - started)
+
+
+# ==================== REPORT ====================
+def git_revision() -> dict:
+    def git(*cmd):
+        try:
+            return subprocess.run(["git", *cmd], cwd=BACKEND_DIR, capture_output=True, text=True,
+                                  timeout=10).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+    return {"commit": git("rev-parse", "HEAD") or None, "dirty": bool(git("status", "--porcelain", "--", "."))}
+
+
+COMPARED = (
+    # (path in a scenario report, higher is better)
+    ("throughput_rps", True),
+    ("ok_rps", True),
+    ("latency.p50_ms", False),
+    ("latency.p95_ms", False),
+    ("latency.p99_ms", False),
+    ("resources.cpu_s", False),
+    ("resources.loop_lag.p99_ms", False),
+)
+
+
+def _lookup(report: dict, path: str):
+    for key in path.split("."):
+        if not isinstance(report, dict):
+            return None
+        report = report.get(key)
+    return report if isinstance(report, (int, float)) else None
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> dict:
+    rows = []
+    for name, current in result["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        for path, higher_is_better in COMPARED:
+            old, new = _lookup(previous, path), _lookup(current, path)
+            if old is None or new is None or old == 0:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            rows.append({"scenario": name, "metric": path, "baseline": old, "current": new,
+                         "change": round(change, 4), "regression": worse > tolerance})
+    return {
+        "baseline_commit": baseline.get("git", {}).get("commit"),
+        "tolerance": tolerance,
+        "metrics": rows,
+        "regressions": [f"{r['scenario']}.{r['metric']}" for r in rows if r["regression"]],
+    }
+
+
+# ==================== MAIN ====================
+def configure_environment(args, ipfs: StubIPFS, mongo_url: str):
+    """Everything server.py reads at import time; values already set in the environment win over .env."""
+    os.environ["MONGO_URL"] = mongo_url
+    os.environ["DB_NAME"] = args.db_name
+    os.environ["IPFS_API_URL"] = ipfs.url
+    os.environ["IPFS_GATEWAY_URL"] = ipfs.url
+    os.environ["PINATA_JWT"] = ""            # never reach Pinata, even if .env has a token
+    os.environ["LOG_TO_FILE"] = "false"
+    if not args.keep_rate_limits:
+        # every in-process request comes from the same address
+        os.environ["RATE_LIMIT_POLICIES"] = ""
+    if args.eth == "stub":
+        os.environ["ETH_RUNNER_PATH"] = str(BACKEND_DIR / "scripts" / "stub_eth_runner.js")
+
+
+async def run(args):
+    ipfs = StubIPFS(latency=args.ipfs_latency_ms / 1000)
+    await ipfs.start()
+    mongod = None
+    if args.mongod:
+        mongod = await asyncio.to_thread(start_mongod, args.mongod)
+        mongo_url = mongod[2]
+    else:
+        mongo_url = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+    configure_environment(args, ipfs, mongo_url)
+
+    try:
+        import server
+
+        logging.getLogger().setLevel(args.log_level.upper())
+        await server.client.drop_database(args.db_name)
+        rng = random.Random(args.seed)
+        result = {
+            "schema": 1,
+            "git": git_revision(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+            "config": {
+                **{k: v for k, v in vars(args).items() if k not in ("output", "baseline", "mongod")},
+                "server": {name: getattr(server, name, None) for name in SERVER_SETTINGS},
+                "scan_admission": {k: v for k, v in server.scan_admission.stats().items()
+                                   if k in ("enabled", "max_active", "session_max_active", "max_queued",
+                                            "session_max_queued")},
+                "stub_eth": {k: v for k, v in os.environ.items() if k.startswith("STUB_ETH_")},
+            },
+            "scenarios": {},
+        }
+
+        async with server.app.router.lifespan_context(server.app):
+            started = time.perf_counter()
+            users = await seed(server, args)
+            result["seed"] = {"seconds": round(time.perf_counter() - started, 2),
+                              "attendance_rows": users["attendance_rows"]}
+
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=300) as client:
+                scenarios = {"scan_burst": scan_burst, "dashboard_poll": dashboard_poll,
+                             "login_storm": login_storm, "csv_export": csv_export}
+                for name in args.scenarios:
+                    sampler = ResourceSampler()
+                    before = server.metrics.snapshot()
+                    sampler.start()
+                    report = await scenarios[name](client, users, args, rng)
+                    report["resources"] = await sampler.stop()
+                    report["server_metrics"] = histogram_deltas(before, server.metrics.snapshot())
+                    result["scenarios"][name] = report
+                    print(f"{name}: {report.get('requests')} requests, "
+                          f"{report.get('throughput_rps')} rps, p95 {report.get('latency', {}).get('p95_ms')} ms",
+                          file=sys.stderr)
+        result["stub_ipfs_requests"] = dict(ipfs.requests)
+        if not args.keep_db:
+            await server.client.drop_database(args.db_name)
+    finally:
+        await ipfs.stop()
+        if mongod is not None:
+            await asyncio.to_thread(stop_mongod, mongod[0], mongod[1])
+
+    if args.baseline:
+        result["comparison"] = compare(result, json.loads(Path(args.baseline).read_text()), args.tolerance)
+
+    text = json.dumps(result, indent=2, default=str)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test of the attendance backend")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        type=lambda s: [x for x in s.split(",") if x])
+    parser.add_argument("--mongod", help="mongod binary to start with a temporary dbpath (default: use MONGO_URL)")
+    parser.add_argument("--db-name", default="attendance_loadtest", help="dropped at start and end of the run")
+    parser.add_argument("--keep-db", action="store_true")
+    parser.add_argument("--eth", choices=("stub", "runner"), default="stub",
+                        help="stub: scripts/stub_eth_runner.js; runner: server/eth_runner.js (e.g. Hardhat)")
+    parser.add_argument("--ipfs-latency-ms", type=float, default=5.0)
+    parser.add_argument("--teachers", type=int, default=10)
+    parser.add_argument("--students", type=int, default=300)
+    parser.add_argument("--history-sessions", type=int, default=20, help="past sessions seeded per class")
+    parser.add_argument("--history-attendance", type=float, default=0.85, help="share of students at each")
+    parser.add_argument("--scan-window", type=float, default=10.0, help="seconds over which the students scan")
+    parser.add_argument("--poll-interval", type=float, default=2.0)
+    parser.add_argument("--poll-duration", type=float, default=20.0)
+    parser.add_argument("--student-pollers", type=int, default=50)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--exports", type=int, default=20)
+    parser.add_argument("--export-concurrency", type=int, default=5)
+    parser.add_argument("--keep-rate-limits", action="store_true",
+                        help="keep RATE_LIMIT_POLICIES (all requests share one client address)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--log-level", default="warning")
+    parser.add_argument("--output", default="loadtest.json")
+    parser.add_argument("--baseline", help="earlier report to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="relative change counted as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    result = asyncio.run(run(args))
+    if args.fail_on_regression and result.get("comparison", {}).get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
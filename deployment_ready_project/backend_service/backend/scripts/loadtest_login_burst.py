@@ -0,0 +1,146 @@
+# loadtest_login_burst.py
+# Latency of an ordinary authenticated endpoint before and during a login burst.
+#
+#   python scripts/loadtest_login_burst.py --base-url http://localhost:8001 --logins 300 --concurrency 100
+#
+# Registers --users throwaway students (reused on later runs), measures the probe
+# endpoint alone, then again while --logins logins are fired --concurrency at a
+# time. With bcrypt off the event loop the probe percentiles should stay flat;
+# logins beyond PASSWORD_HASH_MAX_WAITING come back as 429. Each request carries
+# its own X-Forwarded-For so the per-IP auth rate limit does not mask the result;
+# the server only honours it from a trusted proxy, so start it with
+# RATE_LIMIT_TRUSTED_PROXIES=127.0.0.1 (or the address this script connects
+# from), or with RATE_LIMIT_POLICIES="" to switch rate limiting off. Logins
+# refused by the rate limiter are counted apart as "rate_limited".
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+import httpx
+
+PASSWORD = "loadtest-password"
+
+
+def client_ip(i: int) -> dict:
+    return {"X-Forwarded-For": f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}"}
+
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 2)
+
+    return {"count": len(ordered), "p50_ms": pct(0.50), "p95_ms": pct(0.95), "p99_ms": pct(0.99),
+            "max_ms": round(ordered[-1], 2), "mean_ms": round(statistics.mean(ordered), 2)}
+
+
+async def ensure_users(client, api, count):
+    emails = [f"loadtest{i}@loadtest.example.com" for i in range(count)]
+    token = None
+    for i, email in enumerate(emails):
+        resp = await client.post(f"{api}/auth/register", json={
+            "name": f"Load Test {i}", "email": email, "password": PASSWORD,
+        }, headers=client_ip(i))
+        if resp.status_code == 200 and token is None:
+            token = resp.json()["access_token"]
+    if token is None:
+        resp = await client.post(f"{api}/auth/login", json={"email": emails[0], "password": PASSWORD},
+                                 headers=client_ip(0))
+        resp.raise_for_status()
+        token = resp.json()["access_token"]
+    return emails, token
+
+
+async def probe(client, url, token, stop: asyncio.Event, interval: float):
+    samples = []
+    headers = {"Authorization": f"Bearer {token}"}
+    while not stop.is_set():
+        started = time.perf_counter()
+        resp = await client.get(url, headers=headers)
+        if resp.status_code == 200:
+            samples.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(interval)
+    return samples
+
+
+async def burst(client, api, emails, logins, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = Counter()
+    latencies = []
+    rate_limited = 0
+
+    async def login(i):
+        nonlocal rate_limited
+        async with semaphore:
+            started = time.perf_counter()
+            resp = await client.post(f"{api}/auth/login", json={
+                "email": emails[i % len(emails)], "password": PASSWORD,
+            }, headers=client_ip(100000 + i))
+            statuses[resp.status_code] += 1
+            if resp.status_code == 429 and "Rate limit" in resp.json().get("detail", ""):
+                rate_limited += 1
+            elif resp.status_code == 200:
+                latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(login(i) for i in range(logins)))
+    if rate_limited:
+        print(f"warning: {rate_limited} login(s) refused by the rate limiter; "
+              "is RATE_LIMIT_TRUSTED_PROXIES set on the server?", file=sys.stderr)
+    return {"statuses": dict(statuses), "rate_limited": rate_limited,
+            "elapsed_s": round(time.perf_counter() - started, 2), "login_latency": percentiles(latencies)}
+
+
+async def run(args):
+    api = args.base_url.rstrip("/") + "/api"
+    limits = httpx.Limits(max_connections=args.concurrency + 10)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        emails, token = await ensure_users(client, api, args.users)
+        probe_url = f"{api}{args.probe}"
+
+        stop = asyncio.Event()
+        task = asyncio.create_task(probe(client, probe_url, token, stop, args.probe_interval))
+        await asyncio.sleep(args.baseline_seconds)
+        stop.set()
+        baseline = await task
+
+        stop = asyncio.Event()
+        task = asyncio.create_task(probe(client, probe_url, token, stop, args.probe_interval))
+        logins = await burst(client, api, emails, args.logins, args.concurrency)
+        stop.set()
+        during = await task
+
+    result = {
+        "probe": args.probe,
+        "baseline": percentiles(baseline),
+        "during_burst": percentiles(during),
+        "logins": logins,
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Probe endpoint latency under a login burst")
+    parser.add_argument("--base-url", default="http://localhost:8001")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--logins", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--probe", default="/dashboard/student-stats")
+    parser.add_argument("--probe-interval", type=float, default=0.02)
+    parser.add_argument("--baseline-seconds", type=float, default=5.0)
+    parser.add_argument("--output", default="loadtest-login-burst.json")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+# rebuild_dashboard_stats.py
+# Recompute the materialized student / teacher dashboard counters from classes and attendance.
+#
+#   MONGO_URL=mongodb://localhost:27017 python scripts/rebuild_dashboard_stats.py
+#
+# Same job as POST /api/admin/dashboard-stats/rebuild. Builds into staging
+# collections and swaps them in; counter updates made while it runs are lost,
+# so run it when nobody is marking attendance.
+import argparse
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from dashboard_stats import DashboardStats  # noqa: E402
+
+
+async def run(args):
+    client = AsyncIOMotorClient(args.mongo_url)
+    try:
+        result = await DashboardStats(client[args.db_name], recent=args.recent).rebuild()
+        print(json.dumps(result, indent=2, default=str))
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild materialized dashboard stats")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db-name", default=os.environ.get("DB_NAME", "blockchain_attendance"))
+    parser.add_argument("--recent", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
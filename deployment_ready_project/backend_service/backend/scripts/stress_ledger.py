@@ -0,0 +1,145 @@
+# stress_ledger.py
+# Concurrent append stress test for LedgerSequencer: checks gap-free numbering and unforked previous_hash links.
+#
+#   MONGO_URL=mongodb://localhost:27017 python scripts/stress_ledger.py --appends 20000 --writers 4 --concurrency 500
+#
+# Each "writer" is a separate Motor client with its own sequencer, standing in for
+# a uvicorn worker. Runs against a throwaway database that is dropped afterwards;
+# exits non-zero if the resulting chain is not 1..N with every link intact.
+# --crash-rate makes that fraction of batch inserts fail after the numbers are
+# reserved (a worker dying mid-commit); a fresh sequencer is then started, as a
+# restarted worker would be, and its repair must close every gap.
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from ledger import GENESIS_HASH, LedgerSequencer  # noqa: E402
+
+
+async def verify(collection, expected: int) -> list:
+    problems = []
+    prev_hash, number = GENESIS_HASH, 0
+    cursor = collection.find({}, {"_id": 0, "block_number": 1, "hash": 1, "previous_hash": 1}).sort("block_number", 1)
+    async for block in cursor:
+        number += 1
+        if block["block_number"] != number:
+            problems.append(f"expected block {number}, found {block['block_number']}")
+            number = block["block_number"]
+        if block["previous_hash"] != prev_hash:
+            problems.append(f"block {block['block_number']} links to {block['previous_hash'][:12]}, not {prev_hash[:12]}")
+        prev_hash = block["hash"]
+        if len(problems) > 20:
+            break
+    if number != expected:
+        problems.append(f"expected {expected} blocks, found {number}")
+    return problems
+
+
+class CrashingSequencer(LedgerSequencer):
+    """Fails `crash_rate` of its inserts outright, leaving the reservation behind."""
+
+    crash_rate = 0.0
+
+    async def _insert(self, blocks):
+        if random.random() < self.crash_rate:
+            raise ConnectionError("simulated worker crash after reserving")
+        await super()._insert(blocks)
+
+    async def repair(self) -> int:
+        if self.crash_rate:
+            return 0  # a crashed worker does not get to clean up; the restart does
+        return await super().repair()
+
+
+async def run(args):
+    db_name = f"stress_ledger_{uuid.uuid4().hex[:8]}"
+    clients = [AsyncIOMotorClient(args.mongo_url) for _ in range(args.writers)]
+    CrashingSequencer.crash_rate = args.crash_rate
+    sequencers = [
+        CrashingSequencer(c[db_name].blockchain, c[db_name].counters, max_batch=args.max_batch)
+        for c in clients
+    ]
+    try:
+        for seq in sequencers:
+            await seq.start()
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+        latencies = []
+
+        async def append(i: int):
+            data = {"action": "attendance_marked", "attendance_id": str(uuid.uuid4()), "n": i}
+            block = {"id": str(uuid.uuid4()),
+                     "hash": hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest(),
+                     "data": data}
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    await sequencers[i % args.writers].append(block)
+                except ConnectionError:
+                    return
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(append(i) for i in range(args.appends)))
+        elapsed = time.perf_counter() - started
+
+        repaired = 0
+        if args.crash_rate:
+            restarted = LedgerSequencer(clients[0][db_name].blockchain, clients[0][db_name].counters)
+            await restarted.start()
+            repaired = restarted.repaired
+            await restarted.stop()
+        problems = await verify(clients[0][db_name].blockchain, args.appends)
+        latencies.sort()
+        result = {
+            "appends": args.appends,
+            "writers": args.writers,
+            "concurrency": args.concurrency,
+            "elapsed_s": round(elapsed, 3),
+            "appends_per_s": round(args.appends / elapsed, 1),
+            "crash_rate": args.crash_rate,
+            "failed_appends": sum(s.failed for s in sequencers),
+            "repaired_on_restart": repaired,
+            "append_latency_ms_p50": round(latencies[len(latencies) // 2] * 1000, 2),
+            "append_latency_ms_p99": round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+            "sequencers": [s.stats() for s in sequencers],
+            "chain_ok": not problems,
+            "problems": problems,
+        }
+        print(json.dumps(result, indent=2))
+        if args.output:
+            Path(args.output).write_text(json.dumps(result, indent=2))
+        return 0 if not problems else 1
+    finally:
+        for seq in sequencers:
+            await seq.stop()
+        await clients[0].drop_database(db_name)
+        for c in clients:
+            c.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress-test concurrent ledger appends")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--appends", type=int, default=20000)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--max-batch", type=int, default=256)
+    parser.add_argument("--crash-rate", type=float, default=0.0,
+                        help="fraction of batch inserts that fail after reserving their numbers")
+    parser.add_argument("--output", default="stress-ledger.json")
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
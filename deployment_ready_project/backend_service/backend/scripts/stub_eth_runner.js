@@ -0,0 +1,227 @@
+#!/usr/bin/env node
+
+/**
+ * Stand-in for server/eth_runner.js used by scripts/loadtest.py
+ * Usage: node stub_eth_runner.js <action> <json_payload>
+ *        node stub_eth_runner.js --daemon
+ *
+ * Speaks the same one-shot and daemon protocols and returns the same result
+ * shapes, but keeps sessions and marks in memory and simulates chain latency
+ * instead of talking to a node:
+ *
+ *   STUB_ETH_CALL_MS   view calls (isSessionValid, hasAttended, ...)    default 2
+ *   STUB_ETH_SEND_MS   signing + eth_sendRawTransaction                 default 5
+ *   STUB_ETH_MINE_MS   time to be mined with automining                 default 20
+ *   STUB_ETH_BLOCK_MS  > 0: interval mining, receipts arrive at the next
+ *                      block boundary (like `hardhat node --block-time`) default 0
+ *
+ * State is per process: with ETH_RUNNER_POOL_SIZE > 1 or spawn mode every
+ * session is reported valid, as the real contract would after createSession.
+ */
+
+const crypto = require('crypto');
+const readline = require('readline');
+const { performance } = require('perf_hooks');
+
+const CALL_MS = Number(process.env.STUB_ETH_CALL_MS || 2);
+const SEND_MS = Number(process.env.STUB_ETH_SEND_MS || 5);
+const MINE_MS = Number(process.env.STUB_ETH_MINE_MS || 20);
+const BLOCK_MS = Number(process.env.STUB_ETH_BLOCK_MS || 0);
+
+const sessions = new Map();   // sessionCode -> { classId, expiresAt }
+const attended = new Set();   // `${sessionCode}|${studentId}`
+const anchors = new Set();
+let blockNumber = 1;
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+/**
+ * Simulated transaction: send, then wait to be mined; fills in the same
+ * send_ms / wait_ms timings as the real runner's confirm()
+ */
+async function transact(timings) {
+    await sleep(SEND_MS);
+    const sent = performance.now();
+    if (timings) {
+        timings.send_ms = sent - timings.started;
+    }
+    if (BLOCK_MS > 0) {
+        await sleep(BLOCK_MS - (Date.now() % BLOCK_MS));
+    } else {
+        await sleep(MINE_MS);
+    }
+    if (timings) {
+        timings.wait_ms = performance.now() - sent;
+    }
+    return {
+        hash: '0x' + crypto.randomBytes(32).toString('hex'),
+        blockNumber: BLOCK_MS > 0 ? Math.floor(Date.now() / BLOCK_MS) : blockNumber++
+    };
+}
+
+function sessionValid(sessionCode) {
+    const session = sessions.get(sessionCode);
+    return !session || session.expiresAt > Date.now();
+}
+
+function require_(payload, fields) {
+    const missing = fields.filter((f) => payload[f] === undefined || payload[f] === null || payload[f] === '');
+    if (missing.length) {
+        throw new Error(`Missing required fields: ${fields.join(', ')}`);
+    }
+}
+
+const ACTIONS = {
+    async createSession(payload, timings) {
+        require_(payload, ['sessionCode', 'classId']);
+        const { sessionCode, classId, durationMinutes = 30 } = payload;
+        const receipt = await transact(timings);
+        sessions.set(sessionCode, { classId, expiresAt: Date.now() + durationMinutes * 60000 });
+        return { success: true, txHash: receipt.hash, blockNumber: receipt.blockNumber, sessionCode, classId };
+    },
+
+    async markAttendance(payload, timings) {
+        require_(payload, ['sessionCode', 'studentId', 'classId']);
+        const { sessionCode, studentId } = payload;
+        await sleep(CALL_MS * 2);
+        if (!sessionValid(sessionCode)) {
+            throw new Error('Session is invalid or expired');
+        }
+        if (attended.has(`${sessionCode}|${studentId}`)) {
+            throw new Error('Attendance already marked for this session');
+        }
+        // claimed before mining, as the real contract would revert the second transaction
+        attended.add(`${sessionCode}|${studentId}`);
+        const receipt = await transact(timings);
+        return {
+            success: true, txHash: receipt.hash, blockNumber: receipt.blockNumber,
+            sessionCode, studentId, timestamp: Date.now()
+        };
+    },
+
+    async batchMarkAttendance(payload, timings) {
+        const { sessionCode, studentIds, classId } = payload;
+        if (!sessionCode || !classId || !Array.isArray(studentIds) || studentIds.length === 0) {
+            throw new Error('Missing required fields: sessionCode, studentIds, classId');
+        }
+        await sleep(CALL_MS * 2);
+        if (!sessionValid(sessionCode)) {
+            throw new Error('Session is invalid or expired');
+        }
+        let marked = 0;
+        const results = {};
+        for (const studentId of studentIds) {
+            const key = `${sessionCode}|${studentId}`;
+            if (attended.has(key)) {
+                results[studentId] = 'already_marked';
+            } else {
+                attended.add(key);
+                results[studentId] = 'marked';
+                marked += 1;
+            }
+        }
+        const receipt = await transact(timings);
+        return {
+            success: true, txHash: receipt.hash, blockNumber: receipt.blockNumber,
+            gasUsed: String(50000 + 30000 * studentIds.length), sessionCode,
+            count: studentIds.length, marked, results, rejected: [], timestamp: Date.now()
+        };
+    },
+
+    async anchorMerkleRoot(payload, timings) {
+        require_(payload, ['anchorId', 'root', 'leafCount']);
+        const { anchorId, root, leafCount } = payload;
+        if (anchors.has(anchorId)) {
+            throw new Error('Anchor already exists');
+        }
+        anchors.add(anchorId);
+        const receipt = await transact(timings);
+        return {
+            success: true, txHash: receipt.hash, blockNumber: receipt.blockNumber, gasUsed: '60000',
+            anchorId, root, leafCount, timestamp: Date.now()
+        };
+    },
+
+    async isSessionValid(payload) {
+        require_(payload, ['sessionCode']);
+        await sleep(CALL_MS);
+        return { success: true, sessionCode: payload.sessionCode, isValid: sessionValid(payload.sessionCode) };
+    },
+
+    async hasAttended(payload) {
+        require_(payload, ['sessionCode', 'studentId']);
+        const { sessionCode, studentId } = payload;
+        await sleep(CALL_MS);
+        return { success: true, sessionCode, studentId, hasAttended: attended.has(`${sessionCode}|${studentId}`) };
+    },
+
+    async getTotalRecords() {
+        await sleep(CALL_MS);
+        return { success: true, totalRecords: attended.size };
+    }
+};
+
+async function runAction(action, payload, timings = null) {
+    const handler = ACTIONS[action];
+    if (!handler) {
+        throw new Error(`Unknown action: ${action}`);
+    }
+    return handler(payload || {}, timings);
+}
+
+function finishTimings(timings) {
+    const { started, ...stages } = timings;
+    return { run_ms: performance.now() - started, ...stages };
+}
+
+function serve() {
+    console.log = console.error;
+
+    const write = (msg) => process.stdout.write(JSON.stringify(msg) + '\n');
+    const rl = readline.createInterface({ input: process.stdin, crlfDelay: Infinity });
+
+    rl.on('line', async (line) => {
+        if (!line.trim()) {
+            return;
+        }
+
+        let request;
+        try {
+            request = JSON.parse(line);
+        } catch (error) {
+            write({ id: null, ok: false, error: `Invalid request: ${error.message}` });
+            return;
+        }
+
+        const timings = { started: performance.now() };
+        try {
+            const result = await runAction(request.action, request.payload, timings);
+            write({ id: request.id, ok: true, result, timings: finishTimings(timings) });
+        } catch (error) {
+            write({ id: request.id, ok: false, error: error.message, timings: finishTimings(timings) });
+        }
+    });
+
+    rl.on('close', () => process.exit(0));
+}
+
+async function main() {
+    const args = process.argv.slice(2);
+    if (args[0] === '--daemon') {
+        serve();
+        return;
+    }
+    try {
+        if (args.length < 1) {
+            throw new Error('Usage: node stub_eth_runner.js <action> <json_payload> | --daemon');
+        }
+        const result = await runAction(args[0], args[1] ? JSON.parse(args[1]) : {});
+        console.log(JSON.stringify(result));
+        process.exit(0);
+    } catch (error) {
+        console.error(JSON.stringify({ success: false, error: error.message }));
+        process.exit(1);
+    }
+}
+
+main();
@@ -0,0 +1,56 @@
+# verify_ledger.py
+# Verify the db.blockchain hash chain from the stored checkpoint (or from the genesis block with --full).
+#
+#   MONGO_URL=mongodb://localhost:27017 python scripts/verify_ledger.py
+#   MONGO_URL=mongodb://localhost:27017 python scripts/verify_ledger.py --full --workers 8
+#
+# Shares its checkpoint with GET/POST /api/admin/ledger/verify. Prints the run
+# report as JSON and exits non-zero if any block failed verification.
+import argparse
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from ledger_verify import LedgerVerifier  # noqa: E402
+
+
+async def run(args):
+    client = AsyncIOMotorClient(args.mongo_url)
+    try:
+        db = client[args.db_name]
+        verifier = LedgerVerifier(
+            db.blockchain,
+            db.ledger_checkpoints,
+            batch_size=args.batch_size,
+            settle_seconds=args.settle_seconds,
+            mongo_url=args.mongo_url,
+            db_name=args.db_name,
+        )
+        report = await verifier.verify(full=args.full, workers=args.workers)
+        print(json.dumps(report, indent=2, default=str))
+        if args.output:
+            Path(args.output).write_text(json.dumps(report, indent=2, default=str))
+        return 0 if report["ok"] else 1
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify the attendance ledger hash chain")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db-name", default=os.environ.get("DB_NAME", "blockchain_attendance"))
+    parser.add_argument("--full", action="store_true", help="ignore the checkpoint and re-audit every block")
+    parser.add_argument("--workers", type=int, default=1, help="processes to split the range across")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--settle-seconds", type=float, default=10.0)
+    parser.add_argument("--output", default=None)
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# serializers.py
+# Per-collection response shapes (Mongo projection + precompiled serializer) and an orjson response class.
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import orjson
+from bson import Decimal128, ObjectId
+from starlette.responses import JSONResponse
+
+# Mongo hands back naive UTC datetimes; OPT_NAIVE_UTC writes them with "+00:00",
+# exactly as serialize_doc did.
+ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(value: Any):
+    if isinstance(value, (ObjectId, Decimal128)):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON rendered by orjson, which writes datetimes, nested documents and
+    numpy scalars natively. Return it from the endpoint itself: FastAPI then
+    skips its jsonable_encoder pass, so the content is walked exactly once.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class DocumentShape:
+    """
+    How documents of one collection appear in responses.
+
+    Without `fields`, the whole document minus `_id` and `hidden` is
+    returned: `projection` excludes them on the server and `serialize` is a
+    pass-through (it only strips them from documents read without the
+    projection, e.g. the user a login just verified).
+
+    With `fields`, only those keys are returned, in that order, missing ones
+    as `defaults` (or None): `projection` fetches just them and `serialize`
+    is generated once as a single dict display, so a row costs one
+    `doc.get` per field and no type checks.
+    """
+
+    def __init__(self, name: str, hidden: Sequence[str] = (), fields: Optional[Sequence[str]] = None,
+                 defaults: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.hidden = ("_id", *hidden)
+        self.fields = tuple(fields) if fields is not None else None
+        if self.fields is None:
+            self.projection = {f: 0 for f in self.hidden}
+            self.serialize = self._strip_hidden
+        else:
+            self.projection = {"_id": 0, **{f: 1 for f in self.fields}}
+            self.serialize = self._compile(name, self.fields, defaults or {})
+
+    def _strip_hidden(self, doc: dict) -> dict:
+        for key in self.hidden:
+            if key in doc:
+                return {k: v for k, v in doc.items() if k not in self.hidden}
+        return doc
+
+    @staticmethod
+    def _compile(name: str, fields: Sequence[str], defaults: Dict[str, Any]):
+        lines = [f"def serialize_{name}(doc):", "    get = doc.get", "    return {"]
+        for field in fields:
+            default = f", _defaults[{field!r}]" if field in defaults else ""
+            lines.append(f"        {field!r}: get({field!r}{default}),")
+        lines.append("    }")
+        namespace = {"_defaults": dict(defaults)}
+        exec("\n".join(lines), namespace)
+        return namespace[f"serialize_{name}"]
+
+    def many(self, docs: Iterable[dict]) -> List[dict]:
+        serialize = self.serialize
+        return [serialize(doc) for doc in docs]
+
+
+# Shapes of the documents server.py returns
+USER_SHAPE = DocumentShape("users", hidden=("password",))
+CLASS_SHAPE = DocumentShape("classes")
+# bookkeeping of the IPFS bundler / pinner, chain batcher and Merkle anchoring
+ATTENDANCE_INTERNAL_FIELDS = (
+    "ipfs_payload", "ipfs_bundle_after", "ipfs_bundle_id", "ipfs_lease_until", "ipfs_attempts",
+    "chain_lease_until", "chain_attempts", "chain_batch_id", "chain_batch_tx",
+    "anchor_group", "anchor_after",
+)
+ATTENDANCE_SHAPE = DocumentShape("attendance", hidden=ATTENDANCE_INTERNAL_FIELDS)
+# the fixed row format of GET /attendance/my
+ATTENDANCE_SUMMARY_SHAPE = DocumentShape(
+    "attendance_summary",
+    fields=("id", "student_id", "student_name", "class_id", "class_name", "timestamp",
+            "blockchain_hash", "blockchain_tx", "ipfs_cid", "qr_code_id", "verified"),
+    defaults={"verified": True},
+)
@@ -5,12 +5,12 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
 from starlette.responses import JSONResponse
-from collections import defaultdict
+from collections import OrderedDict
 import time
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
 from bson import ObjectId
 import os
 import logging
@@ -21,11 +21,11 @@ import uuid
 from datetime import datetime, timedelta, timezone
 import jwt
 import hashlib
+import hmac
 import json
-import qrcode
 import io
-import base64
-from passlib.context import CryptContext
+import csv
+import zlib
 import secrets
 import time
 import asyncio
@@ -37,7 +37,35 @@ import logging
 from fastapi import UploadFile, File, Body
 from starlette.responses import JSONResponse, Response
 
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, StreamingResponse
+
+from eth_client import EthRunnerPool, EthRunnerError, EthRunnerUnavailable
+from outbox import Outbox, OutboxFatal
+from eth_batcher import ChainBatcher
+from http_clients import HTTPBackend, HTTPClients
+from ipfs_cache import CIDCache
+from gateway_race import GatewayScoreboard, race_gateways
+from local_cid import compute_cid
+from ipfs_pinner import DeferredPinner
+from ipfs_bundler import SessionBundler
+from db_joins import find_with_students
+from serializers import (ATTENDANCE_SHAPE, ATTENDANCE_SUMMARY_SHAPE, CLASS_SHAPE, USER_SHAPE, DocumentShape,
+                         FastJSONResponse)
+from pagination import KEYSET_SORT, InvalidCursor, keyset_query, split_page
+from user_cache import UserCache, InvalidationChannel
+from password_pool import PasswordHasher, PasswordHasherBusy
+from ledger import LedgerSequencer
+from dashboard_stats import DashboardStats
+from analytics import AnalyticsCache, class_fingerprint, load_and_compute
+from rate_limit import (MemoryStore, MongoStore, RateLimiter, RateLimitMiddleware, SharedMemoryStore,
+                        parse_networks, parse_policies)
+from ledger_verify import LedgerVerifier
+from qr_tokens import ExpiredQRToken, InvalidQRToken, QRTokenSigner, RevocationFeed, RevokedSessions
+from qr_render import QRRenderer, rotation_slots
+from merkle import ALGORITHM as MERKLE_ALGORITHM, inclusion_proof
+from merkle_anchor import MerkleAnchorer
+from metrics import MetricsRegistry, MongoCommandTimer, WorkerSnapshots, render as render_metrics
+from scan_admission import ScanAdmission, ScanRejected
 
 
 # Load environment variables
@@ -74,6 +102,32 @@ def serialize_doc(doc):
 
 logger = logging.getLogger(__name__)
 
+# ==================== METRICS ====================
+# Latency histograms per stage, served at GET /metrics in the Prometheus text
+# format. With several workers, point METRICS_DIR at a directory they share
+# and /metrics reports all of them (see metrics.WorkerSnapshots).
+metrics = MetricsRegistry()
+stage_seconds = metrics.histogram(
+    "attendance_stage_duration_seconds", "Time spent in one stage of handling a request", ("stage", "outcome"))
+http_backend_seconds = metrics.histogram(
+    "http_backend_duration_seconds", "Pinata / IPFS requests, until response headers", ("backend", "method", "status"))
+eth_call_seconds = metrics.histogram(
+    "eth_call_duration_seconds", "Ethereum runner calls, end to end", ("action", "mode", "outcome"))
+eth_runner_seconds = metrics.histogram(
+    "eth_runner_stage_duration_seconds",
+    "Inside the Ethereum runner: the whole action (run), sending a transaction (send), waiting for its receipt (wait)",
+    ("action", "stage"))
+mongo_command_seconds = metrics.histogram(
+    "mongo_command_duration_seconds", "MongoDB commands as timed by the driver", ("collection", "command", "outcome"))
+qr_render_seconds = metrics.histogram(
+    "qr_render_duration_seconds", "QR image renders (render cache misses)", ("format",))
+metrics_snapshots = WorkerSnapshots(
+    metrics,
+    os.environ.get("METRICS_DIR") or None,
+    interval=float(os.environ.get("METRICS_FLUSH_INTERVAL", "5")),
+)
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
 # ==================== IPFS INTEGRATION ====================
 
 logger = logging.getLogger(__name__)
@@ -82,7 +136,52 @@ IPFS_API_URL = os.environ.get("IPFS_API_URL", "http://127.0.0.1:5001")
 IPFS_GATEWAY_URL = os.environ.get("IPFS_GATEWAY_URL", "http://127.0.0.1:8080")
 USE_IPFS = os.environ.get("USE_IPFS", "true").lower() == "true"
 
+# Shared keep-alive pools, one per backend (see http_clients.py for overrides)
+http_clients = HTTPClients(
+    HTTPBackend("pinata", connect_timeout=5.0, read_timeout=30.0, http2=True),
+    HTTPBackend("public_gateway", connect_timeout=5.0, read_timeout=30.0, http2=True),
+    HTTPBackend("local_ipfs", connect_timeout=2.0, read_timeout=30.0, max_connections=20, max_keepalive=10),
+    observe=lambda backend, method, status, seconds: http_backend_seconds.observe(
+        seconds, (backend, method, str(status))),
+)
+
+# CIDs are immutable: cache fetched (and uploaded) objects by CID. The disk tier
+# is only used when IPFS_CACHE_DIR is set.
+ipfs_cache = CIDCache(
+    max_memory_bytes=int(float(os.environ.get("IPFS_CACHE_MEMORY_MB", "32")) * 1024 * 1024),
+    disk_dir=os.environ.get("IPFS_CACHE_DIR") or None,
+    max_disk_bytes=int(float(os.environ.get("IPFS_CACHE_DISK_MB", "1024")) * 1024 * 1024),
+)
+# Gateway answers are cached for good only if they hash to their CID; others
+# (CIDv0 / non-raw-leaf CIDs, `cid/path` references) stay in memory this long.
+IPFS_UNVERIFIED_CACHE_TTL = float(os.environ.get("IPFS_UNVERIFIED_CACHE_TTL", "300"))
+
+
+# "race" asks the best-scoring gateway first (initially the local node) and hedges
+# to the others after a score-based delay; "sequential" tries them one by one.
+IPFS_GATEWAY_MODE = os.environ.get("IPFS_GATEWAY_MODE", "race").lower()
+gateway_scoreboard = GatewayScoreboard({"local": 0.05, "pinata": 0.5, "ipfs.io": 0.8})
+
+
+def canonical_json_bytes(data: dict) -> bytes:
+    """Canonical JSON bytes (sorted keys) - the exact bytes stored on IPFS."""
+    return json.dumps(data, sort_keys=True, default=str, ensure_ascii=False).encode("utf-8")
+
+
+def decode_ipfs_content(content: bytes, source: str) -> Optional[dict]:
+    """Parse gateway/cache bytes as JSON; non-JSON content is returned wrapped as raw text."""
+    text = content.decode("utf-8", errors="replace").strip()
+    if not text:
+        return None
+    try:
+        return json.loads(text)
+    except Exception:
+        # not JSON — return raw text wrapped in a dict
+        logger.debug("Non-JSON body from %s; returning raw text", source)
+        return {"raw": text, "gateway": source}
 
+
+@stage_seconds.timed("ipfs_upload")
 async def upload_to_ipfs(data: dict) -> Optional[str]:
     """
     Upload JSON data to IPFS and return CID (tries Pinata then local node).
@@ -94,78 +193,80 @@ async def upload_to_ipfs(data: dict) -> Optional[str]:
 
     try:
         # canonical JSON bytes (sorted keys)
-        json_bytes = json.dumps(data, sort_keys=True, default=str, ensure_ascii=False).encode("utf-8")
-
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            # 1) Try Pinata if configured
-            pinata_jwt = os.environ.get("PINATA_JWT")
-            if pinata_jwt:
-                try:
-                    resp = await client.post(
-                        "https://api.pinata.cloud/pinning/pinJSONToIPFS",
-                        headers={
-                            "Authorization": f"Bearer {pinata_jwt}",
-                            "Content-Type": "application/json",
-                        },
-                        json={
-                            "pinataContent": data,
-                            "pinataMetadata": {"name": f"attendance_{int(time.time())}"},
-                        },
-                    )
-                    resp.raise_for_status()
-                    body = resp.json()
-                    # Pinata uses "IpfsHash"
-                    ipfs_hash = body.get("IpfsHash") or body.get("IpfsHash")
-                    if ipfs_hash:
-                        logger.info("Uploaded to Pinata -> %s", ipfs_hash)
-                        return ipfs_hash
-                except Exception as e:
-                    logger.info("Pinata upload failed (falling back): %s", e)
-
-            # 2) Fallback to local IPFS node via /api/v0/add (multipart/form-data)
-            file_obj = io.BytesIO(json_bytes)
-            file_obj.seek(0)
-            files = {"file": ("data.json", file_obj, "application/json")}
-
-            resp = await client.post(f"{IPFS_API_URL}/api/v0/add?pin=true", files=files)
-            resp.raise_for_status()
+        json_bytes = canonical_json_bytes(data)
 
-            text = resp.text or ""
-            text = text.strip()
-            if not text:
-                logger.warning("Empty response from ipfs add")
-                return None
+        # 1) Try Pinata if configured
+        pinata_jwt = os.environ.get("PINATA_JWT")
+        if pinata_jwt:
+            try:
+                resp = await http_clients.get("pinata").post(
+                    "https://api.pinata.cloud/pinning/pinJSONToIPFS",
+                    headers={
+                        "Authorization": f"Bearer {pinata_jwt}",
+                        "Content-Type": "application/json",
+                    },
+                    json={
+                        "pinataContent": data,
+                        "pinataMetadata": {"name": f"attendance_{int(time.time())}"},
+                    },
+                )
+                resp.raise_for_status()
+                body = resp.json()
+                # Pinata uses "IpfsHash"
+                ipfs_hash = body.get("IpfsHash") or body.get("IpfsHash")
+                if ipfs_hash:
+                    logger.info("Uploaded to Pinata -> %s", ipfs_hash)
+                    await ipfs_cache.put(ipfs_hash, json_bytes)
+                    return ipfs_hash
+            except Exception as e:
+                logger.info("Pinata upload failed (falling back): %s", e)
+
+        # 2) Fallback to local IPFS node via /api/v0/add (multipart/form-data)
+        file_obj = io.BytesIO(json_bytes)
+        file_obj.seek(0)
+        files = {"file": ("data.json", file_obj, "application/json")}
+
+        resp = await http_clients.get("local_ipfs").post(f"{IPFS_API_URL}/api/v0/add?pin=true", files=files)
+        resp.raise_for_status()
+
+        text = resp.text or ""
+        text = text.strip()
+        if not text:
+            logger.warning("Empty response from ipfs add")
+            return None
 
-            # ipfs add returns NDJSON-style lines; parse each line and prefer last Hash/Cid
-            ipfs_hash = None
-            for line in text.splitlines():
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    obj = json.loads(line)
-                except Exception:
-                    # skip non-json lines
-                    continue
-
-                # older IPFS responses: {"Name":"...","Hash":"Qm...","Size":"..."}
-                if "Hash" in obj and obj["Hash"]:
-                    ipfs_hash = obj["Hash"]
-
-                # newer responses: {"Name":"...","Cid":{"/":"bafy..."},"Size":"..."} or "Cid":"bafy..."
-                elif "Cid" in obj:
-                    cid_val = obj["Cid"]
-                    if isinstance(cid_val, dict):
-                        ipfs_hash = cid_val.get("/")
-                    elif isinstance(cid_val, str):
-                        ipfs_hash = cid_val
-
-            if ipfs_hash:
-                logger.info("Uploaded to local IPFS -> %s", ipfs_hash)
-            else:
-                logger.error("Could not parse CID from ipfs add response: %s", text)
+        # ipfs add returns NDJSON-style lines; parse each line and prefer last Hash/Cid
+        ipfs_hash = None
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                obj = json.loads(line)
+            except Exception:
+                # skip non-json lines
+                continue
+
+            # older IPFS responses: {"Name":"...","Hash":"Qm...","Size":"..."}
+            if "Hash" in obj and obj["Hash"]:
+                ipfs_hash = obj["Hash"]
+
+            # newer responses: {"Name":"...","Cid":{"/":"bafy..."},"Size":"..."} or "Cid":"bafy..."
+            elif "Cid" in obj:
+                cid_val = obj["Cid"]
+                if isinstance(cid_val, dict):
+                    ipfs_hash = cid_val.get("/")
+                elif isinstance(cid_val, str):
+                    ipfs_hash = cid_val
+
+        if ipfs_hash:
+            logger.info("Uploaded to local IPFS -> %s", ipfs_hash)
+            # we already hold the exact bytes behind this CID
+            await ipfs_cache.put(ipfs_hash, json_bytes)
+        else:
+            logger.error("Could not parse CID from ipfs add response: %s", text)
 
-            return ipfs_hash
+        return ipfs_hash
 
     except httpx.RequestError as re:
         logger.warning("HTTP error during IPFS upload: %s", re)
@@ -175,49 +276,115 @@ async def upload_to_ipfs(data: dict) -> Optional[str]:
     return None
 
 
+async def fetch_json_from_gateway(name: str, target) -> Optional[tuple]:
+    """One raced gateway request; only a valid JSON body counts as an answer."""
+    backend, url = target
+    try:
+        resp = await http_clients.get(backend).get(url)
+    except httpx.RequestError as re:
+        logger.debug("Gateway %s request failed: %s", url, re)
+        return None
+    if resp.status_code != 200:
+        logger.debug("Gateway %s returned status %s", url, resp.status_code)
+        return None
+    try:
+        return json.loads(resp.content), resp.content
+    except ValueError:
+        logger.debug("Non-JSON body from %s", url)
+        return None
+
+
+def normalize_ipfs_ref(ref: str) -> str:
+    """`ipfs://cid/path`, `/ipfs/cid/path` and `cid/path` all become `cid/path`."""
+    ref = (ref or "").strip()
+    for prefix in ("ipfs://", "/ipfs/"):
+        if ref.startswith(prefix):
+            ref = ref[len(prefix):]
+    return ref.strip("/")
+
+
+def check_ipfs_content(cid: str, content: bytes) -> str:
+    """
+    "verified" if `content` hashes to `cid` (as `ipfs add --cid-version=1
+    --raw-leaves`), "mismatch" if it must but does not, else "unverifiable".
+    """
+    if "/" in cid:
+        return "unverifiable"
+    if compute_cid(content) == cid:
+        return "verified"
+    # a CIDv1 raw block (sha2-256) is exactly the hash of its bytes
+    if cid.startswith("bafkrei"):
+        return "mismatch"
+    return "unverifiable"
+
+
+@stage_seconds.timed("ipfs_get")
 async def get_from_ipfs(cid: str) -> Optional[dict]:
     """
-    Retrieve JSON data from IPFS by CID. Tries a public gateway then the configured local gateway.
+    Retrieve JSON data from IPFS by CID or `cid/path` reference (an entry of a
+    session bundle): cache first, then the gateways (raced or one after
+    another, see IPFS_GATEWAY_MODE).
     Returns parsed JSON (dict) on success or None on failure.
     """
+    cid = normalize_ipfs_ref(cid)
     if not cid:
         return None
 
+    cached = await ipfs_cache.get(cid)
+    if cached is not None:
+        return decode_ipfs_content(cached, "cache")
+
     gateways = [
-        f"https://gateway.pinata.cloud/ipfs/{cid}",
-        f"https://ipfs.io/ipfs/{cid}",
-        f"{IPFS_GATEWAY_URL}/ipfs/{cid}",
+        ("pinata", f"https://gateway.pinata.cloud/ipfs/{cid}"),
+        ("public_gateway", f"https://ipfs.io/ipfs/{cid}"),
+        ("local_ipfs", f"{IPFS_GATEWAY_URL}/ipfs/{cid}"),
     ]
 
+    async def fetch_checked(name: str, target) -> Optional[tuple]:
+        fetched = await fetch_json_from_gateway(name, target)
+        if fetched is not None:
+            check = check_ipfs_content(cid, fetched[1])
+            if check == "mismatch":
+                logger.warning("Gateway %s returned content that does not match %s", name, cid)
+                return None
+            fetched += (check,)
+        return fetched
+
+    if IPFS_GATEWAY_MODE == "race":
+        fetched = await race_gateways(
+            [("pinata", gateways[0]), ("ipfs.io", gateways[1]), ("local", gateways[2])],
+            fetch_checked,
+            gateway_scoreboard,
+        )
+        if fetched is None:
+            return None
+        result, content, check = fetched
+        await ipfs_cache.put(cid, content, ttl=None if check == "verified" else IPFS_UNVERIFIED_CACHE_TTL)
+        return result
+
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            for url in gateways:
-                try:
-                    resp = await client.get(url)
-                except httpx.RequestError as re:
-                    logger.debug("Gateway %s request failed: %s", url, re)
-                    continue
-
-                if resp.status_code != 200:
-                    logger.debug("Gateway %s returned status %s", url, resp.status_code)
-                    continue
-
-                text = resp.text or ""
-                text = text.strip()
-                if not text:
-                    logger.debug("Empty body from gateway %s", url)
-                    continue
-
-                # Try JSON first, then try to parse text
-                try:
-                    return resp.json()
-                except Exception:
-                    try:
-                        return json.loads(text)
-                    except Exception:
-                        # not JSON — return raw text wrapped in a dict maybe, or continue
-                        logger.debug("Non-JSON body from %s; returning raw text", url)
-                        return {"raw": text, "gateway": url}
+        for backend, url in gateways:
+            try:
+                resp = await http_clients.get(backend).get(url)
+            except httpx.RequestError as re:
+                logger.debug("Gateway %s request failed: %s", url, re)
+                continue
+
+            if resp.status_code != 200:
+                logger.debug("Gateway %s returned status %s", url, resp.status_code)
+                continue
+
+            result = decode_ipfs_content(resp.content, url)
+            if result is None:
+                logger.debug("Empty body from gateway %s", url)
+                continue
+
+            check = check_ipfs_content(cid, resp.content)
+            if check == "mismatch":
+                logger.warning("Gateway %s returned content that does not match %s", url, cid)
+                continue
+            await ipfs_cache.put(cid, resp.content, ttl=None if check == "verified" else IPFS_UNVERIFIED_CACHE_TTL)
+            return result
 
     except Exception as e:
         logger.warning("IPFS retrieval error: %s", e)
@@ -225,9 +392,173 @@ async def get_from_ipfs(cid: str) -> Optional[dict]:
     return None
 
 
+# ==================== DEFERRED PINNING ====================
+# With IPFS_LOCAL_CID=true the CID is computed locally (same bytes/encoding as
+# `ipfs add --cid-version=1`), stored on the record right away, and the object is
+# pinned later in bulk by ipfs_pinner, which checks the remote CID against ours.
+IPFS_LOCAL_CID = os.environ.get("IPFS_LOCAL_CID", "false").lower() == "true"
+IPFS_PIN_BATCH_SIZE = int(os.environ.get("IPFS_PIN_BATCH_SIZE", "100"))
+IPFS_PIN_INTERVAL = float(os.environ.get("IPFS_PIN_INTERVAL", "10"))
+
+
+async def store_ipfs_deferred(data: dict) -> str:
+    """Address `data` locally, make it readable from the cache and queue it for pinning."""
+    json_bytes = canonical_json_bytes(data)
+    cid = compute_cid(json_bytes)
+    await ipfs_cache.put(cid, json_bytes)
+    await ipfs_pinner.add(cid, json_bytes)
+    return cid
+
+
+async def pin_batch_to_pinata(items, pinata_jwt: str) -> Dict[str, Optional[str]]:
+    """Pinata has no bulk endpoint: pinFileToIPFS per object, a few at a time."""
+    client = http_clients.get("pinata")
+    semaphore = asyncio.Semaphore(8)
+
+    async def pin_one(cid: str, content: bytes) -> Optional[str]:
+        async with semaphore:
+            try:
+                resp = await client.post(
+                    "https://api.pinata.cloud/pinning/pinFileToIPFS",
+                    headers={"Authorization": f"Bearer {pinata_jwt}"},
+                    files={"file": (cid, content, "application/json")},
+                    data={
+                        "pinataOptions": json.dumps({"cidVersion": 1}),
+                        "pinataMetadata": json.dumps({"name": f"attendance_{cid}"}),
+                    },
+                )
+                resp.raise_for_status()
+                return resp.json().get("IpfsHash")
+            except Exception as e:
+                logger.info("Pinata pin of %s failed: %s", cid, e)
+                return None
+
+    results = await asyncio.gather(*(pin_one(cid, content) for cid, content in items))
+    return {cid: remote for (cid, _), remote in zip(items, results)}
+
+
+async def pin_batch_to_local_node(items) -> Dict[str, Optional[str]]:
+    """One multipart /api/v0/add request for the whole batch; each part is named by its CID."""
+    files = [("file", (cid, content, "application/json")) for cid, content in items]
+    resp = await http_clients.get("local_ipfs").post(
+        f"{IPFS_API_URL}/api/v0/add",
+        params={"pin": "true", "cid-version": "1", "raw-leaves": "true"},
+        files=files,
+    )
+    resp.raise_for_status()
+
+    results: Dict[str, Optional[str]] = {}
+    for line in resp.text.splitlines():
+        try:
+            obj = json.loads(line)
+        except ValueError:
+            continue
+        cid_val = obj.get("Hash") or obj.get("Cid")
+        if isinstance(cid_val, dict):
+            cid_val = cid_val.get("/")
+        if obj.get("Name") and cid_val:
+            results[obj["Name"]] = cid_val
+    return results
+
+
+async def pin_ipfs_batch(items) -> Dict[str, Optional[str]]:
+    pinata_jwt = os.environ.get("PINATA_JWT")
+    if pinata_jwt:
+        return await pin_batch_to_pinata(items, pinata_jwt)
+    return await pin_batch_to_local_node(items)
+
+
+async def reconcile_pinned_records(pinned: List[str], mismatched: List[str]):
+    if pinned:
+        await db.attendance.update_many({"ipfs_cid": {"$in": pinned}}, {"$set": {"ipfs_status": "done"}})
+    if mismatched:
+        await db.attendance.update_many({"ipfs_cid": {"$in": mismatched}}, {"$set": {"ipfs_status": "mismatch"}})
+
+
+# ==================== SESSION BUNDLES ====================
+# With IPFS_SESSION_BUNDLES=true nothing is uploaded per mark: once a QR session
+# has expired (plus IPFS_BUNDLE_GRACE seconds), all of its attendance payloads are
+# uploaded as one directory and each record points at `<bundle cid>/<id>.json`.
+IPFS_SESSION_BUNDLES = os.environ.get("IPFS_SESSION_BUNDLES", "false").lower() == "true"
+IPFS_BUNDLE_GRACE = float(os.environ.get("IPFS_BUNDLE_GRACE", "60"))
+IPFS_BUNDLE_INTERVAL = float(os.environ.get("IPFS_BUNDLE_INTERVAL", "30"))
+
+
+def parse_ipfs_add_root(text: str) -> Optional[str]:
+    """Directory CID from a wrap-with-directory /api/v0/add response (the entry with an empty Name)."""
+    for line in text.splitlines():
+        try:
+            obj = json.loads(line)
+        except ValueError:
+            continue
+        if obj.get("Name"):
+            continue
+        cid_val = obj.get("Hash") or obj.get("Cid")
+        if isinstance(cid_val, dict):
+            cid_val = cid_val.get("/")
+        if cid_val:
+            return cid_val
+    return None
+
+
+async def upload_ipfs_bundle(session_code: str, files: List[tuple]) -> Optional[str]:
+    """Upload `[(name, bytes), ...]` as one directory; returns the directory CID."""
+    pinata_jwt = os.environ.get("PINATA_JWT")
+    if pinata_jwt:
+        # Pinata builds a directory when every file shares the same top-level folder
+        folder = f"session_{session_code}"
+        try:
+            resp = await http_clients.get("pinata").post(
+                "https://api.pinata.cloud/pinning/pinFileToIPFS",
+                headers={"Authorization": f"Bearer {pinata_jwt}"},
+                files=[("file", (f"{folder}/{name}", data, "application/json")) for name, data in files],
+                data={
+                    "pinataOptions": json.dumps({"cidVersion": 1}),
+                    "pinataMetadata": json.dumps({"name": folder}),
+                },
+            )
+            resp.raise_for_status()
+            bundle_cid = resp.json().get("IpfsHash")
+            if bundle_cid:
+                return bundle_cid
+        except Exception as e:
+            logger.info("Pinata bundle upload failed (falling back): %s", e)
+
+    resp = await http_clients.get("local_ipfs").post(
+        f"{IPFS_API_URL}/api/v0/add",
+        params={"pin": "true", "wrap-with-directory": "true", "cid-version": "1", "raw-leaves": "true"},
+        files=[("file", (name, data, "application/json")) for name, data in files],
+    )
+    resp.raise_for_status()
+    return parse_ipfs_add_root(resp.text)
+
+
+async def record_bundle_refs(bundle_cid: str, entries: List[tuple]):
+    """Point each block at its bundle entry and warm the cache with the entry bytes."""
+    refs = [(att_id, f"{bundle_cid}/{name}", data) for att_id, name, data in entries]
+    await db.blockchain.bulk_write(
+        [UpdateOne({"data.attendance_id": att_id}, {"$set": {"data.ipfs_cid": ref}}) for att_id, ref, _ in refs],
+        ordered=False,
+    )
+    for _, ref, data in refs:
+        await ipfs_cache.put(ref, data)
+
+
 # ==================== ETHEREUM INTEGRATION ====================
-async def call_node_eth(action, payload):
-    """Call Ethereum runner script (cross-platform, avoids asyncio.create_subprocess_exec on Windows)."""
+# "daemon" keeps long-lived eth_runner.js processes around (see eth_client.py);
+# "spawn" starts a fresh `node eth_runner.js <action> <json>` for every call.
+ETH_RUNNER_MODE = os.environ.get("ETH_RUNNER_MODE", "daemon").lower()
+ETH_RUNNER_POOL_SIZE = int(os.environ.get("ETH_RUNNER_POOL_SIZE", "1"))
+ETH_CALL_TIMEOUT = float(os.environ.get("ETH_CALL_TIMEOUT", "60"))
+
+eth_runner_pool: Optional[EthRunnerPool] = None
+
+
+def find_eth_runner() -> Optional[str]:
+    # ETH_RUNNER_PATH points at another runner speaking the same protocol (e.g. scripts/stub_eth_runner.js)
+    override = os.environ.get("ETH_RUNNER_PATH")
+    if override:
+        return override
 
     possible_paths = [
         os.path.join(ROOT_DIR, "server", "eth_runner.js"),
@@ -236,14 +567,80 @@ async def call_node_eth(action, payload):
         os.path.join(str(Path.cwd()), "eth_runner.js"),
     ]
 
-    runner_path = None
     for p in possible_paths:
         if os.path.exists(p):
-            runner_path = p
-            break
+            return p
+
+    logger.warning("eth_runner.js not found (looked in %s)", possible_paths)
+    return None
+
+
+def get_eth_runner_pool() -> Optional[EthRunnerPool]:
+    """Return the shared runner pool, creating it on first use (daemon mode only)."""
+    global eth_runner_pool
+    if ETH_RUNNER_MODE != "daemon":
+        return None
+    if eth_runner_pool is None:
+        runner_path = find_eth_runner()
+        if not runner_path:
+            return None
+        eth_runner_pool = EthRunnerPool(runner_path, size=ETH_RUNNER_POOL_SIZE)
+    return eth_runner_pool
+
+
+async def call_node_eth(action, payload, timeout: Optional[float] = None):
+    """Call Ethereum runner script; returns the runner's JSON result or None on failure."""
+    started = time.perf_counter()
+    mode = "spawn"
+    result = None
+    try:
+        result, mode = await _call_node_eth(action, payload, timeout)
+        return result
+    finally:
+        eth_call_seconds.observe(time.perf_counter() - started, (action, mode, "none" if result is None else "ok"))
+
+
+def observe_runner_timings(action: str, timings: Optional[dict]):
+    """Stage timings the daemon reports with each reply (milliseconds)."""
+    for stage in ("run", "send", "wait"):
+        value = (timings or {}).get(f"{stage}_ms")
+        if value is not None:
+            eth_runner_seconds.observe(value / 1000, (action, stage))
 
+
+async def _call_node_eth(action, payload, timeout: Optional[float] = None):
+    global ETH_RUNNER_MODE
+    timeout = timeout or ETH_CALL_TIMEOUT
+
+    pool = get_eth_runner_pool()
+    if pool is not None:
+        try:
+            reply = await pool.call(action, payload, timeout)
+        except EthRunnerUnavailable as e:
+            # No asyncio subprocess support here; stay on per-call spawn from now on
+            logger.warning("Ethereum runner daemon unavailable (%s); falling back to spawn mode", e)
+            ETH_RUNNER_MODE = "spawn"
+        except asyncio.TimeoutError:
+            logger.error("Ethereum runner timed out after %.1fs on %s", timeout, action)
+            return None, "daemon"
+        except EthRunnerError as e:
+            logger.error("Ethereum runner failed on %s: %s", action, e)
+            return None, "daemon"
+        else:
+            observe_runner_timings(action, reply.get("timings"))
+            if not reply.get("ok"):
+                logger.error("Ethereum runner error on %s: %s", action, reply.get("error"))
+                return None, "daemon"
+            return reply.get("result"), "daemon"
+
+    return await spawn_node_eth(action, payload, timeout), "spawn"
+
+
+async def spawn_node_eth(action, payload, timeout: Optional[float] = None):
+    """Run one eth_runner.js process per call (cross-platform, avoids asyncio.create_subprocess_exec on Windows)."""
+
+    runner_path = find_eth_runner()
     if not runner_path:
-        logger.warning("eth_runner.js not found (looked in %s)", possible_paths)
         return None
 
     # Build the command
@@ -257,6 +654,7 @@ async def call_node_eth(action, payload):
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
+            timeout=timeout,
             check=False  # we"ll inspect returncode manually
         )
 
@@ -277,22 +675,118 @@ async def call_node_eth(action, payload):
 
         return None
 
+    except subprocess.TimeoutExpired:
+        logger.error("Ethereum runner timed out after %.1fs on %s", timeout, action)
+        return None
     except Exception:
         logger.exception("Ethereum call error while invoking eth_runner.js")
         return None
 
 # ==================== DATABASE SETUP ====================
 mongo_url = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
-client = AsyncIOMotorClient(mongo_url)
+# every command is timed per collection by the driver (see metrics.MongoCommandTimer)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandTimer(mongo_command_seconds)])
 db = client[os.environ.get("DB_NAME", "blockchain_attendance")]
 
+ipfs_pinner = DeferredPinner(
+    db.ipfs_pins,
+    pin_ipfs_batch,
+    on_reconciled=reconcile_pinned_records,
+    batch_size=IPFS_PIN_BATCH_SIZE,
+    interval=IPFS_PIN_INTERVAL,
+)
+ipfs_bundler = SessionBundler(
+    db.attendance,
+    upload_ipfs_bundle,
+    canonical_json_bytes,
+    on_bundled=record_bundle_refs,
+    interval=IPFS_BUNDLE_INTERVAL,
+)
+
+# All appends to db.blockchain go through the sequencer (see ledger.py)
+ledger = LedgerSequencer(db.blockchain, db.counters, max_batch=int(os.environ.get("LEDGER_MAX_BATCH", "256")))
+
+# Incremental integrity check of the ledger; LEDGER_VERIFY_INTERVAL=0 runs it on demand only
+ledger_verifier = LedgerVerifier(
+    db.blockchain,
+    db.ledger_checkpoints,
+    batch_size=int(os.environ.get("LEDGER_VERIFY_BATCH_SIZE", "1000")),
+    mongo_url=mongo_url,
+    db_name=db.name,
+    interval=float(os.environ.get("LEDGER_VERIFY_INTERVAL", "0")),
+)
+LEDGER_VERIFY_MAX_WORKERS = int(os.environ.get("LEDGER_VERIFY_MAX_WORKERS", "4"))
+
+# Dashboard counters are materialized per user (see dashboard_stats.py)
+dashboard_stats = DashboardStats(db)
+
+# Per-class attendance analytics (see analytics.py), recomputed only when the class changes
+analytics_cache = AnalyticsCache(max_entries=int(os.environ.get("ANALYTICS_CACHE_SIZE", "256")))
+ANALYTICS_THRESHOLDS = {
+    "at_risk_rate": float(os.environ.get("ANALYTICS_AT_RISK_RATE", "0.75")),
+    "at_risk_absences": int(os.environ.get("ANALYTICS_AT_RISK_ABSENCES", "3")),
+}
+
 # ==================== SECURITY SETUP ====================
 security = HTTPBearer()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 SECRET_KEY = os.environ.get("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
 
+# bcrypt runs in worker processes, never on the event loop. Beyond
+# PASSWORD_HASH_MAX_WAITING queued calls, login/register answer 429.
+password_hasher = PasswordHasher(
+    executor=os.environ.get("PASSWORD_HASH_EXECUTOR", "process").lower(),
+    workers=int(os.environ.get("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))),
+    max_waiting=int(os.environ.get("PASSWORD_HASH_MAX_WAITING", "64")),
+)
+
+# Rate limits per route (see rate_limit.py for the RATE_LIMIT_POLICIES syntax).
+# RATE_LIMIT_BACKEND=memory counts per worker, shared across the workers of one
+# host, mongo across hosts. X-Forwarded-For is only honoured from
+# RATE_LIMIT_TRUSTED_PROXIES.
+RATE_LIMIT_POLICIES = os.environ.get("RATE_LIMIT_POLICIES", "auth=/api/auth/login|/api/auth/register:10/60")
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory").lower()
+if RATE_LIMIT_BACKEND == "shared":
+    rate_limit_store = SharedMemoryStore(
+        os.environ.get("RATE_LIMIT_SHM_PATH", "/dev/shm/attendance-rate-limit"),
+        slots=int(os.environ.get("RATE_LIMIT_SHM_SLOTS", "65536")),
+    )
+elif RATE_LIMIT_BACKEND == "mongo":
+    rate_limit_store = MongoStore(db.rate_limits)
+else:
+    rate_limit_store = MemoryStore(max_keys=int(os.environ.get("RATE_LIMIT_MAX_KEYS", "100000")))
+rate_limiter = RateLimiter(
+    rate_limit_store,
+    parse_policies(RATE_LIMIT_POLICIES),
+    trusted_proxies=parse_networks(os.environ.get("RATE_LIMIT_TRUSTED_PROXIES", "")),
+)
+
+# Attendance QR codes carry an HMAC signature (see qr_tokens.py), so a scan is
+# verified without reading db.qr_codes. QR_ACCEPT_LEGACY keeps the unsigned
+# `class_id|qr_id|exp` codes (checked against the database) working.
+QR_SIGNED_TOKENS = os.environ.get("QR_SIGNED_TOKENS", "true").lower() == "true"
+QR_ACCEPT_LEGACY = os.environ.get("QR_ACCEPT_LEGACY", "true").lower() == "true"
+QR_SIGNING_KEY = os.environ.get("QR_SIGNING_KEY")
+QR_SESSION_MINUTES = int(os.environ.get("QR_SESSION_MINUTES", "5"))
+# With signed codes, the displayed code changes every QR_ROTATION_SECONDS (0 = never)
+# and each one stays valid QR_ROTATION_GRACE seconds into the next, so a
+# screenshot is useless moments later. The session itself still lasts
+# QR_SESSION_MINUTES; QR_PREGENERATE upcoming codes are signed and rendered ahead.
+QR_ROTATION_SECONDS = int(os.environ.get("QR_ROTATION_SECONDS", "15")) if QR_SIGNED_TOKENS else 0
+QR_ROTATION_GRACE = int(os.environ.get("QR_ROTATION_GRACE", "5"))
+QR_PREGENERATE = int(os.environ.get("QR_PREGENERATE", "3"))
+qr_signer = QRTokenSigner(
+    QR_SIGNING_KEY.encode() if QR_SIGNING_KEY
+    else hmac.new(SECRET_KEY.encode(), b"attendance-qr-signing", hashlib.sha256).digest()
+)
+revoked_qr_sessions = RevokedSessions()
+qr_revocation_feed = RevocationFeed(
+    db.qr_codes,
+    revoked_qr_sessions,
+    interval=float(os.environ.get("QR_REVOCATION_SYNC_INTERVAL", "5")),
+)
+
 # ==================== FASTAPI APP ====================
 app = FastAPI(title="Blockchain QR Attendance System", version="1.0.0")
 api_router = APIRouter(prefix="/api")
@@ -320,11 +814,19 @@ def ensure_tz(dt):
         dt = dt.replace(tzinfo=timezone.utc)
     return dt
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password[:72])
+async def hash_password(password: str) -> str:
+    try:
+        return await password_hasher.hash(password[:72])
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=429, detail="Too many login attempts in progress, retry shortly",
+                            headers={"Retry-After": "1"})
 
-def verify_password(plain: str, hashed: str) -> bool:
-    return pwd_context.verify(plain[:72], hashed)
+async def verify_password(plain: str, hashed: str) -> bool:
+    try:
+        return await password_hasher.verify(plain[:72], hashed)
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=429, detail="Too many login attempts in progress, retry shortly",
+                            headers={"Retry-After": "1"})
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -338,14 +840,22 @@ def generate_course_code():
 def calculate_hash(data: str) -> str:
     return hashlib.sha256(data.encode()).hexdigest()
 
-def generate_qr_code(data: str) -> str:
-    qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=10, border=4)
-    qr.add_data(data)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    buffered = io.BytesIO()
-    img.save(buffered, format="PNG")
-    return base64.b64encode(buffered.getvalue()).decode()
+# QR images are rendered in worker threads and cached by content (see qr_render.py).
+# QR_MASK_PATTERN=0..7 skips the encoder's mask search (~5x faster renders).
+QR_MASK_PATTERN = os.environ.get("QR_MASK_PATTERN")
+qr_renderer = QRRenderer(
+    max_entries=int(os.environ.get("QR_RENDER_CACHE_SIZE", "512")),
+    workers=int(os.environ.get("QR_RENDER_WORKERS", "2")),
+    mask_pattern=int(QR_MASK_PATTERN) if QR_MASK_PATTERN else None,
+    observe=lambda fmt, seconds: qr_render_seconds.observe(seconds, (fmt,)),
+)
+QR_IMAGE_FIELDS = {"png": "qr_code", "svg": "qr_svg", "matrix": "qr_matrix"}
+
+
+async def render_qr_image(content: str, fmt: str) -> dict:
+    """{"format": fmt, <qr_code|qr_svg|qr_matrix>: image} for an API response."""
+    with stage_seconds.time("qr_image", "ok"):
+        return {"format": fmt, QR_IMAGE_FIELDS[fmt]: await qr_renderer.render(content, fmt)}
 
 # ==================== MODELS ====================
 class User(BaseModel):
@@ -401,7 +911,34 @@ class AttendanceRecord(BaseModel):
 class AttendanceMark(BaseModel):
     qr_content: str
 
+
+def json_response(content, response: Optional[Response] = None) -> FastJSONResponse:
+    """orjson-rendered response, keeping headers an endpoint set on its injected `response`."""
+    headers = None
+    if response is not None:
+        headers = {k: v for k, v in response.headers.items() if k not in ("content-length", "content-type")}
+    return FastJSONResponse(content, headers=headers)
+
 # ==================== AUTHENTICATION ====================
+# Authenticated users are cached (password stripped) for USER_CACHE_TTL seconds;
+# USER_CACHE_TTL=0 disables the cache. With several workers, set
+# USER_CACHE_INVALIDATION=mongo so profile/wallet updates reach every worker
+# immediately instead of after the TTL.
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", "30"))
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", "10000"))
+USER_CACHE_INVALIDATION = os.environ.get("USER_CACHE_INVALIDATION", "none").lower()
+
+user_cache = UserCache(max_entries=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+user_cache_channel = InvalidationChannel(db, user_cache) if USER_CACHE_INVALIDATION == "mongo" else None
+
+
+async def invalidate_cached_user(email: str):
+    if user_cache_channel is not None:
+        await user_cache_channel.publish(email)
+    else:
+        user_cache.invalidate(email)
+
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
     token = credentials.credentials
     try:
@@ -411,10 +948,23 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             raise HTTPException(status_code=401, detail="Invalid token")
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
-    user = await db.users.find_one({"email": email})
+
+    if USER_CACHE_TTL > 0:
+        cached = user_cache.get(email)
+        if cached is not None:
+            return cached
+
+    user = await db.users.find_one({"email": email}, USER_SHAPE.projection)
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
-    return serialize_doc(user)
+    if USER_CACHE_TTL > 0:
+        user_cache.put(email, user)
+    return user
+
+async def get_admin_user(current_user: dict = Depends(get_current_user)) -> dict:
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
 
 @api_router.put("/user/profile")
 async def update_user_profile(
@@ -438,16 +988,17 @@ async def update_user_profile(
         {"id": user_id},
         {"$set": update_fields}
     )
+    await invalidate_cached_user(current_user["email"])
 
     if result.modified_count == 0:
         # Check if user exists but no change was made
         if await db.users.find_one({"id": user_id}):
-            return serialize_doc(current_user) # Return current data if no change
+            return json_response(current_user) # Return current data if no change
         raise HTTPException(status_code=404, detail="User not found")
 
     # Fetch the updated user document
-    updated_user = await db.users.find_one({"id": user_id}, {"password": 0})
-    return serialize_doc(updated_user)
+    updated_user = await db.users.find_one({"id": user_id}, USER_SHAPE.projection)
+    return json_response(updated_user)
 
 @api_router.post("/user/update-wallet")
 async def update_user_wallet(
@@ -467,13 +1018,14 @@ async def update_user_wallet(
         {"id": current_user["id"]},
         {"$set": {"walletAddress": wallet_address}}
     )
+    await invalidate_cached_user(current_user["email"])
 
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found or wallet address already set")
 
     # Fetch the updated user document
-    updated_user = await db.users.find_one({"id": current_user["id"]}, {"password": 0})
-    return serialize_doc(updated_user)
+    updated_user = await db.users.find_one({"id": current_user["id"]}, USER_SHAPE.projection)
+    return json_response(updated_user)
 
 @api_router.get("/dashboard/student-stats")
 async def get_student_stats(current_user: dict = Depends(get_current_user)):
@@ -481,30 +1033,20 @@ async def get_student_stats(current_user: dict = Depends(get_current_user)):
     if current_user["role"] != "student":
         raise HTTPException(status_code=403, detail="Access denied")
 
-    student_id = current_user["id"]
-    
-    # 1. Total Attendance
-    total_attendance = await db.attendance.count_documents({"student_id": student_id})
+    # One point read of the student's materialized counters
+    stats = await dashboard_stats.student(current_user["id"])
+    enrolled = stats["enrolled_classes"]
 
-    # 2. Enrolled Classes
-    enrolled_classes_cursor = db.classes.find({"students_enrolled": student_id})
-    enrolled_classes = await enrolled_classes_cursor.to_list(None)
-    classes_enrolled_count = len(enrolled_classes)
-
-    # 3. Attendance Percentage (Placeholder logic)
-    unique_classes_attended = await db.attendance.distinct("class_id", {"student_id": student_id})
-    attendance_percentage = (len(unique_classes_attended) / classes_enrolled_count) * 100 if classes_enrolled_count > 0 else 0
+    # Attendance Percentage (Placeholder logic): share of enrolled classes attended at least once
+    attendance_percentage = (stats["classes_attended"] / enrolled) * 100 if enrolled > 0 else 0
     attendance_percentage = round(attendance_percentage, 2)
 
-    # 4. Recent Activity (last 5 attendance records)
-    recent_attendance = await db.attendance.find({"student_id": student_id}).sort("timestamp", -1).limit(5).to_list(5)
-    
-    return {
-        "total_attendance": total_attendance,
-        "enrolled_classes": classes_enrolled_count,
+    return json_response({
+        "total_attendance": stats["total_attendance"],
+        "enrolled_classes": enrolled,
         "attendance_percentage": attendance_percentage,
-        "recent_attendance": serialize_doc(recent_attendance)
-    }
+        "recent_attendance": stats["recent"]
+    })
 
 @api_router.get("/dashboard/teacher-stats")
 async def get_teacher_stats(current_user: dict = Depends(get_current_user)):
@@ -513,34 +1055,23 @@ async def get_teacher_stats(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=403, detail="Access denied")
 
     teacher_id = current_user["id"]
-    
-    # 1. Total Classes
-    teacher_classes = await db.classes.find({"teacher_id": teacher_id}).to_list(None)
-    total_classes = len(teacher_classes)
-    class_ids = [cls["id"] for cls in teacher_classes]
-
-    # 2. Total Students (unique students across all classes)
-    all_students_ids = set()
-    for cls in teacher_classes:
-        all_students_ids.update(cls.get("students_enrolled", []))
-    total_students = len(all_students_ids)
 
-    # 3. Recent Attendance (last 5 attendance records across all their classes)
-    recent_attendance = await db.attendance.find({"class_id": {"$in": class_ids}}).sort("timestamp", -1).limit(5).to_list(5)
+    # Classes, unique students and recent attendance: one point read
+    stats = await dashboard_stats.teacher(teacher_id)
 
-    # 4. Active QR Codes (QR codes generated by this teacher that are still active)
+    # Active QR Codes depend on the clock, so they are counted (index on teacher_id, expires_at)
     active_qrcodes = await db.qr_codes.count_documents({
-        "class_id": {"$in": class_ids},
+        "teacher_id": teacher_id,
         "is_active": True,
         "expires_at": {"$gt": get_utc_now()}
     })
 
-    return {
-        "total_classes": total_classes,
-        "total_students": total_students,
-        "recent_attendance": serialize_doc(recent_attendance),
+    return json_response({
+        "total_classes": stats["total_classes"],
+        "total_students": stats["total_students"],
+        "recent_attendance": stats["recent"],
         "active_qrcodes": active_qrcodes
-    }
+    })
 
 # server.py - FIXED REGISTRATION ENDPOINT
 # Replace the @api_router.post("/auth/register") section with this:
@@ -552,7 +1083,7 @@ async def register_user(user_data: RegisterRequest):
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    hashed_password = hash_password(user_data.password)
+    hashed_password = await hash_password(user_data.password)
     user = User(
         name=user_data.name,
         email=user_data.email,
@@ -574,25 +1105,20 @@ async def register_user(user_data: RegisterRequest):
         expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     )
     
-    # Prepare user data (remove password)
-    user_data_dict = user.dict()
-    user_data_dict.pop('password', None)
-    user_serialized = serialize_doc(user_data_dict)
-    
     # Return success with token and user data (same format as login)
-    return {
+    return json_response({
         "success": True,
         "message": "Registration successful! Logging you in...",
         "access_token": access_token,
         "token_type": "bearer",
-        "user": user_serialized
-    }
+        "user": USER_SHAPE.serialize(user.dict())
+    })
 
 
 @api_router.post("/auth/login")
 async def login_for_access_token(form_data: LoginRequest):
     user = await db.users.find_one({"email": form_data.email, "role": form_data.role})
-    if not user or not verify_password(form_data.password, user["password"]):
+    if not user or not await verify_password(form_data.password, user["password"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -604,7 +1130,8 @@ async def login_for_access_token(form_data: LoginRequest):
         expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     )
     
-    return {"access_token": access_token, "token_type": "bearer", "user": serialize_doc(user)}
+    # the password hash was needed above; it is not part of the response
+    return json_response({"access_token": access_token, "token_type": "bearer", "user": USER_SHAPE.serialize(user)})
 
 # ==================== CLASS ROUTES ====================
 @api_router.post("/classes/create")
@@ -619,21 +1146,62 @@ async def create_class(class_data: dict = Body(...), current_user: dict = Depend
     )
     
     await db.classes.insert_one(new_class.dict())
-    return serialize_doc(new_class.dict())
+    await dashboard_stats.class_created(current_user["id"], new_class.id)
+    return json_response(new_class.dict())
 
 @api_router.get("/classes")
 async def get_classes(current_user: dict = Depends(get_current_user)):
     if current_user["role"] == "teacher":
-        classes = await db.classes.find({"teacher_id": current_user["id"]}).to_list(100)
+        classes = await db.classes.find({"teacher_id": current_user["id"]}, CLASS_SHAPE.projection).to_list(100)
     else:
-        classes = await db.classes.find({"students_enrolled": current_user["id"]}).to_list(100)
-    return serialize_doc(classes)
+        classes = await db.classes.find({"students_enrolled": current_user["id"]}, CLASS_SHAPE.projection).to_list(100)
+    return json_response(classes)
+
+def session_qr_codes(class_id: str, qr_id: str, session_end: datetime) -> List[dict]:
+    """The code to display now followed by the pre-generated upcoming ones."""
+    if not QR_ROTATION_SECONDS:
+        content = (qr_signer.issue(class_id, qr_id, session_end) if QR_SIGNED_TOKENS
+                   else f"{class_id}|{qr_id}|{int(session_end.timestamp())}")
+        return [{"qr_content": content, "valid_from": None, "expires_at": session_end}]
+    codes = []
+    for valid_from, expires in rotation_slots(time.time(), QR_ROTATION_SECONDS, 1 + QR_PREGENERATE,
+                                              QR_ROTATION_GRACE, session_end.timestamp()):
+        expires_at = datetime.fromtimestamp(expires, tz=timezone.utc)
+        codes.append({
+            "qr_content": qr_signer.issue(class_id, qr_id, expires_at),
+            "valid_from": datetime.fromtimestamp(valid_from, tz=timezone.utc),
+            "expires_at": expires_at,
+        })
+    return codes
+
+
+async def current_qr_response(class_id: str, qr_id: str, session_end: datetime, fmt: str) -> dict:
+    codes = session_qr_codes(class_id, qr_id, session_end)
+    if not codes:
+        raise HTTPException(status_code=410, detail="QR session has ended")
+    current, upcoming = codes[0], codes[1:]
+    # upcoming images are rendered in the background, so the next poll is a cache hit
+    qr_renderer.prerender([c["qr_content"] for c in upcoming], fmt)
+    rotates = QR_ROTATION_SECONDS > 0
+    return {
+        **(await render_qr_image(current["qr_content"], fmt)),
+        "qr_content": current["qr_content"],
+        "token_expires_at": current["expires_at"].isoformat(),
+        "rotation_seconds": QR_ROTATION_SECONDS or None,
+        "next_rotation_at": upcoming[0]["valid_from"].isoformat() if rotates and upcoming else None,
+        "upcoming": [{"qr_content": c["qr_content"], "valid_from": c["valid_from"].isoformat(),
+                      "expires_at": c["expires_at"].isoformat()} for c in upcoming],
+    }
+
 
 @api_router.post("/attendance/generate-qr")
 async def generate_attendance_qr(class_data: dict = Body(...), current_user: dict = Depends(get_current_user)):
     class_id = class_data.get("class_id")
     if not class_id:
         raise HTTPException(status_code=400, detail="class_id is required")
+    fmt = str(class_data.get("format") or "png").lower()
+    if fmt not in QR_IMAGE_FIELDS:
+        raise HTTPException(status_code=400, detail="format must be png, svg or matrix")
 
     cls = await db.classes.find_one({"id": class_id, "teacher_id": current_user["id"]})
     if not cls:
@@ -641,15 +1209,15 @@ async def generate_attendance_qr(class_data: dict = Body(...), current_user: dic
 
     # create QR metadata
     qr_id = str(uuid.uuid4())
-    expires_at = get_utc_now() + timedelta(minutes=5)
-    qr_content = f"{class_id}|{qr_id}|{int(expires_at.timestamp())}"
-    qr_image = generate_qr_code(qr_content)
+    expires_at = get_utc_now() + timedelta(minutes=QR_SESSION_MINUTES)
+    qr_content = session_qr_codes(class_id, qr_id, expires_at)[0]["qr_content"]
 
     await db.qr_codes.insert_one({
         "id": qr_id,
         "class_id": class_id,
         "teacher_id": current_user["id"],
         "content": qr_content,
+        "rotation_seconds": QR_ROTATION_SECONDS or None,
         "created_at": get_utc_now(),
         "expires_at": expires_at,
         "is_active": True
@@ -661,7 +1229,7 @@ async def generate_attendance_qr(class_data: dict = Body(...), current_user: dic
         eth_payload = {
             "sessionCode": qr_id,         # use qr_id as the on-chain session code
             "classId": class_id,
-            "durationMinutes": 5          # match the QR expiry (minutes)
+            "durationMinutes": QR_SESSION_MINUTES  # match the QR expiry (minutes)
         }
 
         logger.info("Creating blockchain session with payload: %s", eth_payload)
@@ -682,8 +1250,7 @@ async def generate_attendance_qr(class_data: dict = Body(...), current_user: dic
     
     # Return response matching your frontend expectations
     return {
-        "qr_code": qr_image,           # Base64 PNG image
-        "qr_base64": qr_image,         # Alternative key
+        **(await current_qr_response(class_id, qr_id, expires_at, fmt)),  # image, content, rotation
         "qr_id": qr_id,                # QR code ID
         "session_id": qr_id,           # Session ID (same as qr_id)
         "sessionId": qr_id,            # Alternative key
@@ -692,6 +1259,46 @@ async def generate_attendance_qr(class_data: dict = Body(...), current_user: dic
         "class_id": class_id           # Class ID
     }
 
+@api_router.get("/attendance/qr/{qr_id}/current")
+async def get_current_attendance_qr(
+    qr_id: str,
+    format: str = Query("png", pattern="^(png|svg|matrix)$"),
+    current_user: dict = Depends(get_current_user)
+):
+    """The code to display right now for a running session (poll at `next_rotation_at`)."""
+    qr_record = await db.qr_codes.find_one(
+        {"id": qr_id, "teacher_id": current_user["id"]},
+        {"_id": 0, "class_id": 1, "expires_at": 1, "is_active": 1}
+    )
+    if not qr_record:
+        raise HTTPException(status_code=404, detail="QR code not found or you are not the teacher")
+    expires_at = ensure_tz(qr_record["expires_at"])
+    if not qr_record.get("is_active") or get_utc_now() >= expires_at or qr_id in revoked_qr_sessions:
+        raise HTTPException(status_code=410, detail="QR session has ended")
+
+    return {
+        **(await current_qr_response(qr_record["class_id"], qr_id, expires_at, format)),
+        "qr_id": qr_id,
+        "class_id": qr_record["class_id"],
+        "expires_at": expires_at.isoformat(),
+    }
+
+@api_router.post("/attendance/qr/{qr_id}/stop")
+async def stop_attendance_qr(qr_id: str, current_user: dict = Depends(get_current_user)):
+    """End a QR session before it expires; further scans of its code are rejected."""
+    qr_record = await db.qr_codes.find_one({"id": qr_id, "teacher_id": current_user["id"]})
+    if not qr_record:
+        raise HTTPException(status_code=404, detail="QR code not found or you are not the teacher")
+
+    expires_at = ensure_tz(qr_record["expires_at"])
+    await db.qr_codes.update_one(
+        {"id": qr_id},
+        {"$set": {"is_active": False, "revoked_at": get_utc_now()}}
+    )
+    # Takes effect here at once; other workers pick it up from revoked_at
+    revoked_qr_sessions.add(qr_id, expires_at)
+    return {"message": "QR session stopped", "qr_id": qr_id}
+
 @api_router.get("/classes/{class_id}/students")
 async def get_class_students(class_id: str, current_user: dict = Depends(get_current_user)):
     cls = await db.classes.find_one({"id": class_id})
@@ -702,8 +1309,8 @@ async def get_class_students(class_id: str, current_user: dict = Depends(get_cur
     if not student_ids:
         return []
     
-    students = await db.users.find({"id": {"$in": student_ids}}, {"password": 0}).to_list(1000)
-    return [serialize_doc(s) for s in students]
+    students = await db.users.find({"id": {"$in": student_ids}}, USER_SHAPE.projection).to_list(1000)
+    return json_response(students)
 
 @api_router.post("/classes/{class_id}/enroll")
 async def enroll_student(class_id: str, student_email: str = Body(..., embed=True), current_user: dict = Depends(get_current_user)):
@@ -712,13 +1319,212 @@ async def enroll_student(class_id: str, student_email: str = Body(..., embed=Tru
         raise HTTPException(status_code=404, detail="Student not found")
     
     await db.classes.update_one({"id": class_id}, {"$addToSet": {"students_enrolled": student["id"]}})
+    cls = await db.classes.find_one({"id": class_id}, {"_id": 0, "teacher_id": 1})
+    await dashboard_stats.student_enrolled(student["id"], class_id, cls.get("teacher_id") if cls else None)
     return {"message": "Student enrolled"}
 
+# ==================== ATTENDANCE OUTBOX ====================
+# With ATTENDANCE_OUTBOX=true, /attendance/mark commits the attendance and block
+# documents immediately and leaves IPFS upload + on-chain marking to workers.
+ATTENDANCE_OUTBOX = os.environ.get("ATTENDANCE_OUTBOX", "false").lower() == "true"
+OUTBOX_WORKERS = int(os.environ.get("OUTBOX_WORKERS", "4"))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "8"))
+
+
+async def process_attendance_job(job: dict):
+    """Push one attendance record to IPFS and the chain; each step is skipped once done."""
+    payload = job["payload"]
+    att_id = job["id"]
+
+    record = await db.attendance.find_one({"id": att_id})
+    if not record:
+        raise OutboxFatal(f"attendance {att_id} no longer exists")
+
+    if record.get("ipfs_status") == "pending":
+        ipfs_cid = await upload_to_ipfs(payload["ipfs_data"])
+        if not ipfs_cid:
+            raise RuntimeError("IPFS upload failed")
+        logger.info("IPFS upload result for attendance %s -> %s", att_id, ipfs_cid)
+        await db.attendance.update_one({"id": att_id}, {"$set": {"ipfs_cid": ipfs_cid, "ipfs_status": "done"}})
+        await db.blockchain.update_one({"data.attendance_id": att_id}, {"$set": {"data.ipfs_cid": ipfs_cid}})
+
+    # With CHAIN_BATCHING the chain step belongs to chain_batcher
+    if record.get("chain_status") == "pending" and not CHAIN_BATCHING:
+        session_code = payload["session_code"]
+        student_id = payload["student_id"]
+
+        if job["attempts"] > 1:
+            # An earlier attempt may have landed on-chain before we lost the reply
+            attended = await call_node_eth("hasAttended", {"sessionCode": session_code, "studentId": student_id})
+            if attended and attended.get("hasAttended"):
+                await db.attendance.update_one({"id": att_id}, {"$set": {"chain_status": "done"}})
+                return
+
+        is_valid_res = await call_node_eth("isSessionValid", {"sessionCode": session_code})
+        if not is_valid_res or not is_valid_res.get("success"):
+            raise RuntimeError("could not check session validity")
+        if not is_valid_res.get("isValid"):
+            await db.attendance.update_one({"id": att_id}, {"$set": {"chain_status": "rejected"}})
+            raise OutboxFatal("Session is invalid or expired on-chain")
+
+        eth_result = await call_node_eth("markAttendance", {
+            "sessionCode": session_code,
+            "studentId": student_id,
+            "classId": payload["class_id"]
+        })
+        if not eth_result or not eth_result.get("txHash"):
+            raise RuntimeError("markAttendance transaction failed")
+        await db.attendance.update_one(
+            {"id": att_id},
+            {"$set": {"blockchain_tx": eth_result["txHash"], "chain_status": "done"}}
+        )
+
+
+async def give_up_attendance_job(job: dict, error: str):
+    """Mark whatever was still pending as failed once the outbox stops retrying."""
+    att_id = job["id"]
+    await db.attendance.update_one({"id": att_id, "ipfs_status": "pending"}, {"$set": {"ipfs_status": "failed"}})
+    await db.attendance.update_one({"id": att_id, "chain_status": "pending"}, {"$set": {"chain_status": "failed"}})
+
+
+async def recover_attendance_outbox():
+    """Re-enqueue records that were committed but never reached the outbox (crash in between)."""
+    cursor = db.attendance.find(
+        {"$or": [{"ipfs_status": "pending"}, {"chain_status": "pending"}]},
+        {"_id": 0, "id": 1, "student_id": 1, "student_name": 1, "student_wallet": 1, "class_id": 1,
+         "class_name": 1, "qr_code_id": 1, "timestamp": 1, "blockchain_hash": 1}
+    )
+    async for r in cursor:
+        if await db.outbox.find_one({"id": r["id"]}, {"_id": 1}):
+            continue
+        ts = ensure_tz(r.get("timestamp"))
+        await attendance_outbox.enqueue(r["id"], "attendance", {
+            "ipfs_data": {
+                "type": "attendance_record",
+                "attendance_id": r["id"],
+                "student_id": r["student_id"],
+                "student_name": r.get("student_name"),
+                "student_wallet": r.get("student_wallet", ""),
+                "class_id": r["class_id"],
+                "class_name": r.get("class_name"),
+                "timestamp": ts.isoformat() if ts else None,
+                "blockchain_hash": r.get("blockchain_hash")
+            },
+            "session_code": r["qr_code_id"],
+            "student_id": r["student_id"],
+            "class_id": r["class_id"],
+        })
+        logger.info("Re-enqueued attendance %s into the outbox", r["id"])
+
+
+# ==================== ON-CHAIN BATCHING ====================
+# With CHAIN_BATCHING=true, marks are committed with one batchMarkAttendance
+# transaction per session every CHAIN_BATCH_WINDOW seconds or CHAIN_BATCH_SIZE marks.
+CHAIN_BATCHING = os.environ.get("CHAIN_BATCHING", "false").lower() == "true"
+CHAIN_BATCH_SIZE = int(os.environ.get("CHAIN_BATCH_SIZE", "25"))
+CHAIN_BATCH_WINDOW = float(os.environ.get("CHAIN_BATCH_WINDOW", "3"))
+
+
+async def commit_attendance_batch(session_code: str, class_id: str, student_ids: List[str]) -> Optional[dict]:
+    return await call_node_eth("batchMarkAttendance", {
+        "sessionCode": session_code,
+        "studentIds": student_ids,
+        "classId": class_id
+    })
+
+
+chain_batcher = ChainBatcher(
+    db.attendance,
+    commit_attendance_batch,
+    max_batch=CHAIN_BATCH_SIZE,
+    window=CHAIN_BATCH_WINDOW,
+)
+
+
+attendance_outbox = Outbox(
+    db.outbox,
+    process_attendance_job,
+    workers=OUTBOX_WORKERS,
+    max_attempts=OUTBOX_MAX_ATTEMPTS,
+    on_give_up=give_up_attendance_job,
+)
+
+# ==================== MERKLE ANCHORING ====================
+# With CHAIN_ANCHORING=true, marks are not sent on-chain one by one: the block
+# hashes of a whole session (ANCHOR_SCOPE=session) or of an ANCHOR_WINDOW-second
+# window (ANCHOR_SCOPE=window) become one Merkle tree whose root is anchored with
+# a single anchorMerkleRoot transaction (see merkle.py / merkle_anchor.py).
+# /attendance/{id}/proof serves the inclusion proof for offline verification.
+CHAIN_ANCHORING = os.environ.get("CHAIN_ANCHORING", "false").lower() == "true"
+ANCHOR_SCOPE = os.environ.get("ANCHOR_SCOPE", "session").lower()
+ANCHOR_WINDOW = int(os.environ.get("ANCHOR_WINDOW", "300"))
+ANCHOR_GRACE = float(os.environ.get("ANCHOR_GRACE", "60"))
+ANCHOR_INTERVAL = float(os.environ.get("ANCHOR_INTERVAL", "30"))
+
+
+def anchor_group_for(session_code: str, timestamp: datetime, expires_at: datetime):
+    """(anchor_group, anchor_after) for a mark made at `timestamp` in session `session_code`."""
+    if ANCHOR_SCOPE == "window":
+        start = int(timestamp.timestamp()) // ANCHOR_WINDOW * ANCHOR_WINDOW
+        end = datetime.fromtimestamp(start + ANCHOR_WINDOW, tz=timezone.utc)
+        return f"window-{start}", end + timedelta(seconds=ANCHOR_GRACE)
+    # the session is complete once its QR code has expired
+    return session_code, expires_at + timedelta(seconds=ANCHOR_GRACE)
+
+
+async def commit_merkle_root(anchor_id: str, root: str, leaf_count: int) -> Optional[dict]:
+    return await call_node_eth("anchorMerkleRoot", {
+        "anchorId": anchor_id,
+        "root": "0x" + root,
+        "leafCount": leaf_count
+    })
+
+
+merkle_anchorer = MerkleAnchorer(
+    db.attendance,
+    db.merkle_anchors,
+    commit_merkle_root,
+    interval=ANCHOR_INTERVAL,
+)
+
 # ==================== ATTENDANCE ROUTES ====================
+# Listings are paginated newest first on (timestamp, id): pass `limit` (default
+# ATTENDANCE_PAGE_SIZE, capped at ATTENDANCE_PAGE_MAX) and the `cursor` returned
+# in the X-Next-Cursor header of the previous page. No header = last page.
+ATTENDANCE_PAGE_SIZE = int(os.environ.get("ATTENDANCE_PAGE_SIZE", "200"))
+ATTENDANCE_PAGE_MAX = int(os.environ.get("ATTENDANCE_PAGE_MAX", "1000"))
+
+
+def page_request(query: dict, cursor: Optional[str], limit: Optional[int]):
+    """Keyset-restricted query and effective page size for one page request."""
+    limit = min(max(1, limit or ATTENDANCE_PAGE_SIZE), ATTENDANCE_PAGE_MAX)
+    try:
+        return keyset_query(query, cursor), limit
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]):
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+
+async def find_attendance_page(query: dict, cursor: Optional[str], limit: Optional[int], response: Response,
+                               shape: DocumentShape = ATTENDANCE_SHAPE) -> List[dict]:
+    query, limit = page_request(query, cursor, limit)
+    rows = await db.attendance.find(query, shape.projection).sort(KEYSET_SORT).limit(limit + 1).to_list(limit + 1)
+    rows, next_cursor = split_page(rows, limit)
+    set_next_cursor(response, next_cursor)
+    return rows
+
+
 @api_router.get("/attendance")
 async def query_attendance(
+    response: Response,
     class_id: Optional[str] = Query(None),
     student_id: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None),
     current_user: dict = Depends(get_current_user)
 ):
     query = {}
@@ -736,66 +1542,152 @@ async def query_attendance(
         else:
             query["student_id"] = current_user["id"]
     
-    records = await db.attendance.find(query).sort("timestamp", -1).to_list(1000)
+    # one aggregation instead of a users lookup per row
+    query, limit = page_request(query, cursor, limit)
+    records = await find_with_students(db.attendance, query, sort=dict(KEYSET_SORT), limit=limit + 1,
+                                       projection=ATTENDANCE_SHAPE.projection)
+    records, next_cursor = split_page(records, limit)
+    set_next_cursor(response, next_cursor)
     
-    result = []
     for r in records:
-        student = await db.users.find_one({"id": r.get("student_id")})
-        serialized = serialize_doc(r)
-        serialized["student_wallet"] = student.get("walletAddress", "") if student else ""
-        serialized["metamask_address"] = serialized["student_wallet"]
-        result.append(serialized)
+        student = r.pop("student", None) or {}
+        r["student_wallet"] = r["metamask_address"] = student.get("walletAddress", "")
     
-    return result
+    return json_response(records, response)
 
 @api_router.get("/attendance/my")
-async def get_my_attendance(current_user: dict = Depends(get_current_user)):
+async def get_my_attendance(
+    response: Response,
+    cursor: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None),
+    current_user: dict = Depends(get_current_user)
+):
     """Get attendance for current student - FOR GRAPHS"""
-    records = await db.attendance.find({"student_id": current_user["id"]}).sort("timestamp", -1).to_list(1000)
-    
-    result = []
-    for r in records:
-        ts = ensure_tz(r.get("timestamp"))
-        result.append({
-            "id": r.get("id"),
-            "student_id": r.get("student_id"),
-            "student_name": r.get("student_name"),
-            "class_id": r.get("class_id"),
-            "class_name": r.get("class_name"),
-            "timestamp": ts.isoformat() if ts else None,
-            "blockchain_hash": r.get("blockchain_hash"),
-            "blockchain_tx": r.get("blockchain_tx"),
-            "ipfs_cid": r.get("ipfs_cid"),
-            "qr_code_id": r.get("qr_code_id"),
-            "verified": r.get("verified", True)
-        })
-    
-    return result
+    records = await find_attendance_page({"student_id": current_user["id"]}, cursor, limit, response,
+                                         shape=ATTENDANCE_SUMMARY_SHAPE)
+    return json_response(ATTENDANCE_SUMMARY_SHAPE.many(records), response)
+
+# ==================== SCAN ADMISSION ====================
+# At most SCAN_MAX_ACTIVE scans per worker are processed at once, at most
+# SCAN_SESSION_MAX_ACTIVE of them for one QR session; the rest wait in a fair
+# queue per session (see scan_admission.py). A scan that finds the queue full
+# (SCAN_MAX_QUEUED, SCAN_SESSION_MAX_QUEUED) or waits SCAN_MAX_WAIT seconds gets
+# 202 {"status": "retry"} with Retry-After and the qr_content to resend.
+# SCAN_MAX_ACTIVE=0 turns admission control off.
+SCAN_MAX_WAIT = float(os.environ.get("SCAN_MAX_WAIT", "5"))
+scan_admission = ScanAdmission(
+    max_active=int(os.environ.get("SCAN_MAX_ACTIVE", "32")),
+    session_max_active=int(os.environ.get("SCAN_SESSION_MAX_ACTIVE", "16")),
+    max_queued=int(os.environ.get("SCAN_MAX_QUEUED", "1000")),
+    session_max_queued=int(os.environ.get("SCAN_SESSION_MAX_QUEUED", "500")),
+    max_wait=SCAN_MAX_WAIT,
+    retry_after_max=int(os.environ.get("SCAN_RETRY_AFTER_MAX", "15")),
+    registry=metrics,
+)
+
+
+# expires_at of recent QR sessions, for capping the codes handed out with a retry
+qr_session_ends: "OrderedDict[str, Optional[datetime]]" = OrderedDict()
+QR_SESSION_ENDS_MAX = 1024
+
+
+async def qr_session_end(qr_id: str) -> Optional[datetime]:
+    """The real end of a QR session from db.qr_codes (None if unknown or stopped), cached per worker."""
+    if qr_id in qr_session_ends:
+        qr_session_ends.move_to_end(qr_id)
+        return qr_session_ends[qr_id]
+    record = await db.qr_codes.find_one({"id": qr_id}, {"_id": 0, "expires_at": 1, "is_active": 1})
+    ends_at = ensure_tz(record["expires_at"]) if record and record.get("is_active") else None
+    qr_session_ends[qr_id] = ends_at
+    if len(qr_session_ends) > QR_SESSION_ENDS_MAX:
+        qr_session_ends.popitem(last=False)
+    return ends_at
+
+
+async def scan_retry_response(qr_content: str, class_id: str, qr_id: str, student_id: str,
+                              rejected: ScanRejected) -> JSONResponse:
+    if len(qr_content.split("|")) == 4:
+        # A rotating code may be retired before the retry arrives: hand out one of
+        # the same session that lives just long enough. The cap is the session's
+        # stored expiry, not one derived from the scanned code, so resent codes
+        # cannot be chained past the end (or past a stop, which is only
+        # remembered until that expiry).
+        ends_at = await qr_session_end(qr_id)
+        if ends_at is not None and qr_id not in revoked_qr_sessions:
+            retry_until = min(ends_at, get_utc_now() + timedelta(
+                seconds=rejected.retry_after + SCAN_MAX_WAIT + QR_ROTATION_GRACE))
+            if retry_until > get_utc_now():
+                # bound to this student: forwarded to an absent classmate it does not verify
+                qr_content = qr_signer.issue(class_id, qr_id, retry_until, student_id=student_id)
+    return JSONResponse(
+        status_code=202,
+        headers={"Retry-After": str(rejected.retry_after)},
+        content={
+            "status": "retry",
+            "message": "Many scans are being processed; resend the scan after retry_after seconds",
+            "reason": rejected.reason,
+            "retry_after": rejected.retry_after,
+            "qr_content": qr_content,
+        },
+    )
+
 
 @api_router.post("/attendance/mark")
+@stage_seconds.timed("attendance_mark")
 async def mark_attendance(attendance_data: AttendanceMark, current_user: dict = Depends(get_current_user)):
     """Mark attendance using QR code"""
-    qr_content = attendance_data.qr_content
-    
-    # Parse QR content
+    # the code is checked before queueing, so only valid scans take a place in line
+    class_id, qr_id, session_ends_by = await verify_scanned_qr(attendance_data.qr_content, current_user["id"])
     try:
-        parts = qr_content.split("|")
-        if len(parts) != 3:
-            raise ValueError()
+        async with scan_admission.slot(qr_id):
+            result = await record_attendance(current_user, class_id, qr_id, session_ends_by)
+    except ScanRejected as e:
+        return await scan_retry_response(attendance_data.qr_content, class_id, qr_id, current_user["id"], e)
+    if CHAIN_BATCHING and not (CHAIN_ANCHORING or ATTENDANCE_OUTBOX) and isinstance(result, dict):
+        # Wait for the session's batch transaction without holding a slot: the
+        # batch only fills up to CHAIN_BATCH_SIZE if more of its scans get in meanwhile
+        blockchain_tx = await chain_batcher.wait(result["attendance_id"], CHAIN_BATCH_WINDOW + ETH_CALL_TIMEOUT)
+        result["blockchain_tx"] = blockchain_tx
+        result["chain_status"] = "done" if blockchain_tx else "pending"
+    return result
+
+
+async def verify_scanned_qr(qr_content: str, student_id: str):
+    """(class_id, qr_id, session end) of a code scanned by `student_id`; HTTP 400 if it is invalid, expired or stopped."""
+    # Parse QR content
+    parts = qr_content.split("|")
+    if len(parts) == 4:
+        # Signed code: signature and expiry are checked in memory, no qr_codes lookup
+        try:
+            class_id, qr_id, expires_at = qr_signer.verify(qr_content, student_id=student_id)
+        except ExpiredQRToken:
+            raise HTTPException(status_code=400, detail="QR code expired")
+        except InvalidQRToken:
+            raise HTTPException(status_code=400, detail="Invalid or expired QR code")
+        if qr_id in revoked_qr_sessions:
+            raise HTTPException(status_code=400, detail="QR code is no longer active")
+        # a rotating code expires with its slot; the session ends at most this much later
+        session_ends_by = expires_at + timedelta(minutes=QR_SESSION_MINUTES) if QR_ROTATION_SECONDS else expires_at
+    elif len(parts) == 3 and QR_ACCEPT_LEGACY:
         class_id, qr_id, _ = parts
-    except:
+
+        # Verify QR code
+        qr_record = await db.qr_codes.find_one({"id": qr_id, "is_active": True})
+        if not qr_record:
+            raise HTTPException(status_code=400, detail="Invalid or expired QR code")
+
+        expires_at = ensure_tz(qr_record["expires_at"])
+        if get_utc_now() > expires_at:
+            await db.qr_codes.update_one({"id": qr_id}, {"$set": {"is_active": False}})
+            raise HTTPException(status_code=400, detail="QR code expired")
+        session_ends_by = expires_at
+    else:
         raise HTTPException(status_code=400, detail="Invalid QR code format")
-    
-    # Verify QR code
-    qr_record = await db.qr_codes.find_one({"id": qr_id, "is_active": True})
-    if not qr_record:
-        raise HTTPException(status_code=400, detail="Invalid or expired QR code")
-     
-    expires_at = ensure_tz(qr_record["expires_at"])
-    if get_utc_now() > expires_at:
-        await db.qr_codes.update_one({"id": qr_id}, {"$set": {"is_active": False}})
-        raise HTTPException(status_code=400, detail="QR code expired")
-    
+    return class_id, qr_id, session_ends_by
+
+
+async def record_attendance(current_user: dict, class_id: str, qr_id: str, session_ends_by: datetime):
+    """Everything after the code check: Mongo, IPFS and the chain."""
     # Check duplicate
     existing = await db.attendance.find_one({
          "student_id": current_user["id"],
@@ -820,6 +1712,7 @@ async def mark_attendance(attendance_data: AttendanceMark, current_user: dict =
             {"id": class_id},
             {"$addToSet": {"students_enrolled": current_user["id"]}}
         )
+        await dashboard_stats.student_enrolled(current_user["id"], class_id, cls.get("teacher_id"))
     
     # Create attendance data
     att_id = str(uuid.uuid4())
@@ -847,10 +1740,6 @@ async def mark_attendance(attendance_data: AttendanceMark, current_user: dict =
         "timestamp": timestamp.isoformat()
     }
     
-    last_block = await db.blockchain.find().sort("block_number", -1).limit(1).to_list(1)
-    prev_hash = last_block[0]["hash"] if last_block else "0"
-    block_num = (last_block[0]["block_number"] + 1) if last_block else 1
-    
     block_hash = calculate_hash(json.dumps(block_data, sort_keys=True))
     attendance_doc["blockchain_hash"] = block_hash
     
@@ -866,18 +1755,83 @@ async def mark_attendance(attendance_data: AttendanceMark, current_user: dict =
         "timestamp": timestamp.isoformat(),
         "blockchain_hash": block_hash
     }
-    
-    ipfs_cid = await upload_to_ipfs(ipfs_data)
-    logger.info("IPFS upload result for attendance %s -> %s", att_id, ipfs_cid)
 
-    if ipfs_cid:
-        attendance_doc["ipfs_cid"] = ipfs_cid
-        block_data["ipfs_cid"] = ipfs_cid
-    
-    # Call Ethereum contract
     # Use qr_id as the canonical on-chain sessionCode created when QR was generated
     session_code = qr_id
 
+    # block_number / previous_hash are assigned by the ledger sequencer on append
+    block_doc = {
+        "id": str(uuid.uuid4()),
+        "hash": block_hash,
+        "data": block_data,
+        "timestamp": timestamp,
+        "nonce": secrets.randbelow(1000000)
+    }
+
+    ipfs_cid = None
+    if USE_IPFS and IPFS_SESSION_BUNDLES:
+        # Uploaded with the rest of the session once the QR code has expired
+        attendance_doc["ipfs_status"] = "bundle_pending"
+        attendance_doc["ipfs_payload"] = ipfs_data
+        attendance_doc["ipfs_bundle_after"] = session_ends_by + timedelta(seconds=IPFS_BUNDLE_GRACE)
+    elif USE_IPFS and IPFS_LOCAL_CID:
+        # CID is known without a round-trip; the object is pinned later in bulk
+        ipfs_cid = await store_ipfs_deferred(ipfs_data)
+        attendance_doc["ipfs_cid"] = ipfs_cid
+        attendance_doc["ipfs_status"] = "unpinned"
+        block_data["ipfs_cid"] = ipfs_cid
+
+    if CHAIN_ANCHORING:
+        # Covered by the Merkle root of its session / window once that closes
+        anchor_group, anchor_after = anchor_group_for(session_code, timestamp, session_ends_by)
+        attendance_doc.update({
+            "chain_status": "anchor_pending",
+            "anchor_group": anchor_group,
+            "anchor_after": anchor_after,
+        })
+
+    if ATTENDANCE_OUTBOX:
+        # Write-behind: commit locally now, let the outbox do IPFS + chain later
+        attendance_doc.update({
+            "ipfs_cid": ipfs_cid,
+            "ipfs_status": attendance_doc.get("ipfs_status") or ("pending" if USE_IPFS else "skipped"),
+            "blockchain_tx": None,
+            "chain_status": attendance_doc.get("chain_status") or "pending",
+        })
+        await ledger.append(block_doc)
+        await db.attendance.insert_one(attendance_doc)
+        await dashboard_stats.attendance_marked(attendance_doc, cls.get("teacher_id"))
+        analytics_cache.invalidate(class_id)
+        await attendance_outbox.enqueue(att_id, "attendance", {
+            "ipfs_data": ipfs_data,
+            "session_code": session_code,
+            "student_id": current_user["id"],
+            "class_id": class_id,
+        })
+        if CHAIN_BATCHING and not CHAIN_ANCHORING:
+            chain_batcher.notify(session_code)
+
+        return {
+            "status": "success",
+            "message": "Attendance marked successfully; blockchain confirmation pending",
+            "attendance_id": att_id,
+            "blockchain_hash": block_hash,
+            "ipfs_cid": ipfs_cid,
+            "blockchain_tx": None,
+            "ipfs_status": attendance_doc["ipfs_status"],
+            "chain_status": attendance_doc["chain_status"],
+            "status_url": f"/api/attendance/{att_id}/status"
+        }
+
+    if ipfs_cid is None and attendance_doc.get("ipfs_status") != "bundle_pending":
+        ipfs_cid = await upload_to_ipfs(ipfs_data)
+        logger.info("IPFS upload result for attendance %s -> %s", att_id, ipfs_cid)
+
+        if ipfs_cid:
+            attendance_doc["ipfs_cid"] = ipfs_cid
+            block_data["ipfs_cid"] = ipfs_cid
+        attendance_doc["ipfs_status"] = "done" if ipfs_cid else ("failed" if USE_IPFS else "skipped")
+    
     # Pre-check session validity on-chain
     try:
         is_valid_res = await call_node_eth("isSessionValid", {"sessionCode": session_code})
@@ -889,47 +1843,141 @@ async def mark_attendance(attendance_data: AttendanceMark, current_user: dict =
         logger.exception("Error checking session validity: %s", e)
         raise HTTPException(status_code=500, detail="Error validating session")
 
-    eth_result = await call_node_eth("markAttendance", {
-        "sessionCode": session_code,
-        "studentId": current_user["id"],
-        "classId": class_id
-    })
-    
-    if eth_result and eth_result.get("txHash"):
-        attendance_doc["blockchain_tx"] = eth_result["txHash"]
-    
-    # Save blockchain block
-    block_doc = {
-        "id": str(uuid.uuid4()),
-        "block_number": block_num,
-        "hash": block_hash,
-        "previous_hash": prev_hash,
-        "data": block_data,
-        "timestamp": timestamp,
-        "nonce": secrets.randbelow(1000000)
-    }
-    await db.blockchain.insert_one(block_doc)
-    
-    # Save attendance
-    await db.attendance.insert_one(attendance_doc)
+    if CHAIN_ANCHORING:
+        await ledger.append(block_doc)
+        await db.attendance.insert_one(attendance_doc)
+        await dashboard_stats.attendance_marked(attendance_doc, cls.get("teacher_id"))
+        analytics_cache.invalidate(class_id)
+        blockchain_tx = None
+        chain_status = attendance_doc["chain_status"]
+    elif CHAIN_BATCHING:
+        # Commit locally as pending; mark_attendance waits for this session's batch transaction
+        attendance_doc["chain_status"] = "pending"
+        await ledger.append(block_doc)
+        await db.attendance.insert_one(attendance_doc)
+        await dashboard_stats.attendance_marked(attendance_doc, cls.get("teacher_id"))
+        analytics_cache.invalidate(class_id)
+        chain_batcher.notify(session_code)
+        blockchain_tx = None
+        chain_status = "pending"
+    else:
+        eth_result = await call_node_eth("markAttendance", {
+            "sessionCode": session_code,
+            "studentId": current_user["id"],
+            "classId": class_id
+        })
+        
+        blockchain_tx = eth_result.get("txHash") if eth_result else None
+        if blockchain_tx:
+            attendance_doc["blockchain_tx"] = blockchain_tx
+        chain_status = attendance_doc["chain_status"] = "done" if blockchain_tx else "failed"
+        
+        # Save blockchain block
+        await ledger.append(block_doc)
+        
+        # Save attendance
+        await db.attendance.insert_one(attendance_doc)
+        await dashboard_stats.attendance_marked(attendance_doc, cls.get("teacher_id"))
+        analytics_cache.invalidate(class_id)
     
     return {
         "status": "success",
         "message": "Attendance marked successfully",
+        "attendance_id": att_id,
         "blockchain_hash": block_hash,
         "ipfs_cid": ipfs_cid,
-        "blockchain_tx": eth_result.get("txHash") if eth_result else None
+        "blockchain_tx": blockchain_tx,
+        "ipfs_status": attendance_doc["ipfs_status"],
+        "chain_status": chain_status
     }
 
+@api_router.get("/attendance/{attendance_id}/status")
+async def get_attendance_status(attendance_id: str, current_user: dict = Depends(get_current_user)):
+    """Poll IPFS / blockchain confirmation state of one attendance record."""
+    record = await db.attendance.find_one({"id": attendance_id})
+    if not record:
+        raise HTTPException(status_code=404, detail="Attendance record not found")
+
+    if record["student_id"] != current_user["id"]:
+        cls = await db.classes.find_one({"id": record["class_id"], "teacher_id": current_user["id"]})
+        if not cls:
+            raise HTTPException(status_code=403, detail="Access denied")
+
+    job = await db.outbox.find_one({"id": attendance_id}, {"_id": 0, "status": 1, "attempts": 1, "last_error": 1, "next_attempt_at": 1})
+
+    return serialize_doc({
+        "id": attendance_id,
+        "ipfs_status": record.get("ipfs_status", "done" if record.get("ipfs_cid") else "unknown"),
+        "ipfs_cid": record.get("ipfs_cid"),
+        "ipfs_bundle_cid": record.get("ipfs_bundle_cid"),
+        "ipfs_path": record.get("ipfs_path"),
+        "chain_status": record.get("chain_status", "done" if record.get("blockchain_tx") else "unknown"),
+        "blockchain_tx": record.get("blockchain_tx"),
+        "chain_error": record.get("chain_error"),
+        "blockchain_hash": record.get("blockchain_hash"),
+        "outbox": job
+    })
+
+@api_router.get("/attendance/{attendance_id}/proof")
+async def get_attendance_proof(attendance_id: str, current_user: dict = Depends(get_current_user)):
+    """Merkle inclusion proof of one attendance record against its anchored root."""
+    record = await db.attendance.find_one({"id": attendance_id})
+    if not record:
+        raise HTTPException(status_code=404, detail="Attendance record not found")
+
+    if record["student_id"] != current_user["id"]:
+        cls = await db.classes.find_one({"id": record["class_id"], "teacher_id": current_user["id"]})
+        if not cls:
+            raise HTTPException(status_code=403, detail="Access denied")
+
+    anchor = None
+    if record.get("anchor_id"):
+        anchor = await db.merkle_anchors.find_one({"id": record["anchor_id"]}, {"_id": 0})
+    if not anchor:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No Merkle anchor for this record yet (chain_status: {record.get('chain_status', 'unknown')})"
+        )
+
+    index = anchor["attendance_ids"].index(attendance_id)
+    return serialize_doc({
+        "id": attendance_id,
+        "block_hash": record["blockchain_hash"],
+        "leaf_index": index,
+        "leaf_count": anchor["leaf_count"],
+        "root": anchor["root"],
+        "proof": inclusion_proof(anchor["leaves"], index),
+        "algorithm": MERKLE_ALGORITHM,
+        "anchor": {
+            "id": anchor["id"],
+            "group": anchor["group"],
+            "status": anchor["status"],
+            "tx_hash": anchor.get("tx_hash"),
+            "chain_block_number": anchor.get("chain_block_number"),
+            "anchored_at": anchor.get("anchored_at"),
+        },
+    })
+
 @api_router.get("/attendance/history")
-async def get_attendance_history(current_user: dict = Depends(get_current_user)):
+async def get_attendance_history(
+    response: Response,
+    cursor: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None),
+    current_user: dict = Depends(get_current_user)
+):
     """Get detailed attendance history for the current user."""
-    records = await db.attendance.find({"student_id": current_user["id"]}).sort("timestamp", -1).to_list(1000)
-    return serialize_doc(records)
+    records = await find_attendance_page({"student_id": current_user["id"]}, cursor, limit, response)
+    return json_response(records, response)
 
 @api_router.get("/attendance/class/{class_id}")
-async def get_class_attendance(class_id: str, current_user: dict = Depends(get_current_user)):
-    """Get all attendance records for a specific class."""
+async def get_class_attendance(
+    class_id: str,
+    response: Response,
+    cursor: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get attendance records for a specific class, one page at a time."""
     if current_user["role"] != "teacher":
         raise HTTPException(status_code=403, detail="Access denied")
 
@@ -937,12 +1985,90 @@ async def get_class_attendance(class_id: str, current_user: dict = Depends(get_c
     if not cls:
         raise HTTPException(status_code=404, detail="Class not found or you are not the teacher")
 
-    records = await db.attendance.find({"class_id": class_id}).sort("timestamp", -1).to_list(None)
-    return serialize_doc(records)
+    records = await find_attendance_page({"class_id": class_id}, cursor, limit, response)
+    return json_response(records, response)
+
+CSV_EXPORT_BATCH_SIZE = int(os.environ.get("CSV_EXPORT_BATCH_SIZE", "1000"))
+CSV_STUDENT_CACHE_SIZE = int(os.environ.get("CSV_STUDENT_CACHE_SIZE", "5000"))
+CSV_HEADER = ["Name", "Roll Number", "Email", "Timestamp", "Blockchain Hash", "QR Code ID", "Class Name"]
+
+
+async def iter_attendance_csv(query: dict, compress: bool):
+    """Yield the CSV one cursor batch at a time (gzip-compressed when `compress`)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_ALL, lineterminator="\n")
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    # student profiles are shared by many rows; keep the most recently used ones
+    students: "OrderedDict[str, dict]" = OrderedDict()
+
+    def encode(text: str) -> bytes:
+        data = text.encode("utf-8")
+        return compressor.compress(data) if compressor else data
+
+    def take() -> str:
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    writer.writerow(CSV_HEADER)
+    cursor = db.attendance.find(
+        query,
+        {"_id": 0, "student_id": 1, "timestamp": 1, "blockchain_hash": 1, "qr_code_id": 1, "class_name": 1},
+        batch_size=CSV_EXPORT_BATCH_SIZE,
+    ).sort("timestamp", -1)
+
+    while True:
+        batch = await cursor.to_list(CSV_EXPORT_BATCH_SIZE)
+        if not batch:
+            break
+
+        missing = list({r["student_id"] for r in batch if r.get("student_id") not in students})
+        if missing:
+            async for student in db.users.find(
+                {"id": {"$in": missing}}, {"_id": 0, "id": 1, "name": 1, "rollNumber": 1, "student_id": 1, "email": 1}
+            ):
+                students[student["id"]] = student
+        for r in batch:
+            if r.get("student_id") in students:
+                students.move_to_end(r["student_id"])
+        while len(students) > CSV_STUDENT_CACHE_SIZE:
+            students.popitem(last=False)
+
+        for record in batch:
+            student = students.get(record.get("student_id"), {})
+            timestamp = record.get("timestamp")
+            writer.writerow([
+                student.get("name", "N/A"),
+                # 'rollNumber' from the user profile, falling back to student_id
+                student.get("rollNumber") or student.get("student_id", "N/A"),
+                student.get("email", "N/A"),
+                timestamp.isoformat() if timestamp else "N/A",
+                record.get("blockchain_hash", "N/A"),
+                record.get("qr_code_id", "N/A"),
+                record.get("class_name", "N/A"),
+            ])
+        chunk = encode(take())
+        if chunk:
+            yield chunk
+
+    tail = encode(take())
+    if compressor:
+        tail += compressor.flush()
+    if tail:
+        yield tail
+
 
 @api_router.get("/attendance/class/{class_id}/export-csv")
-async def export_class_attendance_csv(class_id: str, current_user: dict = Depends(get_current_user)):
-    """Export all attendance records for a specific class as CSV."""
+async def export_class_attendance_csv(
+    class_id: str,
+    request: Request,
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    gzip: bool = Query(False),
+    current_user: dict = Depends(get_current_user)
+):
+    """Stream a class's attendance records as CSV, optionally limited to [from, to] and gzip-encoded."""
     if current_user["role"] != "teacher":
         raise HTTPException(status_code=403, detail="Access denied")
 
@@ -950,90 +2076,196 @@ async def export_class_attendance_csv(class_id: str, current_user: dict = Depend
     if not cls:
         raise HTTPException(status_code=404, detail="Class not found or you are not the teacher")
 
-    # 1. Fetch all attendance records for the class
-    attendance_records = await db.attendance.find({"class_id": class_id}).sort("timestamp", -1).to_list(None)
-    
-    if not attendance_records:
+    query: Dict[str, Any] = {"class_id": class_id}
+    if date_from or date_to:
+        query["timestamp"] = {}
+        if date_from:
+            query["timestamp"]["$gte"] = ensure_tz(date_from)
+        if date_to:
+            query["timestamp"]["$lte"] = ensure_tz(date_to)
+
+    if not await db.attendance.find_one(query, {"_id": 1}):
         return Response(content="No attendance records found for this class.", media_type="text/plain")
 
-    # 2. Get unique student IDs
-    student_ids = list(set(r["student_id"] for r in attendance_records))
-    
-    # 3. Fetch student profiles in one go
-    students = await db.users.find({"id": {"$in": student_ids}}).to_list(None)
-    student_map = {s["id"]: s for s in students}
+    headers = {"Content-Disposition": f"attachment; filename=attendance_export_{class_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"}
+    compress = gzip and "gzip" in request.headers.get("accept-encoding", "").lower()
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+
+    return StreamingResponse(iter_attendance_csv(query, compress), media_type="text/csv", headers=headers)
+
+# ==================== ANALYTICS ====================
+async def get_class_analytics(cls: dict) -> dict:
+    """Cached analytics of a class, recomputed when a mark, session or enrollment was added."""
+    fingerprint = await class_fingerprint(db, cls)
+    result = analytics_cache.get(cls["id"], fingerprint)
+    if result is None:
+        result = await load_and_compute(db, cls, **ANALYTICS_THRESHOLDS)
+        analytics_cache.put(cls["id"], fingerprint, result)
+    return result
 
-    # 4. Prepare CSV content
-    csv_data = []
-    # Header row
-    csv_data.append("Name,Roll Number,Email,Timestamp,Blockchain Hash,QR Code ID,Class Name")
+@api_router.get("/analytics/class/{class_id}")
+async def get_class_analytics_report(
+    class_id: str,
+    include_matrix: bool = Query(False),
+    current_user: dict = Depends(get_current_user)
+):
+    """Per-student rates and streaks, at-risk students, per-session and weekly attendance rates."""
+    if current_user["role"] != "teacher":
+        raise HTTPException(status_code=403, detail="Access denied")
 
-    for record in attendance_records:
-        student = student_map.get(record["student_id"], {})
-        
-        name = student.get("name", "N/A")
-        # Assuming 'rollNumber' is stored in the user profile, falling back to student_id
-        roll_number = student.get("rollNumber") or student.get("student_id", "N/A")
-        email = student.get("email", "N/A")
-        timestamp = record.get("timestamp").isoformat() if record.get("timestamp") else "N/A"
-        blockchain_hash = record.get("blockchain_hash", "N/A")
-        qr_code_id = record.get("qr_code_id", "N/A")
-        class_name = record.get("class_name", "N/A")
-
-        # Escape commas in fields like name or class name if necessary, though unlikely here
-        row = f'"{name}","{roll_number}","{email}","{timestamp}","{blockchain_hash}","{qr_code_id}","{class_name}"'
-        csv_data.append(row)
-
-    csv_content = "\n".join(csv_data)
-
-    # 5. Return CSV response
-    return Response(
-        content=csv_content, 
-        media_type="text/csv", 
-        headers={"Content-Disposition": f"attachment; filename=attendance_export_{class_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"}
-    )
-    
-# ==================== APP SETUP ====================
+    cls = await db.classes.find_one({"id": class_id, "teacher_id": current_user["id"]},
+                                    {"_id": 0, "id": 1, "name": 1, "students_enrolled": 1})
+    if not cls:
+        raise HTTPException(status_code=404, detail="Class not found or you are not the teacher")
+
+    result = await get_class_analytics(cls)
+    if not include_matrix:
+        result = {k: v for k, v in result.items() if k != "matrix"}
+    return json_response({"class_name": cls.get("name"), **result})
+
+@api_router.get("/analytics/student/{student_id}")
+async def get_student_analytics(student_id: str, current_user: dict = Depends(get_current_user)):
+    """One student's rate and streaks in each class (all of theirs, or the requesting teacher's)."""
+    if current_user["role"] == "student" and current_user["id"] == student_id:
+        query = {"students_enrolled": student_id}
+    elif current_user["role"] == "teacher":
+        query = {"students_enrolled": student_id, "teacher_id": current_user["id"]}
+    else:
+        raise HTTPException(status_code=403, detail="Access denied")
+
+    classes = await db.classes.find(query, {"_id": 0, "id": 1, "name": 1, "students_enrolled": 1}).to_list(None)
+    rows = []
+    for cls in classes:
+        result = await get_class_analytics(cls)
+        metrics = next((m for m in result["student_metrics"] if m["student_id"] == student_id), None)
+        if metrics is None:
+            continue
+        at_risk = any(r["student_id"] == student_id for r in result["at_risk"])
+        rows.append({"class_id": cls["id"], "class_name": cls.get("name"), "class_rate": result["overall_rate"],
+                     "sessions": result["sessions"], "at_risk": at_risk, **metrics})
+
+    attended = sum(r["attended"] for r in rows)
+    sessions = sum(r["sessions"] for r in rows)
+    return json_response({
+        "student_id": student_id,
+        "attended": attended,
+        "sessions": sessions,
+        "rate": round(attended / sessions, 4) if sessions else 0.0,
+        "classes": rows,
+    })
+
+# ==================== ADMIN ROUTES ====================
+@api_router.get("/admin/ledger")
+async def get_ledger_stats(current_user: dict = Depends(get_admin_user)):
+    """Ledger sequencer: chain tip, append batch sizes and commit latency."""
+    return ledger.stats()
+
+@api_router.get("/admin/ledger/verify")
+async def get_ledger_verification(current_user: dict = Depends(get_admin_user)):
+    """Verified-up-to checkpoint of the ledger and the report of the last verification run."""
+    return serialize_doc(await ledger_verifier.status())
+
+@api_router.post("/admin/ledger/verify", status_code=202)
+async def start_ledger_verification(
+    full: bool = Query(False),
+    workers: int = Query(1, ge=1),
+    current_user: dict = Depends(get_admin_user)
+):
+    """Verify blocks added since the checkpoint (or all of them with `full`) in the background."""
+    if not ledger_verifier.start_run(full=full, workers=min(workers, LEDGER_VERIFY_MAX_WORKERS)):
+        raise HTTPException(status_code=409, detail="A ledger verification is already running")
+    return serialize_doc(await ledger_verifier.status())
+
+@api_router.get("/admin/qr-render")
+async def get_qr_render_stats(current_user: dict = Depends(get_admin_user)):
+    """QR render cache hit rate and average render time per output format."""
+    return {"rotation_seconds": QR_ROTATION_SECONDS, **qr_renderer.stats()}
+
+@api_router.post("/admin/dashboard-stats/rebuild")
+async def rebuild_dashboard_stats(current_user: dict = Depends(get_admin_user)):
+    """Recompute every student / teacher dashboard counter from classes and attendance."""
+    return serialize_doc(await dashboard_stats.rebuild())
+
+@api_router.get("/admin/analytics-cache")
+async def get_analytics_cache_stats(current_user: dict = Depends(get_admin_user)):
+    """Hit rate of the per-class analytics cache (each hit is a full recomputation saved)."""
+    return analytics_cache.stats()
+
+@api_router.get("/admin/rate-limit")
+async def get_rate_limit_stats(current_user: dict = Depends(get_admin_user)):
+    """Rate limit policies with allowed / limited counts, and the counter store's size."""
+    return rate_limiter.stats()
+
+@api_router.get("/admin/http-pools")
+async def get_http_pool_stats(current_user: dict = Depends(get_admin_user)):
+    """Connection pool usage per external HTTP backend, for sizing under load."""
+    return http_clients.stats()
+
+@api_router.get("/admin/ipfs-cache")
+async def get_ipfs_cache_stats(current_user: dict = Depends(get_admin_user)):
+    """Hit / miss / eviction counters of the CID cache."""
+    return ipfs_cache.stats()
+
+@api_router.get("/admin/ipfs-gateways")
+async def get_ipfs_gateway_stats(current_user: dict = Depends(get_admin_user)):
+    """Running latency / health score and hedge delay per IPFS gateway."""
+    return {"mode": IPFS_GATEWAY_MODE, "gateways": gateway_scoreboard.stats()}
+
+@api_router.get("/admin/ipfs-pins")
+async def get_ipfs_pin_stats(current_user: dict = Depends(get_admin_user)):
+    """Deferred pinning backlog and reconciliation counters (IPFS_LOCAL_CID)."""
+    return {"local_cid": IPFS_LOCAL_CID, **(await ipfs_pinner.stats())}
+
+@api_router.get("/admin/scan-admission")
+async def get_scan_admission_stats(current_user: dict = Depends(get_admin_user)):
+    """Scans being processed and queued in this worker, busiest sessions and admission outcomes."""
+    return scan_admission.stats()
+
+@api_router.get("/admin/password-hashing")
+async def get_password_hashing_stats(current_user: dict = Depends(get_admin_user)):
+    """bcrypt worker usage: queue depth, rejections (429s) and latency percentiles."""
+    return password_hasher.stats()
+
+@api_router.get("/admin/user-cache")
+async def get_user_cache_stats(current_user: dict = Depends(get_admin_user)):
+    """Hit rate of the authenticated-user cache (each hit is a users lookup saved)."""
+    return {
+        "enabled": USER_CACHE_TTL > 0,
+        "invalidation": USER_CACHE_INVALIDATION,
+        **user_cache.stats(),
+        "channel": user_cache_channel.stats() if user_cache_channel is not None else None,
+    }
+
+@api_router.get("/admin/ipfs-bundles")
+async def get_ipfs_bundle_stats(current_user: dict = Depends(get_admin_user)):
+    """Session bundling counters and how many records are still waiting for their bundle."""
+    return {"enabled": IPFS_SESSION_BUNDLES, **(await ipfs_bundler.stats())}
+
+@api_router.get("/admin/merkle-anchors")
+async def get_merkle_anchor_stats(current_user: dict = Depends(get_admin_user)):
+    """Merkle anchoring: roots anchored, records per root and records still waiting."""
+    waiting = await db.attendance.count_documents({"chain_status": {"$in": ["anchor_pending", "anchoring"]}})
+    return {"enabled": CHAIN_ANCHORING, "scope": ANCHOR_SCOPE, "waiting": waiting, **merkle_anchorer.stats()}
 
 # ==================== APP SETUP ====================
 app.include_router(api_router)
 
-# CORS Middleware
-# ==================== SECURITY MIDDLEWARE ====================
 
-# Simple in-memory rate limiter
-RATE_LIMIT_WINDOW = 60  # seconds
-RATE_LIMIT_MAX_REQUESTS = 10  # max requests per window
-rate_limit_store = defaultdict(lambda: {"count": 0, "reset_time": 0})
-
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        # Apply rate limiting only to auth endpoints
-        if request.url.path in ["/api/auth/register", "/api/auth/login"]:
-            # Use X-Forwarded-For if available, otherwise client.host
-            client_ip = request.headers.get("X-Forwarded-For") or request.client.host
-            current_time = time.time()
-            
-            # Check if the window has reset
-            if current_time > rate_limit_store[client_ip]["reset_time"]:
-                rate_limit_store[client_ip]["count"] = 0
-                rate_limit_store[client_ip]["reset_time"] = current_time + RATE_LIMIT_WINDOW
-            
-            # Check limit
-            if rate_limit_store[client_ip]["count"] >= RATE_LIMIT_MAX_REQUESTS:
-                return JSONResponse(
-                    status_code=429,
-                    content={"detail": "Rate limit exceeded. Try again in a minute."},
-                    headers={"Retry-After": str(int(rate_limit_store[client_ip]["reset_time"] - current_time))}
-                )
-            
-            # Increment count
-            rate_limit_store[client_ip]["count"] += 1
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(request: Request):
+    """Stage latency histograms of every worker, in the Prometheus text format."""
+    if METRICS_TOKEN and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    snapshot = await asyncio.to_thread(metrics_snapshots.collect)
+    return Response(render_metrics(snapshot), media_type="text/plain; version=0.0.4; charset=utf-8")
 
-        response = await call_next(request)
-        return response
+# CORS Middleware
+# ==================== SECURITY MIDDLEWARE ====================
 
-app.add_middleware(RateLimitMiddleware)
+# Pure ASGI: routes without a rate limit policy pass straight through
+app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
 
 # CORS Middleware
 app.add_middleware(
@@ -1042,6 +2274,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 from pymongo.errors import OperationFailure
 import logging
@@ -1156,8 +2389,86 @@ async def startup_event():
 
     await db.qr_codes.create_index("id", unique=True)
     await db.qr_codes.create_index("expires_at", expireAfterSeconds=0)
+    if RATE_LIMIT_BACKEND == "mongo":
+        await db.rate_limits.create_index("expires_at", expireAfterSeconds=0)
+    await db.qr_codes.create_index("revoked_at", sparse=True)
+    await db.qr_codes.create_index([("teacher_id", 1), ("expires_at", 1)])
+    await db.qr_codes.create_index([("class_id", 1), ("created_at", -1)])
+    # keyset pagination: (filter, timestamp, id) newest first
+    await db.attendance.create_index([("class_id", 1), ("timestamp", -1), ("id", -1)])
+    await db.attendance.create_index([("student_id", 1), ("timestamp", -1), ("id", -1)])
+    await db.attendance.create_index("ipfs_status")
+    await db.attendance.create_index("ipfs_cid", sparse=True)
+    await db.attendance.create_index("chain_status")
+    await db.blockchain.create_index("data.attendance_id")
+    await ledger.start()
+    await ledger_verifier.start()
     logger.info("MongoDB indexes created.")
 
+    await ipfs_cache.load()
+
+    try:
+        await password_hasher.start()
+    except Exception as e:
+        logger.warning("Could not pre-start password hashing workers: %s", e)
+
+    await qr_revocation_feed.start()
+    await metrics_snapshots.start()
+
+    if user_cache_channel is not None:
+        try:
+            await user_cache_channel.start()
+        except Exception as e:
+            # without the channel, other workers only see updates after USER_CACHE_TTL
+            logger.warning("Could not start user cache invalidation channel: %s", e)
+
+    # Warm up the eth_runner daemon so the first scan does not pay for node startup
+    pool = get_eth_runner_pool()
+    if pool is not None:
+        try:
+            await pool.start()
+        except EthRunnerError as e:
+            logger.warning("Could not start eth_runner daemon at startup: %s", e)
+
+    if CHAIN_BATCHING:
+        await chain_batcher.start()
+
+    # Like the outbox, the pinner runs regardless of IPFS_LOCAL_CID so objects
+    # recorded before a config change still get pinned.
+    await ipfs_pinner.start()
+    await ipfs_bundler.start()
+    # Runs regardless of CHAIN_ANCHORING so records left pending still get anchored
+    await merkle_anchorer.start()
+
+    # The outbox also runs when ATTENDANCE_OUTBOX is off, so records queued
+    # before a config change still drain.
+    await attendance_outbox.start()
+    try:
+        await recover_attendance_outbox()
+    except Exception as e:
+        logger.exception("Outbox recovery sweep failed: %s", e)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await attendance_outbox.stop()
+    await ledger.stop()
+    await ledger_verifier.stop()
+    await chain_batcher.stop()
+    await ipfs_pinner.stop()
+    await ipfs_bundler.stop()
+    await merkle_anchorer.stop()
+    await qr_revocation_feed.stop()
+    await metrics_snapshots.stop()
+    if user_cache_channel is not None:
+        await user_cache_channel.stop()
+    if eth_runner_pool is not None:
+        await eth_runner_pool.close()
+    await http_clients.aclose()
+    await password_hasher.close()
+    qr_renderer.close()
+    rate_limit_store.close()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=5000)
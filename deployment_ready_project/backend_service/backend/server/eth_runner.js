@@ -4,11 +4,20 @@
  * Ethereum Runner Script
  * Handles blockchain interactions for the attendance system
  * Usage: node eth_runner.js <action> <json_payload>
+ *        node eth_runner.js --daemon
+ *
+ * In daemon mode the runner stays alive and reads newline-delimited JSON
+ * requests of the form {"id": "...", "action": "...", "payload": {...}} from
+ * stdin, writing one {"id": "...", "ok": true|false, ...} line per reply.
+ * Replies carry "timings" (run_ms, and send_ms / wait_ms for transactions).
  */
 
 const { ethers } = require('ethers');
 const fs = require('fs');
 const path = require('path');
+const readline = require('readline');
+const { AsyncLocalStorage } = require('async_hooks');
+const { performance } = require('perf_hooks');
 
 // Configuration
 const CONFIG = {
@@ -22,6 +31,10 @@ const CONFIG = {
 const CONTRACT_ABI = [
     "function createSession(string sessionCode, string classId, uint256 durationMinutes) external",
     "function markAttendance(string sessionCode, string studentId, string classId) external",
+    "function batchMarkAttendance(string sessionCode, string[] studentIds, string classId) external",
+    "event AttendanceBatchMarked(string indexed sessionCode, uint256 marked, uint256 skipped)",
+    "event AttendanceMarked(string indexed sessionCode, string indexed studentId, address indexed studentAddress, uint256 timestamp)",
+    "function anchorMerkleRoot(string anchorId, bytes32 root, uint256 leafCount) external",
     "function hasAttended(string sessionCode, string studentId) external view returns (bool)",
     "function getAttendanceRecord(string sessionCode, string studentId) external view returns (tuple(string sessionCode, string classId, string studentId, address studentAddress, uint256 timestamp, bool verified))",
     "function isSessionValid(string sessionCode) external view returns (bool)",
@@ -31,10 +44,33 @@ const CONTRACT_ABI = [
     "function registerStudent(string studentId, address studentAddress) external"
 ];
 
+// Cached { contract, provider, wallet } shared by every call in this process
+let contractPromise = null;
+
+// Stage timings of the request being handled, reported next to daemon replies
+const timingStore = new AsyncLocalStorage();
+
 /**
- * Get contract instance
+ * Wait for a transaction's receipt, recording how long sending it took
+ * (signing, nonce, RPC) and how long it took to be mined
  */
-async function getContract() {
+async function confirm(tx) {
+    const timings = timingStore.getStore();
+    const sent = performance.now();
+    if (timings) {
+        timings.send_ms = sent - timings.started;
+    }
+    const receipt = await tx.wait();
+    if (timings) {
+        timings.wait_ms = performance.now() - sent;
+    }
+    return receipt;
+}
+
+/**
+ * Build contract instance
+ */
+async function initContract() {
     try {
         // Read contract address from deployment file if not in env
         let contractAddress = CONFIG.CONTRACT_ADDRESS;
@@ -51,9 +87,10 @@ async function getContract() {
             throw new Error('Contract address not found. Please deploy contract first.');
         }
 
-        // Setup provider and signer
+        // Setup provider and signer. The NonceManager hands out nonces locally so
+        // concurrent transactions from a long-lived daemon do not collide.
         const provider = new ethers.JsonRpcProvider(CONFIG.RPC_URL);
-        const wallet = new ethers.Wallet(CONFIG.PRIVATE_KEY, provider);
+        const wallet = new ethers.NonceManager(new ethers.Wallet(CONFIG.PRIVATE_KEY, provider));
         
         // Create contract instance
         const contract = new ethers.Contract(contractAddress, CONTRACT_ABI, wallet);
@@ -64,6 +101,20 @@ async function getContract() {
     }
 }
 
+/**
+ * Get contract instance (initialised once per process)
+ */
+async function getContract() {
+    if (!contractPromise) {
+        contractPromise = initContract().catch((error) => {
+            // Do not cache failures; the next call retries initialisation
+            contractPromise = null;
+            throw error;
+        });
+    }
+    return contractPromise;
+}
+
 /**
  * Create attendance session
  */
@@ -83,7 +134,7 @@ async function createSession(payload) {
         { gasLimit: CONFIG.GAS_LIMIT }
     );
     
-    const receipt = await tx.wait();
+    const receipt = await confirm(tx);
     
     return {
         success: true,
@@ -125,7 +176,7 @@ async function markAttendance(payload) {
         { gasLimit: CONFIG.GAS_LIMIT }
     );
     
-    const receipt = await tx.wait();
+    const receipt = await confirm(tx);
     
     return {
         success: true,
@@ -137,6 +188,110 @@ async function markAttendance(payload) {
     };
 }
 
+/**
+ * Mark attendance for many students of one session in a single transaction
+ */
+async function batchMarkAttendance(payload) {
+    const { sessionCode, studentIds, classId } = payload;
+    
+    if (!sessionCode || !classId || !Array.isArray(studentIds) || studentIds.length === 0) {
+        throw new Error('Missing required fields: sessionCode, studentIds, classId');
+    }
+
+    const { contract } = await getContract();
+    
+    // Check if session is valid
+    const isValid = await contract.isSessionValid(sessionCode);
+    if (!isValid) {
+        throw new Error('Session is invalid or expired');
+    }
+    
+    // Gas grows with the batch, so estimate it instead of using the fixed GAS_LIMIT
+    const estimated = await contract.batchMarkAttendance.estimateGas(sessionCode, studentIds, classId);
+    
+    // Students already marked on-chain are skipped by the contract itself
+    const tx = await contract.batchMarkAttendance(
+        sessionCode,
+        studentIds,
+        classId,
+        { gasLimit: (estimated * 12n) / 10n }
+    );
+    
+    const receipt = await confirm(tx);
+    
+    // AttendanceMarked is emitted per student recorded by this transaction; the
+    // indexed studentId is only available as its keccak256 topic
+    let marked = null;
+    const markedHashes = new Set();
+    for (const log of receipt.logs) {
+        try {
+            const parsed = contract.interface.parseLog(log);
+            if (parsed && parsed.name === 'AttendanceBatchMarked') {
+                marked = Number(parsed.args.marked);
+            } else if (parsed && parsed.name === 'AttendanceMarked') {
+                markedHashes.add(parsed.args.studentId.hash);
+            }
+        } catch (error) {
+            // not one of ours
+        }
+    }
+    
+    // A skipped student was either marked before (a retried batch) or is bound
+    // to another address, which markAttendance would have reverted on
+    const results = {};
+    for (const studentId of studentIds) {
+        if (markedHashes.has(ethers.id(studentId))) {
+            results[studentId] = 'marked';
+        } else {
+            results[studentId] = await contract.hasAttended(sessionCode, studentId) ? 'already_marked' : 'rejected';
+        }
+    }
+    
+    return {
+        success: true,
+        txHash: receipt.hash,
+        blockNumber: receipt.blockNumber,
+        gasUsed: receipt.gasUsed.toString(),
+        sessionCode,
+        count: studentIds.length,
+        marked,
+        results,
+        rejected: studentIds.filter((id) => results[id] === 'rejected'),
+        timestamp: Date.now()
+    };
+}
+
+/**
+ * Anchor the Merkle root of a session / time window of attendance records
+ */
+async function anchorMerkleRoot(payload) {
+    const { anchorId, root, leafCount } = payload;
+    
+    if (!anchorId || !root || !leafCount) {
+        throw new Error('Missing required fields: anchorId, root, leafCount');
+    }
+
+    const { contract } = await getContract();
+    
+    // The contract refuses to overwrite an existing anchorId
+    const tx = await contract.anchorMerkleRoot(anchorId, root, leafCount, {
+        gasLimit: CONFIG.GAS_LIMIT
+    });
+    
+    const receipt = await confirm(tx);
+    
+    return {
+        success: true,
+        txHash: receipt.hash,
+        blockNumber: receipt.blockNumber,
+        gasUsed: receipt.gasUsed.toString(),
+        anchorId,
+        root,
+        leafCount,
+        timestamp: Date.now()
+    };
+}
+
 /**
  * Check if session is valid
  */
@@ -257,7 +412,7 @@ async function authorizeTeacher(payload) {
         { gasLimit: CONFIG.GAS_LIMIT }
     );
     
-    const receipt = await tx.wait();
+    const receipt = await confirm(tx);
     
     return {
         success: true,
@@ -284,7 +439,7 @@ async function registerStudent(payload) {
         { gasLimit: CONFIG.GAS_LIMIT }
     );
     
-    const receipt = await tx.wait();
+    const receipt = await confirm(tx);
     
     return {
         success: true,
@@ -294,6 +449,74 @@ async function registerStudent(payload) {
     };
 }
 
+const ACTIONS = {
+    createSession,
+    markAttendance,
+    batchMarkAttendance,
+    anchorMerkleRoot,
+    isSessionValid,
+    hasAttended,
+    getAttendanceRecord,
+    getTotalRecords,
+    getRecordByIndex,
+    authorizeTeacher,
+    registerStudent
+};
+
+/**
+ * Dispatch a single action
+ */
+async function runAction(action, payload, timings = null) {
+    const handler = ACTIONS[action];
+    if (!handler) {
+        throw new Error(`Unknown action: ${action}`);
+    }
+    if (!timings) {
+        return handler(payload || {});
+    }
+    return timingStore.run(timings, () => handler(payload || {}));
+}
+
+function finishTimings(timings) {
+    const { started, ...stages } = timings;
+    return { run_ms: performance.now() - started, ...stages };
+}
+
+/**
+ * Daemon mode: serve newline-delimited JSON requests until stdin closes
+ */
+function serve() {
+    // stdout carries the protocol; keep stray logging out of it
+    console.log = console.error;
+
+    const write = (msg) => process.stdout.write(JSON.stringify(msg) + '\n');
+    const rl = readline.createInterface({ input: process.stdin, crlfDelay: Infinity });
+
+    rl.on('line', async (line) => {
+        if (!line.trim()) {
+            return;
+        }
+
+        let request;
+        try {
+            request = JSON.parse(line);
+        } catch (error) {
+            write({ id: null, ok: false, error: `Invalid request: ${error.message}` });
+            return;
+        }
+
+        const timings = { started: performance.now() };
+        try {
+            const result = await runAction(request.action, request.payload, timings);
+            write({ id: request.id, ok: true, result, timings: finishTimings(timings) });
+        } catch (error) {
+            write({ id: request.id, ok: false, error: error.message, timings: finishTimings(timings) });
+        }
+    });
+
+    rl.on('close', () => process.exit(0));
+}
+
 /**
  * Main execution
  */
@@ -302,45 +525,18 @@ async function main() {
         const args = process.argv.slice(2);
         
         if (args.length < 1) {
-            throw new Error('Usage: node eth_runner.js <action> <json_payload>');
+            throw new Error('Usage: node eth_runner.js <action> <json_payload> | --daemon');
+        }
+
+        if (args[0] === '--daemon') {
+            serve();
+            return;
         }
 
         const action = args[0];
         const payload = args[1] ? JSON.parse(args[1]) : {};
 
-        let result;
-
-        switch (action) {
-            case 'createSession':
-                result = await createSession(payload);
-                break;
-            case 'markAttendance':
-                result = await markAttendance(payload);
-                break;
-            case 'isSessionValid':
-                result = await isSessionValid(payload);
-                break;
-            case 'hasAttended':
-                result = await hasAttended(payload);
-                break;
-            case 'getAttendanceRecord':
-                result = await getAttendanceRecord(payload);
-                break;
-            case 'getTotalRecords':
-                result = await getTotalRecords();
-                break;
-            case 'getRecordByIndex':
-                result = await getRecordByIndex(payload);
-                break;
-            case 'authorizeTeacher':
-                result = await authorizeTeacher(payload);
-                break;
-            case 'registerStudent':
-                result = await registerStudent(payload);
-                break;
-            default:
-                throw new Error(`Unknown action: ${action}`);
-        }
+        const result = await runAction(action, payload);
 
         console.log(JSON.stringify(result));
         process.exit(0);
@@ -359,14 +555,4 @@ if (require.main === module) {
     main();
 }
 
-module.exports = {
-    createSession,
-    markAttendance,
-    isSessionValid,
-    hasAttended,
-    getAttendanceRecord,
-    getTotalRecords,
-    getRecordByIndex,
-    authorizeTeacher,
-    registerStudent
-};
+module.exports = ACTIONS;
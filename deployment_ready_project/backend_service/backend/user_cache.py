@@ -0,0 +1,151 @@
+# user_cache.py
+# Bounded TTL/LRU cache of authenticated users, with optional cross-worker invalidation over a capped collection.
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+logger = logging.getLogger(__name__)
+
+
+class UserCache:
+    """
+    Serialized, password-stripped user records keyed by JWT subject (email).
+
+    Entries expire after `ttl` seconds, which also bounds how stale another
+    worker's copy can be when no invalidation channel is configured. The
+    least recently used entry is dropped once `max_entries` is reached.
+    Callers get a copy, so request handlers can't mutate the cached record.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # subject -> (expires_at, user)
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, subject: str) -> Optional[dict]:
+        entry = self._entries.get(subject)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, user = entry
+        if expires_at <= time.monotonic():
+            del self._entries[subject]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(subject)
+        self.hits += 1
+        return dict(user)
+
+    def put(self, subject: str, user: dict):
+        user = {k: v for k, v in user.items() if k != "password"}
+        self._entries[subject] = (time.monotonic() + self.ttl, user)
+        self._entries.move_to_end(subject)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, subject: str):
+        if self._entries.pop(subject, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+class InvalidationChannel:
+    """
+    Broadcasts invalidations to every worker through a small capped collection
+    tailed with a TAILABLE_AWAIT cursor (works on a standalone mongod, unlike
+    change streams). Each worker applies every message, its own included.
+    """
+
+    def __init__(self, db, cache: UserCache, collection_name: str = "user_cache_invalidations",
+                 size_bytes: int = 1024 * 1024):
+        self.db = db
+        self.cache = cache
+        self.collection_name = collection_name
+        self.size_bytes = size_bytes
+        self.origin = str(uuid.uuid4())
+        self._task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.received = 0
+
+    @property
+    def collection(self):
+        return self.db[self.collection_name]
+
+    async def _ensure_collection(self):
+        try:
+            await self.db.create_collection(self.collection_name, capped=True, size=self.size_bytes)
+        except CollectionInvalid:
+            pass
+        # a tailable cursor on an empty capped collection dies immediately
+        if await self.collection.find_one() is None:
+            await self.collection.insert_one({"subject": None, "origin": self.origin})
+
+    async def publish(self, subject: str):
+        self.cache.invalidate(subject)
+        await self.collection.insert_one({"subject": subject, "origin": self.origin})
+        self.published += 1
+
+    async def _listen(self):
+        last = await self.collection.find_one(sort=[("$natural", -1)])
+        last_id = last["_id"] if last else None
+        while True:
+            try:
+                query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+                cursor = self.collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    async for msg in cursor:
+                        last_id = msg["_id"]
+                        if msg.get("subject") and msg.get("origin") != self.origin:
+                            self.received += 1
+                            self.cache.invalidate(msg["subject"])
+                    await asyncio.sleep(0.1)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # we may have missed messages; drop everything rather than serve stale users
+                logger.warning("User cache invalidation channel interrupted (%s); clearing cache", e)
+                self.cache.clear()
+            await asyncio.sleep(1.0)
+
+    async def start(self):
+        if self._task is None:
+            await self._ensure_collection()
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"published": self.published, "received": self.received, "listening": self._task is not None}
@@ -0,0 +1,14 @@
+import axios from 'axios';
+
+// Attendance listings are cursor-paginated: the cursor for the next page comes
+// back in the X-Next-Cursor header (absent on the last page).
+export async function fetchPage(url, cursor = null, limit = null) {
+  const params = {};
+  if (cursor) params.cursor = cursor;
+  if (limit) params.limit = limit;
+  const response = await axios.get(url, { params });
+  return {
+    items: response.data,
+    nextCursor: response.headers['x-next-cursor'] || null,
+  };
+}
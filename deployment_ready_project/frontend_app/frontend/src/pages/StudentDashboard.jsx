@@ -13,6 +13,7 @@ import { Textarea } from '../components/ui/textarea';
 import { toast } from 'sonner';
 import { QrCode, Users, BookOpen, TrendingUp, Clock, CheckCircle, AlertCircle, RefreshCw, LogOut, Edit2, Save, X, Copy, ExternalLink, Wallet, Camera } from 'lucide-react';
 import { useAuth, API } from '../context/AuthContext';
+import { fetchPage } from '../lib/pagination';
 import { useToast } from '../hooks/use-toast'; // Assuming this is the correct hook path
 
 // QR Scanner Component with Camera and Manual Input
@@ -170,7 +171,7 @@ const QRScanner = ({ onScan, onClose }) => {
 };
 
 // Attendance Graphs with Real Data Visualization
-const AttendanceGraphs = ({ attendance }) => {
+const AttendanceGraphs = ({ attendance, total }) => {
   if (!attendance || attendance.length === 0) {
     return (
       <div className="text-center py-8 text-gray-500">
@@ -245,7 +246,7 @@ const AttendanceGraphs = ({ attendance }) => {
       {/* Summary Stats */}
       <div className="grid grid-cols-3 gap-4 pt-4 border-t">
         <div className="text-center">
-          <div className="text-2xl font-bold text-blue-600">{attendance.length}</div>
+          <div className="text-2xl font-bold text-blue-600">{total ?? attendance.length}</div>
           <div className="text-xs text-gray-600">Total Sessions</div>
         </div>
         <div className="text-center">
@@ -843,6 +844,7 @@ const StudentDashboard = () => {
 
   const [stats, setStats] = useState({});
   const [attendance, setAttendance] = useState([]);
+  const [attendanceCursor, setAttendanceCursor] = useState(null);
   const [loading, setLoading] = useState(true);
   const [showQRScanner, setShowQRScanner] = useState(false);
   const [alertDialog, setAlertDialog] = useState({ show: false, title: '', message: '', type: 'error' });
@@ -850,13 +852,15 @@ const StudentDashboard = () => {
   const fetchData = useCallback(async () => {
     try {
       setLoading(true);
-      const [statsResponse, attendanceResponse] = await Promise.all([
+      const [statsResponse, attendancePage] = await Promise.all([
         axios.get(`${API}/dashboard/student-stats`),
-        axios.get(`${API}/attendance/history`)
+        // newest page only; older records are loaded on demand
+        fetchPage(`${API}/attendance/history`)
       ]);
       
       setStats(statsResponse.data);
-      setAttendance(attendanceResponse.data);
+      setAttendance(attendancePage.items);
+      setAttendanceCursor(attendancePage.nextCursor);
     } catch (error) {
       console.error('Data fetch error:', error);
       toast.error('Failed to load dashboard data');
@@ -869,6 +873,17 @@ const StudentDashboard = () => {
     fetchData();
   }, [fetchData]);
 
+  const loadMoreAttendance = async () => {
+    try {
+      const page = await fetchPage(`${API}/attendance/history`, attendanceCursor);
+      setAttendance((records) => records.concat(page.items));
+      setAttendanceCursor(page.nextCursor);
+    } catch (error) {
+      console.error('Attendance fetch error:', error);
+      toast.error('Failed to load attendance history');
+    }
+  };
+
   const markAttendance = async (qrContent) => {
     if (!qrContent || !qrContent.trim()) {
       toast.error('Invalid QR code content');
@@ -877,8 +892,9 @@ const StudentDashboard = () => {
 
     try {
       // Parse QR content to extract qr_id for duplicate check
+      // (signed codes append a fourth signature field, checked by the server)
       const parts = qrContent.split('|');
-      if (parts.length !== 3) {
+      if (parts.length !== 3 && parts.length !== 4) {
         toast.error('Invalid QR code format. Please scan a valid attendance QR code.');
         setShowQRScanner(false);
         return;
@@ -886,7 +902,8 @@ const StudentDashboard = () => {
 
       const [classId, qrId, timestamp] = parts;
 
-      // Client-side duplicate check
+      // Client-side duplicate check against the loaded records; the server
+      // answers status "duplicate" for anything older
       const isDuplicate = attendance.some(
         record => record.qr_code_id === qrId && record.class_id === classId
       );
@@ -910,9 +927,25 @@ const StudentDashboard = () => {
         return;
       }
 
-      // Mark attendance via API
-      const response = await axios.post(`${API}/attendance/mark`, { qr_content: qrContent });
-      
+      // Mark attendance via API; when the server is busy it answers 202 "retry"
+      // with Retry-After and the code to resend
+      let response = await axios.post(`${API}/attendance/mark`, { qr_content: qrContent });
+      for (let attempt = 0; response.status === 202 && response.data.status === 'retry' && attempt < 5; attempt++) {
+        const waitSeconds = response.data.retry_after || 1;
+        toast.info('Lots of scans right now', {
+          description: `Retrying in ${waitSeconds}s, keep this page open`
+        });
+        await new Promise((resolve) => setTimeout(resolve, waitSeconds * 1000));
+        response = await axios.post(`${API}/attendance/mark`, { qr_content: response.data.qr_content || qrContent });
+      }
+      if (response.data.status === 'retry') {
+        toast.error('Failed to mark attendance', {
+          description: 'The server is busy. Please scan the QR code again.'
+        });
+        setShowQRScanner(false);
+        return;
+      }
+
 	      if (response.data.status === 'duplicate') {
 	        toast.info('Attendance already marked for this session', {
 	          description: 'You have already scanned this QR code for this session.'
@@ -1053,7 +1086,7 @@ const StudentDashboard = () => {
                 <CardDescription>Visual summary of your attendance records</CardDescription>
               </CardHeader>
               <CardContent>
-                <AttendanceGraphs attendance={attendance} />
+                <AttendanceGraphs attendance={attendance} total={stats.total_attendance} />
               </CardContent>
             </Card>
 
@@ -1118,6 +1151,11 @@ const StudentDashboard = () => {
                     {attendance.map((record) => (
                       <AttendanceCard key={record.id} record={record} />
                     ))}
+                    {attendanceCursor && (
+                      <Button onClick={loadMoreAttendance} variant="outline" size="sm" className="w-full">
+                        Load more
+                      </Button>
+                    )}
                   </div>
                 )}
               </CardContent>
@@ -13,6 +13,7 @@ import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '.
 import { toast } from 'sonner';
 import { QrCode, Users, BookOpen, Shield, TrendingUp, Clock, CheckCircle, AlertCircle, RefreshCw, LogOut, Edit2, Save, X, Copy, ExternalLink, Key, Award, User, Mail, Wallet, Calendar, Building, Phone, Globe } from 'lucide-react';
 import { useAuth, API } from '../context/AuthContext';
+import { fetchPage } from '../lib/pagination';
 import { useToast } from '../hooks/use-toast'; // Assuming this is the correct hook path
 
 // Placeholder for QR Code Display
@@ -91,7 +92,7 @@ const QRCodeDisplay = ({ data }) => {
 };
 
 // Placeholder for ClassAttendanceViewer
-const ClassAttendanceViewer = ({ classId, className, attendance, onClose, API }) => {
+const ClassAttendanceViewer = ({ classId, className, attendance, hasMore, onLoadMore, onClose, API }) => {
   const handleExportCSV = () => {
     if (!API) {
       toast.error('API configuration missing. Cannot export CSV.');
@@ -166,6 +167,11 @@ const ClassAttendanceViewer = ({ classId, className, attendance, onClose, API })
             </Card>
           ))
         )}
+        {hasMore && (
+          <Button onClick={onLoadMore} variant="outline" size="sm" className="w-full">
+            Load more
+          </Button>
+        )}
       </div>
       <Button onClick={onClose} className="w-full">Close Viewer</Button>
     </div>
@@ -752,6 +758,7 @@ const TeacherDashboard = () => {
   const [selectedClassId, setSelectedClassId] = useState(null);
   const [selectedClassName, setSelectedClassName] = useState('');
   const [classAttendance, setClassAttendance] = useState([]);
+  const [classAttendanceCursor, setClassAttendanceCursor] = useState(null);
   const [showAttendanceViewer, setShowAttendanceViewer] = useState(false);
 
   const fetchData = useCallback(async () => {
@@ -774,6 +781,30 @@ const TeacherDashboard = () => {
     fetchData();
   }, [fetchData]);
 
+  // Rotating QR codes: fetch the next code when the current one rotates out
+  const qrSessionId = qrData?.qr_id;
+  const nextRotationAt = qrData?.next_rotation_at;
+  useEffect(() => {
+    if (!showQRModal || !qrSessionId || !nextRotationAt) return undefined;
+    const delay = Math.max(0, new Date(nextRotationAt).getTime() - Date.now());
+    const timer = setTimeout(async () => {
+      try {
+        const response = await axios.get(`${API}/attendance/qr/${qrSessionId}/current`, {
+          params: { format: 'png' }
+        });
+        setQrData(prev => (prev && prev.qr_id === qrSessionId ? { ...prev, ...response.data } : prev));
+      } catch (error) {
+        if (error.response?.status === 410) {
+          setQrData(prev => (prev ? { ...prev, next_rotation_at: null } : prev));
+        } else {
+          // try again shortly rather than leaving a stale code on screen
+          setQrData(prev => (prev ? { ...prev, next_rotation_at: new Date(Date.now() + 2000).toISOString() } : prev));
+        }
+      }
+    }, delay);
+    return () => clearTimeout(timer);
+  }, [showQRModal, qrSessionId, nextRotationAt]);
+
   const createClass = async (e) => {
     e.preventDefault();
     const formData = new FormData(e.target);
@@ -807,7 +838,8 @@ const generateQRCode = async (classId) => {
   
   try {
     const response = await axios.post(`${API}/attendance/generate-qr`, { 
-      class_id: classId 
+      class_id: classId,
+      format: 'png'
     });
 
     console.log("✅ QR generated successfully:", response?.data);
@@ -859,8 +891,9 @@ const handleQRModalClose = () => {
 
   const viewAttendance = async (classId, className) => {
     try {
-      const response = await axios.get(`${API}/attendance/class/${classId}`);
-      setClassAttendance(response.data);
+      const page = await fetchPage(`${API}/attendance/class/${classId}`);
+      setClassAttendance(page.items);
+      setClassAttendanceCursor(page.nextCursor);
       setSelectedClassId(classId);
       setSelectedClassName(className);
       setShowAttendanceViewer(true);
@@ -870,9 +903,21 @@ const handleQRModalClose = () => {
     }
   };
 
+  const loadMoreAttendance = async () => {
+    try {
+      const page = await fetchPage(`${API}/attendance/class/${selectedClassId}`, classAttendanceCursor);
+      setClassAttendance((records) => records.concat(page.items));
+      setClassAttendanceCursor(page.nextCursor);
+    } catch (error) {
+      console.error('Attendance fetch error:', error);
+      toast.error(error.response?.data?.detail || 'Failed to fetch attendance');
+    }
+  };
+
   const closeAttendanceViewer = () => {
     setShowAttendanceViewer(false);
     setClassAttendance([]);
+    setClassAttendanceCursor(null);
     setSelectedClassId(null);
     setSelectedClassName('');
   };
@@ -1112,7 +1157,9 @@ const handleQRModalClose = () => {
         <Alert>
           <Clock className="h-4 w-4" />
           <AlertDescription>
-            This QR code expires in 5 minutes. Generate a new one if needed.
+            {qrData.rotation_seconds
+              ? `This QR code changes every ${qrData.rotation_seconds} seconds; keep this window open while students scan.`
+              : 'This QR code expires in 5 minutes. Generate a new one if needed.'}
           </AlertDescription>
         </Alert>
         
@@ -1123,7 +1170,7 @@ const handleQRModalClose = () => {
             className="flex-1"
             onClick={() => {
               const sessionId = qrData.session_id || qrData.sessionId || qrData.qr_id;
-              const content = `${qrData.class_id}|${sessionId}|${qrData.expires_at}`;
+              const content = qrData.qr_content || `${qrData.class_id}|${sessionId}|${qrData.expires_at}`;
               navigator.clipboard.writeText(content);
               toast.success('QR content copied to clipboard!');
             }}
@@ -1178,6 +1225,8 @@ const handleQRModalClose = () => {
                     classId={selectedClassId}
                     className={selectedClassName}
                     attendance={classAttendance}
+                    hasMore={Boolean(classAttendanceCursor)}
+                    onLoadMore={loadMoreAttendance}
                     onClose={closeAttendanceViewer}
                     API={API} // Pass API to the component
                   />
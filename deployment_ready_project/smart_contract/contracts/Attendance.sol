@@ -16,6 +16,12 @@ contract Attendance {
         bool verified;          // Verification status
     }
     
+    struct MerkleAnchor {
+        bytes32 root;           // Merkle root over the attendance block hashes
+        uint256 leafCount;      // Number of attendance records under the root
+        uint256 timestamp;      // Block timestamp when anchored
+    }
+    
     struct AttendanceSession {
         string classId;
         address teacher;
@@ -42,9 +48,14 @@ contract Attendance {
     // Mapping from student ID to wallet address
     mapping(string => address) public studentAddresses;
     
+    // Mapping from anchor ID to anchored Merkle root (one per session / time window)
+    mapping(string => MerkleAnchor) public merkleAnchors;
+    
     // Events
     event SessionCreated(string indexed sessionCode, string indexed classId, address indexed teacher, uint256 expiryTime);
     event AttendanceMarked(string indexed sessionCode, string indexed studentId, address indexed studentAddress, uint256 timestamp);
+    event AttendanceBatchMarked(string indexed sessionCode, uint256 marked, uint256 skipped);
+    event MerkleRootAnchored(string indexed anchorId, bytes32 root, uint256 leafCount, uint256 timestamp);
     event TeacherAuthorized(address indexed teacher);
     event TeacherDeauthorized(address indexed teacher);
     event StudentRegistered(string indexed studentId, address indexed studentAddress);
@@ -153,13 +164,89 @@ contract Attendance {
         require(!sessions[sessionCode].studentsAttended[studentId], "Attendance already marked");
         
         // Get or register student address
+        address studentAddress = studentAddresses[studentId];
+        if (studentAddress != address(0)) {
+            require(studentAddress == msg.sender, "Not authorized for this student ID");
+        }
+        
+        _recordAttendance(sessionCode, studentId, classId);
+    }
+    
+    /**
+     * @dev Mark attendance for many students of one session in a single transaction.
+     *      Students that are already marked, empty or bound to another address are
+     *      skipped instead of reverting the whole batch, so a retried batch is safe.
+     * @param sessionCode The session code from QR
+     * @param studentIds The students' IDs
+     * @param classId The class ID (for validation)
+     */
+    function batchMarkAttendance(
+        string memory sessionCode,
+        string[] memory studentIds,
+        string memory classId
+    ) external validSession(sessionCode) {
+        require(studentIds.length > 0, "No students");
+        require(
+            keccak256(bytes(sessions[sessionCode].classId)) == keccak256(bytes(classId)),
+            "Class ID mismatch"
+        );
+        
+        uint256 marked = 0;
+        for (uint256 i = 0; i < studentIds.length; i++) {
+            string memory studentId = studentIds[i];
+            if (bytes(studentId).length == 0 || sessions[sessionCode].studentsAttended[studentId]) {
+                continue;
+            }
+            address studentAddress = studentAddresses[studentId];
+            if (studentAddress != address(0) && studentAddress != msg.sender) {
+                continue;
+            }
+            _recordAttendance(sessionCode, studentId, classId);
+            marked++;
+        }
+        
+        emit AttendanceBatchMarked(sessionCode, marked, studentIds.length - marked);
+    }
+    
+    /**
+     * @dev Anchor the Merkle root of many attendance records in one transaction.
+     *      Individual records are proven off-chain with an inclusion proof.
+     * @param anchorId Unique anchor identifier (set once, never overwritten)
+     * @param root Merkle root over the records' block hashes
+     * @param leafCount Number of records under the root
+     */
+    function anchorMerkleRoot(
+        string memory anchorId,
+        bytes32 root,
+        uint256 leafCount
+    ) external onlyAuthorizedTeacher {
+        require(bytes(anchorId).length > 0, "Invalid anchor ID");
+        require(root != bytes32(0), "Invalid root");
+        require(leafCount > 0, "No leaves");
+        require(merkleAnchors[anchorId].timestamp == 0, "Anchor already exists");
+        
+        merkleAnchors[anchorId] = MerkleAnchor({
+            root: root,
+            leafCount: leafCount,
+            timestamp: block.timestamp
+        });
+        
+        emit MerkleRootAnchored(anchorId, root, leafCount, block.timestamp);
+    }
+    
+    /**
+     * @dev Store an attendance record; callers have already validated the input
+     */
+    function _recordAttendance(
+        string memory sessionCode,
+        string memory studentId,
+        string memory classId
+    ) internal {
         address studentAddress = studentAddresses[studentId];
         if (studentAddress == address(0)) {
             studentAddress = msg.sender;
             studentAddresses[studentId] = msg.sender;
             emit StudentRegistered(studentId, msg.sender);
-        } else {
-            require(studentAddress == msg.sender, "Not authorized for this student ID");
         }
         
         // Mark attendance
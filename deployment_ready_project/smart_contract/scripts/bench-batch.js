@@ -0,0 +1,87 @@
+// scripts/bench-batch.js
+// Throughput of markAttendance vs batchMarkAttendance at 1, 10 and 100 marks per tx.
+//
+//   npx hardhat node
+//   npx hardhat run scripts/bench-batch.js --network localhost
+//
+// The contract is compiled first, so the numbers always come from the current
+// Attendance.sol, and Attendance.abi.json is rewritten from the fresh artifact
+// as deploy.js does. BENCH_MARKS (default 300) marks are committed for every
+// batch size; the script prints a table and writes bench-batch.json next to
+// deployment.json.
+const hre = require("hardhat");
+const fs = require("fs");
+const path = require("path");
+
+const TOTAL_MARKS = parseInt(process.env.BENCH_MARKS || "300", 10);
+const BATCH_SIZES = (process.env.BENCH_BATCH_SIZES || "1,10,100").split(",").map((n) => parseInt(n, 10));
+
+async function runBatchSize(attendance, batchSize) {
+  const sessionCode = `bench-${batchSize}-${Date.now()}`;
+  const classId = "bench-class";
+  await (await attendance.createSession(sessionCode, classId, 180)).wait();
+
+  const studentIds = Array.from({ length: TOTAL_MARKS }, (_, i) => `student-${batchSize}-${i}`);
+  let gasUsed = 0n;
+  let txCount = 0;
+
+  const started = process.hrtime.bigint();
+  for (let i = 0; i < studentIds.length; i += batchSize) {
+    const chunk = studentIds.slice(i, i + batchSize);
+    const tx = chunk.length === 1 && batchSize === 1
+      ? await attendance.markAttendance(sessionCode, chunk[0], classId)
+      : await attendance.batchMarkAttendance(sessionCode, chunk, classId);
+    const receipt = await tx.wait();
+    gasUsed += receipt.gasUsed;
+    txCount += 1;
+  }
+  const seconds = Number(process.hrtime.bigint() - started) / 1e9;
+
+  return {
+    batchSize,
+    marks: studentIds.length,
+    transactions: txCount,
+    seconds: Number(seconds.toFixed(3)),
+    marksPerSecond: Number((studentIds.length / seconds).toFixed(1)),
+    gasPerMark: Number(gasUsed / BigInt(studentIds.length)),
+    gasPerTx: Number(gasUsed / BigInt(txCount)),
+  };
+}
+
+async function main() {
+  await hre.run("compile");
+  const artifact = await hre.artifacts.readArtifact("Attendance");
+  fs.writeFileSync(path.join(__dirname, "..", "Attendance.abi.json"), JSON.stringify(artifact.abi, null, 2));
+
+  const Attendance = await hre.ethers.getContractFactory("Attendance");
+  const attendance = await Attendance.deploy();
+  await attendance.waitForDeployment();
+  console.log(`Deployed Attendance to ${await attendance.getAddress()} on ${hre.network.name}`);
+
+  const results = [];
+  for (const batchSize of BATCH_SIZES) {
+    const result = await runBatchSize(attendance, batchSize);
+    results.push(result);
+    console.log(
+      `batch=${String(batchSize).padStart(4)}  txs=${String(result.transactions).padStart(4)}  ` +
+      `${String(result.marksPerSecond).padStart(8)} marks/s  ` +
+      `${String(result.gasPerMark).padStart(8)} gas/mark  ${String(result.gasPerTx).padStart(9)} gas/tx`
+    );
+  }
+
+  const outPath = path.join(__dirname, "..", "bench-batch.json");
+  fs.writeFileSync(outPath, JSON.stringify({
+    network: hre.network.name,
+    solc: hre.config.solidity.compilers.map((c) => c.version),
+    marks: TOTAL_MARKS,
+    results,
+  }, null, 2));
+  console.log(`Results written to ${outPath}`);
+}
+
+main()
+  .then(() => process.exit(0))
+  .catch((error) => {
+    console.error(error && error.stack ? error.stack : error);
+    process.exit(1);
+  });